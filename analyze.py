@@ -0,0 +1,328 @@
+import argparse
+import glob
+import multiprocessing
+import os
+import sys
+import time
+from datetime import datetime, timedelta
+import cv2
+import numpy as np
+from config import OFFLINE_CONFIG, VIDEO_CONFIG
+from traffic_history import EPOCH, to_minute
+
+_worker = {}  # Perception state of a pool process, built once by init_worker
+
+def video_info(path):
+    """(frame count, fps) of a video file; the count is 0 if the container does not say"""
+    capture = cv2.VideoCapture(path)
+    try:
+        if not capture.isOpened():
+            return None
+        frame_count = max(int(capture.get(cv2.CAP_PROP_FRAME_COUNT)), 0)
+        fps = capture.get(cv2.CAP_PROP_FPS) or VIDEO_CONFIG['fps']
+        return frame_count, fps
+    finally:
+        capture.release()
+
+def plan_chunks(frame_count, fps, chunk_seconds=None):
+    """[start, end) frame ranges of about chunk_seconds each; one open-ended chunk if the length is unknown"""
+    if frame_count <= 0:
+        return [(0, None)]
+    size = max(int((chunk_seconds or OFFLINE_CONFIG['chunk_seconds']) * fps), 1)
+    return [(start, min(start + size, frame_count)) for start in range(0, frame_count, size)]
+
+def init_worker(batch_size, threads):
+    """Pool initializer: load the detector once per process, not once per chunk"""
+    # Each process runs its own detector; keep them from all claiming every core
+    os.environ.setdefault('OMP_NUM_THREADS', str(threads))
+    cv2.setNumThreads(1)
+    from perception import CameraPerception
+    from preprocess import FramePreprocessor
+    from regions import load_regions
+
+    perception = CameraPerception()
+    classes = perception.classes_of_interest
+    class_columns = np.full(max(classes) + 1, -1, dtype=np.int64)
+    class_columns[classes] = np.arange(len(classes))
+    _worker.update({
+        'perception': perception,
+        # The whole batch is held at once, plus the frame being decoded
+        'preprocessor': FramePreprocessor(pool_size=batch_size + 1),
+        'regions': load_regions(),
+        'class_columns': class_columns,
+        'batch_size': batch_size
+    })
+
+def analyze_chunk(task):
+    """Detect, track and count one chunk of a video in a pool process.
+
+    Reading starts warmup frames before the chunk so tracks (and their
+    crossings) carry over the boundary; nothing before the chunk start is
+    recorded. Per-frame detections are written to the video's output
+    directory; per-minute sums are returned to the parent.
+    """
+    try:
+        return _analyze_chunk(task)
+    except Exception as e:
+        print(f"Chunk analysis error ({task['path']} frame {task['start']}): {str(e)}")
+        return None
+
+def _analyze_chunk(task):
+    from crossings import CrossingCounter
+    from regions import ApproachMap
+
+    perception = _worker['perception']
+    preprocessor = _worker['preprocessor']
+    camera_index, start, end, fps, every = task['camera'], task['start'], task['end'], task['fps'], task['every']
+    perception.reset()
+    approach_map = ApproachMap(_worker['regions'].get(camera_index))
+    num_approaches = len(approach_map)
+    history_minutes = int((end - start) / fps / 60) + 3 if end is not None else None
+    counter = CrossingCounter(len(perception.classes_of_interest), history_minutes=history_minutes,
+                              max_cameras=1, max_approaches=max(num_approaches, 1))
+
+    minutes = {}  # Minute -> [vehicles per approach, queued per approach, sampled frames]
+    columns = {name: [] for name in ('frame', 'time', 'track_id', 'box', 'class_id', 'speed', 'approach',
+                                     'detected')}
+
+    def record(batch):
+        try:
+            observations = perception.observe([item[1] for item in batch], [camera_index] * len(batch),
+                                              [item[2] for item in batch], [item[3] for item in batch])
+        finally:
+            for item in batch:
+                item[4].release()  # Frames are not used after this; the pool outlives the chunk
+        for (index, _, timestamp, _, _), observation in zip(batch, observations):
+            if index < start:
+                continue  # Warmup
+            boxes = observation['boxes']
+            frame_size = observation['frame_size']
+            centers = (boxes[:, :2] + boxes[:, 2:]) / 2
+            previous_boxes = observation['previous_boxes']
+            if previous_boxes is not None:
+                counter.record(0, observation['track_ids'], (previous_boxes[:, :2] + previous_boxes[:, 2:]) / 2,
+                               centers, _worker['class_columns'][observation['class_ids']],
+                               approach_map.stop_lines(frame_size), approach_map.line_approaches, timestamp)
+            labels = approach_map.labels(centers, frame_size)
+            counts, queues = approach_map.approach_stats(labels, observation['speeds'])
+
+            sums = minutes.get(to_minute(timestamp))
+            if sums is None:
+                sums = minutes[to_minute(timestamp)] = [np.zeros(num_approaches), np.zeros(num_approaches), 0]
+            sums[0] += counts
+            sums[1] += queues
+            sums[2] += 1
+
+            count = len(boxes)
+            columns['frame'].append(np.full(count, index, dtype=np.int64))
+            columns['time'].append(np.full(count, (timestamp - EPOCH).total_seconds()))
+            columns['track_id'].append(observation['track_ids'].astype(np.int64))
+            columns['box'].append(boxes.astype(np.int32).reshape(-1, 4))
+            columns['class_id'].append(observation['class_ids'].astype(np.int16))
+            columns['speed'].append(np.asarray(observation['speeds'], dtype=np.float32))
+            columns['approach'].append(labels.astype(np.int8) - 1)  # -1 outside every approach
+            columns['detected'].append(np.full(count, observation['detected']))
+
+    capture = cv2.VideoCapture(task['path'])
+    index = max(start - int(OFFLINE_CONFIG['warmup_seconds'] * fps), 0)
+    if index:
+        capture.set(cv2.CAP_PROP_POS_FRAMES, index)
+    batch = []
+    try:
+        while end is None or index < end:
+            if index % every:
+                # Skipped frames are only demuxed, never decoded
+                if not capture.grab():
+                    break
+            else:
+                ret, frame = capture.read()
+                if not ret:
+                    break
+                # The pool holds a whole batch, so a buffer is always free here
+                display, image, transform, lease = preprocessor.process(frame)
+                batch.append((index, display, task['start_time'] + timedelta(seconds=index / fps),
+                              (image, transform), lease))
+                if len(batch) == _worker['batch_size']:
+                    record(batch)
+                    batch = []
+            index += 1
+        if batch:
+            record(batch)
+    finally:
+        capture.release()
+        for item in batch:
+            item[4].release()
+
+    path = os.path.join(task['output'], f"detections_{start:09d}.npz")
+    np.savez(path, **{
+        name: np.concatenate(parts) if parts else np.empty((0, 4) if name == 'box' else 0)
+        for name, parts in columns.items()
+    })
+
+    minute_ids = np.array(sorted(minutes), dtype=np.int64)
+    crossings = np.zeros((len(minute_ids), num_approaches, len(perception.classes_of_interest)), dtype=np.int32)
+    rows = {minute: row for row, minute in enumerate(minute_ids.tolist())}
+    for minute, counts in zip(*counter.minute_counts(0)):
+        if int(minute) in rows:
+            crossings[rows[int(minute)]] = counts[:num_approaches]
+    return {
+        'start': start,
+        'end': index,
+        'minute': minute_ids,
+        'vehicles': np.array([minutes[m][0] for m in minute_ids.tolist()]).reshape(-1, num_approaches),
+        'queued': np.array([minutes[m][1] for m in minute_ids.tolist()]).reshape(-1, num_approaches),
+        'samples': np.array([minutes[m][2] for m in minute_ids.tolist()], dtype=np.int32),
+        'crossings': crossings,
+        'approaches': approach_map.names,
+        'class_ids': perception.classes_of_interest,
+        'class_names': [perception.classes[class_id] for class_id in perception.classes_of_interest.tolist()]
+    }
+
+def merge_minutes(chunks, start_time, duration):
+    """Per-minute columns of a whole video from its chunk results.
+
+    vehicles and queued are means per sampled frame; crossings are summed.
+    A minute is complete if the video covers all of it, so its crossing
+    count is a full minute's flow.
+    """
+    chunks = [chunk for chunk in chunks if chunk is not None]
+    minute = np.unique(np.concatenate([chunk['minute'] for chunk in chunks]))
+    shape = chunks[0]['crossings'].shape[1:]
+    vehicles = np.zeros((len(minute), shape[0]))
+    queued = np.zeros((len(minute), shape[0]))
+    samples = np.zeros(len(minute), dtype=np.int32)
+    crossings = np.zeros((len(minute),) + shape, dtype=np.int32)
+    for chunk in chunks:
+        rows = np.searchsorted(minute, chunk['minute'])
+        np.add.at(vehicles, rows, chunk['vehicles'])
+        np.add.at(queued, rows, chunk['queued'])
+        np.add.at(samples, rows, chunk['samples'])
+        np.add.at(crossings, rows, chunk['crossings'])
+
+    begin = (start_time - EPOCH).total_seconds()
+    complete = (minute * 60 >= begin) & ((minute + 1) * 60 <= begin + duration)
+    frames = np.maximum(samples, 1)[:, None]
+    return {
+        'minute': minute,
+        'vehicles': (vehicles / frames).astype(np.float32),
+        'queued': (queued / frames).astype(np.float32),
+        'samples': samples,
+        'crossings': crossings,
+        'complete': complete,
+        'approaches': np.array(chunks[0]['approaches']),
+        'class_ids': np.asarray(chunks[0]['class_ids']),
+        'class_names': np.array(chunks[0]['class_names'])
+    }
+
+def load_detections(directory):
+    """All per-frame detection parts of one analyzed video concatenated, in frame order"""
+    parts = [dict(np.load(path)) for path in sorted(glob.glob(os.path.join(directory, "detections_*.npz")))]
+    if not parts:
+        return {}
+    return {name: np.concatenate([part[name] for part in parts]) for name in parts[0]}
+
+def backfill_predictor(videos):
+    """Add the complete minutes of analyzed videos to the predictor's history and retrain it.
+
+    Uses the same samples the live engine produces: per direction the
+    minute's stop-line crossings, with the mean queue as congestion level.
+    """
+    from traffic_predictor import TrafficPredictor
+    from traffic_signal import DIRECTION_GROUPS, expand_groups
+
+    predictor = TrafficPredictor()
+    rows = sorted((minute, data['approaches'].tolist(), data['crossings'][row].sum(axis=1), data['queued'][row])
+                  for data in videos
+                  for row, minute in enumerate(data['minute'].tolist()) if data['complete'][row])
+    for minute, names, crossings, queued in rows:
+        flows = expand_groups(dict(zip(names, crossings.tolist())))
+        queues = expand_groups(dict(zip(names, queued.tolist())))
+        for direction, approaches in DIRECTION_GROUPS.items():
+            predictor.add_data_point(EPOCH + timedelta(minutes=minute),
+                                     sum(flows.get(approach, 0) for approach in approaches),
+                                     sum(queues.get(approach, 0) for approach in approaches),
+                                     direction)
+    if predictor.train_model():
+        print(f"Predictor retrained on {len(rows)} backfilled minute bins")
+    else:
+        print(f"Predictor not retrained: {len(rows)} complete minute bins are not enough")
+
+def main():
+    parser = argparse.ArgumentParser(description='Analyze recorded video files as fast as the CPU allows')
+    parser.add_argument('videos', nargs='+', help='Video files; file i is treated as camera i')
+    parser.add_argument('--output', default=OFFLINE_CONFIG['output_dir'],
+                        help='Directory for the per-video NPZ output')
+    parser.add_argument('--cameras', type=int, nargs='+',
+                        help='Camera index of each video, for its approach regions and calibration')
+    parser.add_argument('--start', nargs='+', type=datetime.fromisoformat,
+                        help='Wall-clock start of each video (default: file modification time minus its length)')
+    parser.add_argument('--every', type=int, default=1, help='Analyze every Nth frame')
+    parser.add_argument('--workers', type=int, default=os.cpu_count(), help='Pool processes')
+    parser.add_argument('--chunk-seconds', type=float, default=OFFLINE_CONFIG['chunk_seconds'],
+                        help='Video seconds per pool task')
+    parser.add_argument('--backfill', action='store_true',
+                        help='Add the per-minute counts to the traffic predictor and retrain it')
+    args = parser.parse_args()
+
+    cameras = args.cameras or list(range(len(args.videos)))
+    if len(cameras) != len(args.videos) or (args.start and len(args.start) != len(args.videos)):
+        parser.error('--cameras and --start need one value per video')
+
+    tasks = []
+    videos = {}
+    for i, path in enumerate(args.videos):
+        info = video_info(path)
+        if info is None:
+            print(f"Could not open video file {path}")
+            continue
+        frame_count, fps = info
+        duration = frame_count / fps
+        start_time = args.start[i] if args.start else (
+            datetime.fromtimestamp(os.path.getmtime(path)) - timedelta(seconds=duration))
+        output = os.path.join(args.output, os.path.splitext(os.path.basename(path))[0])
+        os.makedirs(output, exist_ok=True)
+        chunks = plan_chunks(frame_count, fps, args.chunk_seconds)
+        videos[path] = {'output': output, 'start_time': start_time, 'duration': duration,
+                        'pending': len(chunks), 'results': [], 'failed': False}
+        tasks += [{'path': path, 'camera': cameras[i], 'start': start, 'end': end, 'fps': fps,
+                   'every': max(args.every, 1), 'start_time': start_time, 'output': output}
+                  for start, end in chunks]
+    if not tasks:
+        return 1
+
+    workers = max(1, min(args.workers, len(tasks)))
+    threads = max(1, (os.cpu_count() or 1) // workers)
+    context = multiprocessing.get_context('spawn')
+    finished = []
+    started = time.monotonic()
+    frames = 0
+    with context.Pool(workers, initializer=init_worker, initargs=(OFFLINE_CONFIG['batch_size'], threads)) as pool:
+        for task, result in zip(tasks, pool.imap(analyze_chunk, tasks)):
+            video = videos[task['path']]
+            video['pending'] -= 1
+            if result is None:
+                video['failed'] = True
+            else:
+                video['results'].append(result)
+                frames += result['end'] - result['start']
+            elapsed = time.monotonic() - started
+            print(f"{task['path']} frames {task['start']}-{result['end'] if result else task['end']} done, "
+                  f"{frames / max(elapsed, 1e-6):.0f} video frames/s")
+            if video['pending'] or not video['results']:
+                continue
+            duration = video['duration'] or max(result['end'] for result in video['results']) / task['fps']
+            data = merge_minutes(video['results'], video['start_time'], duration)
+            np.savez(os.path.join(video['output'], 'minutes.npz'), source=task['path'],
+                     start=video['start_time'].isoformat(), **data)
+            video['results'] = []
+            if video['failed']:
+                print(f"{task['path']} has failed chunks; its minutes are not used for backfilling")
+            else:
+                finished.append(data)
+
+    if args.backfill and finished:
+        backfill_predictor(finished)
+    return 0 if len(finished) == len(videos) else 1
+
+if __name__ == "__main__":
+    sys.exit(main())
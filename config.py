@@ -1,7 +1,13 @@
 YOLO_CONFIG = {
     'model_path': 'yolov8n.pt',
+    'backend': 'ultralytics',  # 'ultralytics' (PyTorch), 'onnx' (ONNX Runtime) or 'openvino'; see detectors.py
+    'input_size': 640,  # Fixed square input of exported models
+    'int8': False,  # Quantize exported models to INT8
+    'int8_data': 'coco8.yaml',  # Calibration dataset for OpenVINO INT8 export
+    'iou_threshold': 0.45,  # NMS overlap for exported models
     'conf_threshold': 0.5,
-    'classes_of_interest': [2, 3, 5, 7]  # car, motorcycle, bus, truck
+    'classes_of_interest': [2, 3, 5, 7],  # car, motorcycle, bus, truck
+    'batch_inference': True  # One YOLO call for all camera frames per tick
 }
 
 UI_CONFIG = {
@@ -15,3 +21,121 @@ VIDEO_CONFIG = {
     'fps': 30,
     'resolution': (1280, 720)
 }
+
+PIPELINE_CONFIG = {
+    'queue_size': 2,  # Frames per camera buffered between stages; older frames are dropped
+    'display_size': (400, 300),  # Frames are scaled to fit the video labels
+    'capture_processes': False,  # Decode video files and streams in child processes via shared memory
+    'ring_slots': 8,  # Shared frame slots per camera; must outlast a detector pass
+    'max_frame_age': 0.1,  # Seconds an untaken live frame may wait before a newer one is decoded
+    'reconnect_backoff': 1.0,  # Seconds before reopening a dropped stream; doubles per failure
+    'max_reconnect_backoff': 30.0
+}
+
+CAMERA_CONFIG = {
+    'num_cameras': 4,  # Camera feeds; camera i watches intersection i+1
+    'grid_columns': 2,  # Video tiles per row in the window
+    'worker_processes': False,  # Decode and detect in supervised worker processes instead of threads
+    'cameras_per_worker': 1,  # Cameras sharing one worker process (and its detector batch)
+    'startup_timeout': 60.0,  # Seconds a new worker may take to load its detector
+    'heartbeat_timeout': 10.0,  # Seconds of silence before a worker is considered hung
+    'max_restarts': 5,  # Restarts per worker before it is given up
+    'restart_backoff': 2.0  # Seconds before the first restart; doubles on each one
+}
+
+TRACKER_CONFIG = {
+    'iou_threshold': 0.3,  # Minimum IoU between a detection and a predicted track box
+    'max_age': 15,  # Frames a track may go unmatched before it is dropped
+    'velocity_smoothing': 0.7  # Weight of the previous velocity estimate
+}
+
+SPEED_CONFIG = {
+    'history_length': 30,  # Samples kept per track in the ring buffer
+    'max_tracks': 1024,  # Preallocated track slots; least recently seen is reused when full
+    'track_timeout': 5.0,  # Seconds without a sighting before a track is evicted
+    'smoothing': 'least_squares',  # None for frame-to-frame speed, 'least_squares' for a line fit
+    'smoothing_window': 5  # Samples used by the least-squares fit
+}
+
+CALIBRATION_CONFIG = {
+    'path': 'calibration.json',  # Per-camera ground-plane homographies; see calibration.example.json
+    'image_size': (1280, 720)  # Frame size the image points refer to when an entry omits it
+}
+
+PREDICTOR_CONFIG = {
+    'retrain_every': 100,  # Retrain after this many new history samples
+    'min_training_bins': 10,  # Complete minute bins needed before the first fit
+    'model_type': 'warm_start_forest',  # 'random_forest' refits from scratch, 'warm_start_forest' adds trees
+    'n_jobs': -1,  # Cores used for fitting and prediction
+    'trees_per_update': 10,  # Trees grown on new samples per incremental retrain
+    'max_trees': 200  # Oldest trees are retired beyond this
+}
+
+HISTORY_CONFIG = {
+    'capacity': 20160,  # Minute bins kept in memory (one week for two directions)
+    'archive_dir': 'history',  # Older bins are written here as NPZ files; '' disables archiving
+    'late_minutes': 2  # Bins stay open this long after the newest minute so lagging cameras still land in them
+}
+
+SIMULATION_CONFIG = {
+    'saturation_headway': 2.0,  # Seconds between departures from a discharging queue
+    'observe_interval': 2.0  # Seconds between simulated camera counts fed to the controller
+}
+
+SIGNAL_POLICY_CONFIG = {
+    'policy': 'density',  # 'density', 'webster', 'max_pressure' or 'q_learning'
+    'saturation_flow': 0.5,  # Vehicles per second a green phase discharges (Webster)
+    'lost_time': 4.0,  # Seconds lost per phase change, yellow included (Webster)
+    'max_flow_ratio': 0.9,  # Cap on the summed flow ratios so the cycle stays finite (Webster)
+    'max_cycle': 180,  # Longest Webster cycle in seconds
+    'pressure_margin': 2,  # Extra vehicles a competing phase needs to end green early (max-pressure)
+    'q_table_path': 'signal_q_table.npz',  # Trained table for the q_learning policy
+    'queue_bins': (2, 5, 10, 20),  # Queue length bin edges of the Q-learning state
+    'duration_levels': 5  # Green durations the Q-learning policy chooses between
+}
+
+PHASE_PLAN_CONFIG = {
+    'path': 'phase_plan.json'  # Signal heads and phases per cycle; see phase_plan.example.json. Default is NS/EW
+}
+
+CORRIDOR_CONFIG = {
+    'path': 'corridor.json',  # Coordinated roads; see corridor.example.json
+    'cycle': None,  # Common cycle in seconds; None uses the phase plan's base cycle
+    'design_speed': 50,  # km/h assumed on a link before speeds are measured
+    'min_speed': 15,  # Measured link speeds are clipped to this range (km/h)
+    'max_speed': 80,
+    'speed_smoothing': 0.8,  # Weight of the previous link speed estimate
+    'inbound_weight': 1.0,  # Value of inbound bandwidth relative to outbound; 0 plans a one-way wave
+    'reoptimize_threshold': 0.05,  # Re-plan once a travel time drifts by this fraction of the cycle
+    'resolution': 1.0,  # Seconds per offset step
+    'max_sweeps': 10,  # Coordinate-descent passes per optimisation
+    'update_interval': 30.0  # Seconds between speed updates from the engine
+}
+
+REGION_CONFIG = {
+    'path': 'regions.json',  # Per-camera approach polygons; see regions.example.json. Default is NS/EW halves
+    'image_size': (1280, 720),  # Frame size the polygon points refer to when an entry omits it
+    'queue_speed': 5.0  # Vehicles slower than this (km/h) count as queued at the signal
+}
+
+OFFLINE_CONFIG = {
+    'output_dir': 'analysis',  # analyze.py writes one directory of NPZ files per video here
+    'chunk_seconds': 300,  # Video seconds per pool task
+    'warmup_seconds': 2.0,  # Video read before each chunk to establish tracks; nothing in it is recorded
+    'batch_size': 8  # Consecutive frames per detector call
+}
+
+CROSSING_CONFIG = {
+    'history_minutes': 1440,  # Per-minute crossing bins kept in memory
+    'max_cameras': 16,
+    'max_approaches': 8,  # Stop lines per camera
+    'id_slots': 1024  # Hashed track ids remembered per line to count each vehicle once
+}
+
+MOTION_CONFIG = {
+    'enabled': True,  # Skip YOLO on frames where nothing moved; the tracker predicts boxes instead
+    'width': 160,  # Frames are differenced at this width (height keeps the aspect ratio)
+    'pixel_threshold': 25,  # Gray-level change that marks a pixel as changed
+    'motion_fraction': 0.005,  # Share of changed pixels that triggers detection
+    'max_skip': 5  # Detect at least every max_skip + 1 frames regardless of motion
+}
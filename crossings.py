@@ -0,0 +1,138 @@
+import threading
+import numpy as np
+from config import CROSSING_CONFIG
+from traffic_history import to_minute
+
+def segment_crossings(starts, ends, lines):
+    """(N, L) mask of which movements starts->ends cross which (L, 2, 2) line segments.
+
+    A movement that ends exactly on a line counts; one that starts on it
+    does not, so a vehicle resting on the line is counted once.
+    """
+    if len(starts) == 0 or len(lines) == 0:
+        return np.zeros((len(starts), len(lines)), dtype=bool)
+    d = (ends - starts)[:, None, :]
+    a = lines[None, :, 0, :]
+    e = (lines[:, 1, :] - lines[:, 0, :])[None, :, :]
+    offset = a - starts[:, None, :]
+    denom = d[..., 0] * e[..., 1] - d[..., 1] * e[..., 0]
+    safe = np.where(denom == 0, 1.0, denom)
+    t = (offset[..., 0] * e[..., 1] - offset[..., 1] * e[..., 0]) / safe
+    u = (offset[..., 0] * d[..., 1] - offset[..., 1] * d[..., 0]) / safe
+    return (denom != 0) & (t > 0) & (t <= 1) & (u >= 0) & (u <= 1)
+
+class CrossingCounter:
+    """Stop-line crossings per camera, approach and vehicle class in per-minute bins.
+
+    Counts live in one fixed (minutes, cameras, approaches, classes) int32
+    ring indexed by wall-clock minute. A track is counted at most once per
+    line: the last track id counted on each line is remembered in a small
+    hashed table, so jitter back and forth over the line is ignored.
+    Minutes in which a camera delivered no frames are marked unobserved and
+    never reported as zero flow.
+    """
+    def __init__(self, num_classes, history_minutes=None, max_cameras=None, max_approaches=None, id_slots=None):
+        self.history_minutes = history_minutes or CROSSING_CONFIG['history_minutes']
+        self.max_cameras = max_cameras or CROSSING_CONFIG['max_cameras']
+        self.max_approaches = max_approaches or CROSSING_CONFIG['max_approaches']
+        self.id_slots = id_slots or CROSSING_CONFIG['id_slots']
+        self.num_classes = num_classes
+
+        self.counts = np.zeros((self.history_minutes, self.max_cameras, self.max_approaches, num_classes),
+                               dtype=np.int32)
+        self.slot_minutes = np.full(self.history_minutes, -1, dtype=np.int64)
+        self.observed = np.zeros((self.history_minutes, self.max_cameras), dtype=bool)
+        self.counted = np.full((self.max_cameras, self.max_approaches, self.id_slots), -1, dtype=np.int64)
+        self.latest_minute = np.full(self.max_cameras, -1, dtype=np.int64)
+        self.reported_minute = np.full(self.max_cameras, -1, dtype=np.int64)
+        self.totals = np.zeros((self.max_cameras, num_classes), dtype=np.int64)
+        self.lock = threading.Lock()
+
+    def _slot(self, minute):
+        slot = minute % self.history_minutes
+        if self.slot_minutes[slot] != minute:
+            self.counts[slot] = 0
+            self.observed[slot] = False
+            self.slot_minutes[slot] = minute
+        return slot
+
+    def _observe(self, camera_index, minute):
+        slot = self._slot(minute)
+        self.observed[slot, camera_index] = True
+        if self.reported_minute[camera_index] < 0:
+            self.reported_minute[camera_index] = minute - 1
+        self.latest_minute[camera_index] = max(self.latest_minute[camera_index], minute)
+        return slot
+
+    def observe(self, camera_index, timestamp):
+        """Mark that a camera delivered a frame, for frames whose crossings are not recorded"""
+        with self.lock:
+            self._observe(camera_index, to_minute(timestamp))
+
+    def record(self, camera_index, track_ids, previous_centers, centers, class_indices, lines,
+               line_approaches, timestamp):
+        """Count tracks whose center crossed a stop line since the previous frame.
+
+        lines is (L, 2, 2) in frame pixels and line_approaches gives the
+        approach index of each line. Returns the number of new crossings.
+        """
+        minute = to_minute(timestamp)
+        track_ids = np.asarray(track_ids, dtype=np.int64)
+        with self.lock:
+            slot = self._observe(camera_index, minute)
+
+            rows, line_indices = np.nonzero(segment_crossings(previous_centers, centers, lines))
+            if len(rows) == 0:
+                return 0
+            ids = track_ids[rows]
+            approaches = line_approaches[line_indices]
+            hashed = ids % self.id_slots
+            new = self.counted[camera_index, approaches, hashed] != ids
+            self.counted[camera_index, approaches[new], hashed[new]] = ids[new]
+            np.add.at(self.counts[slot, camera_index], (approaches[new], class_indices[rows[new]]), 1)
+            np.add.at(self.totals[camera_index], class_indices[rows[new]], 1)
+            return int(new.sum())
+
+    def closed_minutes(self, camera_index):
+        """(minute, per-approach counts) for every complete, observed minute not returned before.
+
+        Minutes the camera delivered no frames in (outages, stalls) are skipped.
+        """
+        with self.lock:
+            latest = self.latest_minute[camera_index]
+            first = max(self.reported_minute[camera_index] + 1, latest - self.history_minutes + 1)
+            closed = []
+            for minute in range(first, latest):
+                slot = minute % self.history_minutes
+                if self.slot_minutes[slot] == minute and self.observed[slot, camera_index]:
+                    closed.append((minute, self.counts[slot, camera_index].sum(axis=1)))
+            if latest > self.reported_minute[camera_index] + 1:
+                self.reported_minute[camera_index] = latest - 1
+            return closed
+
+    def minute_counts(self, camera_index):
+        """Minutes still held for a camera, oldest first, and their (minutes, approaches, classes) counts"""
+        with self.lock:
+            slots = np.flatnonzero(self.slot_minutes >= 0)
+            slots = slots[np.argsort(self.slot_minutes[slots])]
+            return self.slot_minutes[slots].copy(), self.counts[slots, camera_index].copy()
+
+    def window(self, minutes, end_minute=None):
+        """Counts summed over the last `minutes` complete minutes: (cameras, approaches, classes)"""
+        with self.lock:
+            end_minute = int(self.latest_minute.max()) if end_minute is None else end_minute
+            wanted = (self.slot_minutes >= end_minute - minutes) & (self.slot_minutes < end_minute)
+            return self.counts[wanted].sum(axis=0)
+
+    def flow_rates(self, minutes=5, end_minute=None):
+        """Vehicles per minute crossing each (camera, approach) stop line"""
+        return self.window(minutes, end_minute).sum(axis=2) / minutes
+
+    def class_totals(self):
+        """Crossings per class since the counter was created or reset"""
+        with self.lock:
+            return self.totals.sum(axis=0)
+
+    def reset_totals(self):
+        with self.lock:
+            self.totals[:] = 0
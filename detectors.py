@@ -0,0 +1,211 @@
+import ast
+import os
+import cv2
+import numpy as np
+from config import YOLO_CONFIG
+
+class Detector:
+    """Vehicle detector backend.
+
+    detect() takes a list of frames and returns one (N, 6) float32 array per
+    frame of [x1, y1, x2, y2, confidence, class id] in frame pixels. names
+    maps class ids to class names. Frames are passed in the channel order
+    ultralytics expects for NumPy images (BGR).
+    """
+    names = {}
+
+    def detect(self, frames):
+        raise NotImplementedError
+
+class UltralyticsDetector(Detector):
+    """PyTorch model run through the ultralytics API"""
+    def __init__(self, model_path=None):
+        from ultralytics import YOLO
+        self.model = YOLO(model_path or YOLO_CONFIG['model_path'])
+        self.names = self.model.names
+        self.input_size = YOLO_CONFIG['input_size']
+
+    def detect(self, frames):
+        # Ultralytics accepts a list of images and returns one result per image
+        return [results.boxes.data.cpu().numpy().astype(np.float32)
+                for results in self.model(list(frames), imgsz=self.input_size)]
+
+class ExportedDetector(Detector):
+    """Exported YOLOv8 graph with letterboxing, decoding and NMS done in NumPy/OpenCV.
+
+    The graph takes a fixed (batch, 3, size, size) RGB tensor in [0, 1] and
+    returns (batch, 4 + classes, anchors) rows of center box and class
+    scores. Frames are letterboxed into a preallocated input buffer; if the
+    graph has a fixed batch size, frames are run in chunks of that size.
+    Only classes_of_interest above conf_threshold survive decoding, so
+    NMS sees few boxes.
+    """
+    def __init__(self, input_shape, names, conf_threshold=None, iou_threshold=None, classes=None):
+        batch, _, height, width = input_shape
+        self.batch_size = batch if isinstance(batch, int) and batch > 0 else None
+        self.input_size = (int(width), int(height))
+        self.conf_threshold = YOLO_CONFIG['conf_threshold'] if conf_threshold is None else conf_threshold
+        self.iou_threshold = YOLO_CONFIG['iou_threshold'] if iou_threshold is None else iou_threshold
+        self.classes = np.asarray(YOLO_CONFIG['classes_of_interest'] if classes is None else classes,
+                                  dtype=np.int64)
+        self.names = names or {int(class_id): str(class_id) for class_id in self.classes}
+        self.buffer = np.empty((self.batch_size or 1, 3, height, width), dtype=np.float32)
+        self.canvas = np.full((height, width, 3), 114, dtype=np.uint8)
+
+    def run(self, batch):
+        """Raw graph output for an input batch"""
+        raise NotImplementedError
+
+    def letterbox(self, frame, out):
+        """Scale frame into out (3, h, w) keeping its aspect ratio; returns (scale, pad_x, pad_y)"""
+        width, height = self.input_size
+        scale = min(width / frame.shape[1], height / frame.shape[0])
+        new_w, new_h = int(round(frame.shape[1] * scale)), int(round(frame.shape[0] * scale))
+        pad_x, pad_y = (width - new_w) // 2, (height - new_h) // 2
+        if frame.shape[:2] == (height, width):
+            canvas = frame  # Already letterboxed by the capture preprocessor
+        else:
+            canvas = self.canvas
+            canvas[:] = 114
+            canvas[pad_y:pad_y + new_h, pad_x:pad_x + new_w] = cv2.resize(
+                frame, (new_w, new_h), interpolation=cv2.INTER_LINEAR)
+        # BGR HWC uint8 -> RGB CHW float in [0, 1]
+        np.multiply(canvas[:, :, ::-1].transpose(2, 0, 1), 1 / 255.0, out=out, casting='unsafe')
+        return scale, pad_x, pad_y
+
+    def decode(self, output, frame_shape, scale, pad_x, pad_y):
+        """Detections of one frame from its (4 + classes, anchors) output"""
+        scores = output[4 + self.classes]
+        best = scores.argmax(axis=0)
+        confidence = scores[best, np.arange(scores.shape[1])]
+        keep = np.flatnonzero(confidence > self.conf_threshold)
+        if len(keep) == 0:
+            return np.empty((0, 6), dtype=np.float32)
+
+        cx, cy, w, h = output[:4, keep]
+        boxes = np.stack([cx - w / 2, cy - h / 2, cx + w / 2, cy + h / 2], axis=1)
+        confidence = confidence[keep]
+        class_ids = self.classes[best[keep]]
+
+        # Offsetting boxes by class keeps NMS from suppressing across classes
+        nms_boxes = boxes + class_ids[:, None] * float(max(self.input_size) + 1)
+        xywh = np.concatenate([nms_boxes[:, :2], nms_boxes[:, 2:] - nms_boxes[:, :2]], axis=1)
+        selected = np.asarray(cv2.dnn.NMSBoxes(xywh.tolist(), confidence.tolist(), self.conf_threshold,
+                                               self.iou_threshold), dtype=np.int64).reshape(-1)
+
+        boxes = (boxes[selected] - [pad_x, pad_y, pad_x, pad_y]) / scale
+        boxes[:, [0, 2]] = boxes[:, [0, 2]].clip(0, frame_shape[1])
+        boxes[:, [1, 3]] = boxes[:, [1, 3]].clip(0, frame_shape[0])
+        return np.concatenate([boxes, confidence[selected, None], class_ids[selected, None]],
+                              axis=1).astype(np.float32)
+
+    def detect(self, frames):
+        frames = list(frames)
+        chunk = self.batch_size or max(len(frames), 1)
+        if len(self.buffer) < chunk:
+            self.buffer = np.empty((chunk,) + self.buffer.shape[1:], dtype=np.float32)
+
+        detections = []
+        for start in range(0, len(frames), chunk):
+            group = frames[start:start + chunk]
+            batch = self.buffer[:chunk if self.batch_size else len(group)]
+            transforms = [self.letterbox(frame, batch[i]) for i, frame in enumerate(group)]
+            outputs = self.run(batch)
+            for i, frame in enumerate(group):
+                detections.append(self.decode(outputs[i], frame.shape, *transforms[i]))
+        return detections
+
+class OnnxDetector(ExportedDetector):
+    """ONNX Runtime on the CPU"""
+    def __init__(self, path, **kwargs):
+        import onnxruntime as ort
+        self.session = ort.InferenceSession(path, providers=['CPUExecutionProvider'])
+        model_input = self.session.get_inputs()[0]
+        self.input_name = model_input.name
+        names = self.session.get_modelmeta().custom_metadata_map.get('names')
+        super().__init__(model_input.shape, parse_names(names), **kwargs)
+
+    def run(self, batch):
+        return self.session.run(None, {self.input_name: batch})[0]
+
+class OpenVinoDetector(ExportedDetector):
+    """OpenVINO on the CPU, from an exported model directory"""
+    def __init__(self, path, **kwargs):
+        try:
+            from openvino import Core
+        except ImportError:
+            from openvino.runtime import Core
+        xml = next(os.path.join(path, name) for name in os.listdir(path) if name.endswith('.xml'))
+        core = Core()
+        self.model = core.compile_model(core.read_model(xml), 'CPU', {'PERFORMANCE_HINT': 'LATENCY'})
+        self.output = self.model.output(0)
+        shape = [dim.get_length() if dim.is_static else None for dim in self.model.input(0).get_partial_shape()]
+        super().__init__(shape, read_metadata_names(path), **kwargs)
+
+    def run(self, batch):
+        return self.model(batch)[self.output]
+
+def parse_names(names):
+    """Class names from the str(dict) ultralytics stores in exported models"""
+    if not names:
+        return {}
+    try:
+        return {int(k): v for k, v in ast.literal_eval(names).items()}
+    except (ValueError, SyntaxError) as e:
+        print(f"Class name parsing error: {str(e)}")
+        return {}
+
+def read_metadata_names(path):
+    metadata = os.path.join(path, 'metadata.yaml')
+    if not os.path.exists(metadata):
+        return {}
+    import yaml
+    with open(metadata) as f:
+        return {int(k): v for k, v in (yaml.safe_load(f) or {}).get('names', {}).items()}
+
+def export_model(backend, model_path=None, input_size=None, int8=None):
+    """Exported model for the backend, created from the .pt file on first use.
+
+    Exporting needs ultralytics (and torch) once; afterwards the exported
+    file loads without them. INT8 for OpenVINO is post-training quantization
+    calibrated on int8_data; for ONNX it is dynamic (weight-only) quantization.
+    """
+    model_path = model_path or YOLO_CONFIG['model_path']
+    input_size = input_size or YOLO_CONFIG['input_size']
+    int8 = YOLO_CONFIG['int8'] if int8 is None else int8
+    stem = os.path.splitext(model_path)[0]
+
+    if backend == 'onnx':
+        path = f"{stem}.onnx"
+        quantized = f"{stem}.int8.onnx"
+        if int8 and os.path.exists(quantized):
+            return quantized
+        if not os.path.exists(path):
+            from ultralytics import YOLO
+            path = YOLO(model_path).export(format='onnx', imgsz=input_size, dynamic=False, simplify=True)
+        if not int8:
+            return path
+        from onnxruntime.quantization import QuantType, quantize_dynamic
+        quantize_dynamic(path, quantized, weight_type=QuantType.QUInt8)
+        return quantized
+
+    if backend == 'openvino':
+        path = f"{stem}_int8_openvino_model" if int8 else f"{stem}_openvino_model"
+        if not os.path.isdir(path):
+            from ultralytics import YOLO
+            options = {'int8': True, 'data': YOLO_CONFIG['int8_data']} if int8 else {}
+            path = YOLO(model_path).export(format='openvino', imgsz=input_size, **options)
+        return path
+
+    raise ValueError(f"Unknown detector backend: {backend}")
+
+def create_detector(backend=None):
+    """Build the detector backend named in YOLO_CONFIG"""
+    backend = backend or YOLO_CONFIG['backend']
+    if backend == 'ultralytics':
+        return UltralyticsDetector()
+    if backend == 'onnx':
+        return OnnxDetector(export_model('onnx'))
+    if backend == 'openvino':
+        return OpenVinoDetector(export_model('openvino'))
+    raise ValueError(f"Unknown detector backend: {backend}")
@@ -0,0 +1,375 @@
+import cv2
+import numpy as np
+import json
+import sys
+import time
+import threading
+from datetime import datetime, timedelta
+from config import PREDICTOR_CONFIG, CORRIDOR_CONFIG, CROSSING_CONFIG, CAMERA_CONFIG, YOLO_CONFIG
+from corridor import load_corridors
+from crossings import CrossingCounter
+from perception import CameraPerception
+from regions import ApproachMap, load_regions
+from speed_detector import SpeedDetector
+from traffic_signal import SignalControllerRegistry, SignalScheduler, DIRECTION_GROUPS, expand_groups
+from traffic_predictor import TrafficPredictor
+from traffic_history import EPOCH
+
+class TrafficEngine:
+    """Detection, speed, signal and prediction loop with no GUI dependency.
+
+    Consumers are callables that receive one JSON-serialisable record per
+    processed frame or signal switch; the Qt window is just one optional user.
+    num_cameras sizes the per-camera tables when more cameras are used than CAMERA_CONFIG has.
+    """
+    def __init__(self, num_cameras=None):
+        self.speed_detector = SpeedDetector()
+        # Detector, trackers and speed history of cameras processed in this process. With
+        # worker processes the detector lives in the workers, so it is only loaded on demand.
+        self._perception = None
+        if not CAMERA_CONFIG['worker_processes']:
+            self._perception = CameraPerception(speed_detector=self.speed_detector)
+        self.classes_of_interest = np.array(YOLO_CONFIG['classes_of_interest'])
+        self.worker_speeds = {}  # Camera -> average speed reported by camera worker processes
+        self.worker_classes = {}  # Class id -> name from the camera workers' detectors
+        self.regions = load_regions()
+        self.approach_maps = {}  # Camera -> ApproachMap, default NS/EW halves when unconfigured
+        self.approach_stats = {}  # Camera -> (vehicles, queued vehicles) per approach of the last frame
+        # Class id -> column of the crossing counters
+        self.class_columns = np.full(max(self.classes_of_interest) + 1, -1, dtype=np.int64)
+        self.class_columns[self.classes_of_interest] = np.arange(len(self.classes_of_interest))
+        self.num_cameras = max(num_cameras or 0, CAMERA_CONFIG['num_cameras'])
+        self.crossings = CrossingCounter(len(self.classes_of_interest),
+                                         max_cameras=max(CROSSING_CONFIG['max_cameras'], self.num_cameras))
+        self.samples_at_last_train = 0
+
+        # Camera i watches intersection i+1; each intersection has its own controller
+        self.signals = SignalControllerRegistry(range(1, self.num_cameras + 1))
+        self.scheduler = SignalScheduler(self.signals)
+        # Green waves along configured corridors, re-planned as measured speeds drift
+        self.corridors = load_corridors(self.scheduler)
+        for corridor in self.corridors:
+            corridor.update_speeds({})
+        self.next_coordination = 0.0
+        self.signal_thread = None
+        self.signal_stop = threading.Event()
+        self.traffic_predictor = TrafficPredictor()
+
+        self.consumers = []
+        self.lock = threading.Lock()
+
+    @property
+    def perception(self):
+        if self._perception is None:
+            self._perception = CameraPerception(speed_detector=self.speed_detector)
+        return self._perception
+
+    @property
+    def classes(self):
+        """Class id -> name of the detector, taken from the workers while none is loaded here"""
+        if self._perception is None and CAMERA_CONFIG['worker_processes']:
+            return self.worker_classes
+        return self.perception.classes
+
+    def add_consumer(self, consumer):
+        """Register a callable that receives every engine record"""
+        self.consumers.append(consumer)
+
+    def publish(self, record):
+        for consumer in self.consumers:
+            try:
+                consumer(record)
+            except Exception as e:
+                print(f"Consumer error: {str(e)}")
+
+    def process(self, frames, camera_indices, timestamps=None, inference=None):
+        """Detect vehicles, update signal and predictor state and publish results.
+
+        inference optionally holds each frame's letterboxed detector input
+        and transform (see FramePreprocessor); frames are then only shown.
+        """
+        if timestamps is None:
+            timestamps = [datetime.now()] * len(frames)
+        observations = self.perception.observe(frames, camera_indices, timestamps, inference)
+        return self.process_observations(observations, frames)
+
+    def process_observations(self, observations, frames):
+        """Turn track observations into vehicles, feed signals and predictor and publish.
+
+        Observations come from this engine's CameraPerception or from camera
+        worker processes. Returns (camera_index, vehicles, frame) per frame.
+        """
+        outputs = [(observation['camera'], self.apply_observation(observation), frame)
+                   for observation, frame in zip(observations, frames)]
+
+        with self.lock:
+            for observation, (camera_index, vehicles, _) in zip(observations, outputs):
+                self.update_traffic(camera_index)
+                self.publish({
+                    'type': 'frame',
+                    'timestamp': observation['timestamp'].isoformat(),
+                    'camera': camera_index,
+                    'vehicles': [
+                        {
+                            'id': v['id'],
+                            'class': v['class'],
+                            'bbox': list(v['bbox']),
+                            'speed': round(v['speed'], 2),
+                            'position': v['position']
+                        }
+                        for v in vehicles
+                    ]
+                })
+            self.update_coordination()
+
+        return outputs
+
+    def process_frame(self, frame, camera_index=0):
+        if frame is None:
+            return [], None
+
+        _, vehicles, frame = self.process([frame], [camera_index], [datetime.now()])[0]
+
+        return vehicles, self.annotate_frame(frame, vehicles)
+
+    def apply_observation(self, observation):
+        """Count stop-line crossings of a detected frame and build its vehicle dicts"""
+        camera_index = observation['camera']
+        boxes = observation['boxes']
+        class_ids = observation['class_ids']
+        frame_size = tuple(observation['frame_size'])
+        approach_map = self.get_approach_map(camera_index)
+
+        previous_boxes = observation['previous_boxes']
+        if previous_boxes is not None:
+            self.crossings.record(
+                camera_index, observation['track_ids'], (previous_boxes[:, :2] + previous_boxes[:, 2:]) / 2,
+                (boxes[:, :2] + boxes[:, 2:]) / 2, self.class_columns[class_ids],
+                approach_map.stop_lines(frame_size), approach_map.line_approaches, observation['timestamp']
+            )
+        else:
+            self.crossings.observe(camera_index, observation['timestamp'])
+
+        # Assign every box center to an approach with one lookup in the label mask
+        labels = approach_map.labels((boxes[:, :2] + boxes[:, 2:]) / 2, frame_size)
+        counts, queues = approach_map.approach_stats(labels, observation['speeds'])
+        self.approach_stats[camera_index] = (dict(zip(approach_map.names, counts.tolist())),
+                                             dict(zip(approach_map.names, queues.tolist())))
+        positions = [None] + approach_map.names
+
+        classes = self.classes
+        vehicles = []
+        for bbox, class_id, vehicle_id, speed, label in zip(boxes.tolist(), class_ids.tolist(),
+                                                           observation['track_ids'].tolist(),
+                                                           observation['speeds'].tolist(), labels.tolist()):
+            vehicles.append({
+                'bbox': tuple(bbox),
+                'class': classes.get(class_id, str(class_id)),
+                'speed': speed,
+                'id': vehicle_id,
+                'position': positions[label],
+                'camera_index': camera_index
+            })
+
+        return vehicles
+
+    def get_approach_map(self, camera_index):
+        approach_map = self.approach_maps.get(camera_index)
+        if approach_map is None:
+            approach_map = self.approach_maps[camera_index] = ApproachMap(self.regions.get(camera_index))
+        return approach_map
+
+    def annotate_frame(self, frame, vehicles):
+        """Draw detection boxes and speed labels onto the frame"""
+        for vehicle in vehicles:
+            x1, y1, x2, y2 = vehicle['bbox']
+            cv2.rectangle(frame, (x1, y1), (x2, y2), (0, 255, 0), 2)
+            label = f"{vehicle['class']}: {vehicle['speed']:.1f} km/h"
+            cv2.putText(frame, label, (x1, y1-10),
+                       cv2.FONT_HERSHEY_SIMPLEX, 0.5, (0, 255, 0), 2)
+        return frame
+
+    def update_traffic(self, camera_index):
+        """Feed a camera's latest approach queues and closed crossing minutes to its controller and the predictor"""
+        _, queues = self.approach_stats.get(camera_index, ({}, {}))
+
+        # The controller sees the queue on each approach
+        queues = expand_groups(queues)
+        self.scheduler.update_approach_counts(camera_index + 1, queues)
+
+        # The predictor learns stop-line flow: one sample per direction and complete minute
+        names = self.get_approach_map(camera_index).names
+        for minute, crossings in self.crossings.closed_minutes(camera_index):
+            flows = expand_groups(dict(zip(names, crossings.tolist())))
+            minute_time = EPOCH + timedelta(minutes=minute)
+            for direction, approaches in DIRECTION_GROUPS.items():
+                self.traffic_predictor.add_data_point(
+                    minute_time,
+                    sum(flows.get(approach, 0) for approach in approaches),
+                    sum(queues.get(approach, 0) for approach in approaches),
+                    direction
+                )
+
+        # Retrain periodically in the background; the old model keeps serving meanwhile
+        total_samples = self.traffic_predictor.history.total_samples
+        if total_samples - self.samples_at_last_train >= PREDICTOR_CONFIG['retrain_every']:
+            self.samples_at_last_train = total_samples
+            self.traffic_predictor.train_model_async()
+
+    def update_worker_speeds(self, speeds, classes=None):
+        """Average speeds per camera, and the detector's class names, reported by camera worker processes"""
+        with self.lock:
+            self.worker_speeds.update(speeds)
+            if classes:
+                self.worker_classes = dict(classes)
+
+    def update_coordination(self, now=None):
+        """Feed average measured speeds to the corridors every update_interval seconds"""
+        now = time.monotonic() if now is None else now
+        if not self.corridors or now < self.next_coordination:
+            return
+        self.next_coordination = now + CORRIDOR_CONFIG['update_interval']
+
+        # Camera i watches intersection i+1
+        speeds = dict(self.worker_speeds)
+        speeds.update(self.speed_detector.average_speeds(datetime.now()))
+        speeds = {camera + 1: speed for camera, speed in speeds.items()}
+        for corridor in self.corridors:
+            if corridor.update_speeds(speeds):
+                print(f"Corridor {corridor.intersection_ids} re-planned: bandwidth "
+                      f"{corridor.bandwidth[0]:.0f}s / {corridor.bandwidth[1]:.0f}s")
+
+    def start_signals(self):
+        """Run the signal scheduler on its own thread, switching exactly at deadlines"""
+        if self.signal_thread is not None and self.signal_thread.is_alive():
+            return
+        self.signal_stop = threading.Event()
+        self.signal_thread = threading.Thread(
+            target=self.scheduler.run, args=(self.signal_stop, self.publish_signal_events),
+            name="signal-scheduler", daemon=True
+        )
+        self.signal_thread.start()
+
+    def stop_signals(self):
+        self.signal_stop.set()
+        self.scheduler.wake()
+        if self.signal_thread is not None:
+            self.signal_thread.join(timeout=2.0)
+            self.signal_thread = None
+
+    def update_signals(self, now=None):
+        """Apply every signal switch due by now and publish it"""
+        events = self.scheduler.run_due(now)
+        self.publish_signal_events(events)
+        return events
+
+    def publish_signal_events(self, events):
+        for intersection_id, event in events:
+            self.publish({
+                'type': 'signal',
+                'timestamp': datetime.now().isoformat(),
+                'intersection': intersection_id,
+                'event': event,
+                'phase': self.signals.get_phase(intersection_id),
+                'states': {
+                    direction: state['state']
+                    for direction, state in self.signals.get_current_states(intersection_id).items()
+                }
+            })
+
+    def get_stats(self):
+        """Speed tracker occupancy of the cameras processed in this process"""
+        return {'speed_tracker': self.speed_detector.stats()}
+
+    def publish_stats(self, pipeline_stats=None):
+        """Publish a 'stats' record, with the pipeline's stage and capture stats if given, and return it"""
+        stats = self.get_stats()
+        if pipeline_stats is not None:
+            stats['pipeline'] = pipeline_stats
+        self.publish(dict({'type': 'stats', 'timestamp': datetime.now().isoformat()}, **stats))
+        return stats
+
+    def predict(self, current_time=None):
+        """Publish predictions for both directions and return them"""
+        current_time = current_time or datetime.now()
+        predictions = self.traffic_predictor.predict_batch(current_time, ('NS', 'EW'))
+        self.publish({
+            'type': 'prediction',
+            'timestamp': current_time.isoformat(),
+            'predictions': {
+                direction: [
+                    {
+                        'time': p['time'].isoformat(),
+                        'predicted_vehicles': p['predicted_vehicles'],
+                        'congestion_risk': p['congestion_risk']
+                    }
+                    for p in preds
+                ]
+                for direction, preds in predictions.items()
+            }
+        })
+        return predictions
+
+class JsonlWriter:
+    """Engine consumer that writes one JSON object per line"""
+    def __init__(self, stream=None):
+        self.stream = stream or sys.stdout
+        self.lock = threading.Lock()
+
+    def __call__(self, record):
+        line = json.dumps(record)
+        with self.lock:
+            self.stream.write(line + '\n')
+            self.stream.flush()
+
+def run_headless(engine, sources, loop_files=False, duration=None, prediction_interval=60.0, stats_interval=10.0):
+    """Run capture -> detect -> speed -> signal -> predict without a display"""
+    from pipeline import DetectionPipeline, open_source
+
+    if len(sources) > engine.crossings.max_cameras:
+        print(f"{len(sources)} sources given but the engine was sized for {engine.crossings.max_cameras} cameras",
+              file=sys.stderr)
+        return 1
+
+    cameras = []
+    sources = [str(source) for source in sources]
+    for source in sources:
+        camera = open_source(source)
+        if not camera.isOpened():
+            print(f"Could not open video source {source}", file=sys.stderr)
+            camera.release()
+            camera = None
+        cameras.append(camera)
+
+    if not any(camera is not None for camera in cameras):
+        return 1
+
+    pipeline = DetectionPipeline(detect_fn=engine.process, observe_fn=engine.process_observations,
+                                 speeds_fn=engine.update_worker_speeds)
+    pipeline.start(cameras, sources, loop_files=loop_files)
+    engine.start_signals()
+
+    started = time.monotonic()
+    next_prediction = started + prediction_interval
+    next_stats = started + stats_interval
+    try:
+        while pipeline.captures_running():
+            if duration is not None and time.monotonic() - started >= duration:
+                break
+            if time.monotonic() >= next_prediction:
+                engine.predict()
+                next_prediction += prediction_interval
+            if time.monotonic() >= next_stats:
+                engine.publish_stats(pipeline.get_stats())
+                next_stats += stats_interval
+            time.sleep(0.5)
+    except KeyboardInterrupt:
+        pass
+    finally:
+        engine.stop_signals()
+        pipeline.stop()
+        for camera in cameras:
+            if camera is not None:
+                camera.release()
+
+    return 0
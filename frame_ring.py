@@ -0,0 +1,135 @@
+from multiprocessing import shared_memory
+import numpy as np
+
+SLOT_HEADER = np.dtype([
+    ('sequence', np.int64),  # 0 while the slot is being written
+    ('camera', np.int64),
+    ('timestamp', np.float64),
+    ('height', np.int64),
+    ('width', np.int64)
+])
+
+class FrameRing:
+    """Fixed-shape frame slots in shared memory, written by one process and read by others.
+
+    Frames travel between processes as (slot, sequence) pairs; readers get
+    NumPy views straight into the shared block, so nothing is pickled or
+    copied. Every write takes the next slot in turn and stamps it with a
+    new sequence number, zeroing it while the frame is being written. The
+    writer never waits for readers, so a view can be overwritten while it
+    is in use: like a seqlock, a reader checks is_current() again once it
+    is done with the view (see RingLease) and discards anything derived
+    from it if the slot was reused. Frames may be smaller than the slot
+    shape; their real size is kept in the slot header.
+
+    The creating process owns the block and must unlink() it. A ring
+    pickled to a child process re-attaches to the same block by name.
+    """
+    def __init__(self, num_slots, shape, name=None, create=True):
+        self.num_slots = num_slots
+        self.shape = tuple(shape)
+        self.create = create
+        frame_bytes = int(np.prod(self.shape))
+        header_bytes = -(-(8 + num_slots * SLOT_HEADER.itemsize) // 64) * 64
+        size = header_bytes + num_slots * frame_bytes
+
+        if create:
+            self.memory = shared_memory.SharedMemory(name=name, create=True, size=size)
+        else:
+            self.memory = attach_shared_memory(name)
+        self.name = self.memory.name
+
+        buffer = self.memory.buf
+        self.written = np.ndarray((1,), dtype=np.int64, buffer=buffer)
+        self.headers = np.ndarray((num_slots,), dtype=SLOT_HEADER, buffer=buffer, offset=8)
+        self.frames = np.ndarray((num_slots,) + self.shape, dtype=np.uint8, buffer=buffer, offset=header_bytes)
+        if create:
+            self.written[0] = 0
+            self.headers[:] = 0
+
+    def __reduce__(self):
+        return (FrameRing, (self.num_slots, self.shape, self.name, False))
+
+    def write(self, frame, camera_index=0, timestamp=0.0):
+        """Copy a frame into the next slot; returns its (slot, sequence)"""
+        height, width = frame.shape[:2]
+        if height > self.shape[0] or width > self.shape[1]:
+            raise ValueError(f"frame {width}x{height} does not fit ring slots of {self.shape[1]}x{self.shape[0]}")
+        sequence = int(self.written[0]) + 1
+        slot = (sequence - 1) % self.num_slots
+        headers = self.headers
+        headers['sequence'][slot] = 0
+        self.frames[slot, :height, :width] = frame
+        headers['camera'][slot] = camera_index
+        headers['timestamp'][slot] = timestamp
+        headers['height'][slot] = height
+        headers['width'][slot] = width
+        headers['sequence'][slot] = sequence
+        self.written[0] = sequence
+        return slot, sequence
+
+    def is_current(self, slot, sequence):
+        return int(self.headers['sequence'][slot]) == sequence
+
+    def read(self, slot, sequence):
+        """(view, camera, timestamp) of a slot, or None if it has been reused.
+
+        The view is only known to be intact if is_current() still holds after it was used.
+        """
+        if int(self.headers['sequence'][slot]) != sequence:
+            return None
+        height, width = int(self.headers['height'][slot]), int(self.headers['width'][slot])
+        return (self.frames[slot, :height, :width], int(self.headers['camera'][slot]),
+                float(self.headers['timestamp'][slot]))
+
+    def latest(self):
+        """(slot, sequence) of the newest frame, or None before the first write"""
+        sequence = int(self.written[0])
+        if sequence == 0:
+            return None
+        return (sequence - 1) % self.num_slots, sequence
+
+    def close(self):
+        # Views into the buffer must go before the mapping can be closed
+        self.written = self.headers = self.frames = None
+        try:
+            self.memory.close()
+        except BufferError:
+            pass  # A reader still holds a view; the mapping goes away with it
+
+    def unlink(self):
+        if self.create:
+            self.memory.unlink()
+
+class RingLease:
+    """Ring slots a pipeline item was read from, checked again after their views are used.
+
+    is_valid() is False once the writer has started reusing any of the
+    slots, in which case whatever was computed from the views may come from
+    a torn frame and must be discarded. Ring slots are never held back from
+    the writer, so releasing does nothing; the methods mirror FrameLease.
+    """
+    def __init__(self, entries):
+        self.entries = entries  # (ring, slot, sequence) per view
+
+    def is_valid(self):
+        return all(ring.is_current(slot, sequence) for ring, slot, sequence in self.entries)
+
+    def release_inference(self):
+        pass
+
+    def release(self):
+        pass
+
+def attach_shared_memory(name):
+    """Open an existing block without claiming it for this process.
+
+    Python 3.13+ can skip resource tracking outright. Older versions
+    register the block again, which is harmless for processes started by
+    the owner: they share its resource tracker, which unlinks nothing until
+    the owner is gone.
+    """
+    try:
+        return shared_memory.SharedMemory(name=name, track=False)
+    except TypeError:
+        return shared_memory.SharedMemory(name=name)
@@ -0,0 +1,30 @@
+import argparse
+import sys
+from config import VIDEO_CONFIG
+
+def main():
+    parser = argparse.ArgumentParser(description='Run the traffic engine without a display')
+    parser.add_argument('sources', nargs='*', default=[str(VIDEO_CONFIG['source'])],
+                        help='Camera indices or video file paths')
+    parser.add_argument('--output', help='JSONL output file (default: stdout)')
+    parser.add_argument('--loop', action='store_true', help='Loop video files instead of stopping at the end')
+    parser.add_argument('--duration', type=float, help='Stop after this many seconds')
+    args = parser.parse_args()
+
+    # Keep stdout clean for JSONL; diagnostics from the models go to stderr
+    stream = open(args.output, 'a') if args.output else sys.stdout
+    sys.stdout = sys.stderr
+
+    # Imported after parsing so --help stays fast
+    from engine import TrafficEngine, JsonlWriter, run_headless
+
+    engine = TrafficEngine(num_cameras=len(args.sources))
+    engine.add_consumer(JsonlWriter(stream))
+    try:
+        return run_headless(engine, args.sources, loop_files=args.loop, duration=args.duration)
+    finally:
+        if args.output:
+            stream.close()
+
+if __name__ == "__main__":
+    sys.exit(main())
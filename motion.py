@@ -0,0 +1,52 @@
+import cv2
+import numpy as np
+from config import MOTION_CONFIG
+
+class MotionGate:
+    """Decides per frame whether one camera needs a detector run.
+
+    Frames are shrunk to a small blurred grayscale image and compared with
+    the one taken at the last detector run, so slow movement accumulates
+    until it crosses the threshold. Detection also runs after max_skip
+    skipped frames, which bounds how far tracker predictions can drift.
+    """
+    def __init__(self, width=None, pixel_threshold=None, motion_fraction=None, max_skip=None):
+        self.width = width or MOTION_CONFIG['width']
+        self.pixel_threshold = MOTION_CONFIG['pixel_threshold'] if pixel_threshold is None else pixel_threshold
+        self.motion_fraction = MOTION_CONFIG['motion_fraction'] if motion_fraction is None else motion_fraction
+        self.max_skip = MOTION_CONFIG['max_skip'] if max_skip is None else max_skip
+        self.reference = None
+        self.skipped = 0
+        self.motion = 0.0  # Changed-pixel share of the latest frame
+        self.detections = 0
+        self.skips = 0
+
+    def _small(self, frame):
+        height = max(int(round(frame.shape[0] * self.width / frame.shape[1])), 1)
+        small = cv2.resize(frame, (self.width, height), interpolation=cv2.INTER_AREA)
+        if small.ndim == 3:
+            small = cv2.cvtColor(small, cv2.COLOR_RGB2GRAY)
+        return cv2.GaussianBlur(small, (5, 5), 0)
+
+    def check(self, frame):
+        """True if the detector should run on this frame"""
+        small = self._small(frame)
+        if self.reference is None or self.reference.shape != small.shape:
+            self.motion = 1.0
+        else:
+            changed = cv2.absdiff(small, self.reference) > self.pixel_threshold
+            self.motion = float(np.count_nonzero(changed)) / changed.size
+
+        if self.motion >= self.motion_fraction or self.skipped >= self.max_skip:
+            self.reference = small
+            self.skipped = 0
+            self.detections += 1
+            return True
+        self.skipped += 1
+        self.skips += 1
+        return False
+
+    def skip_ratio(self):
+        """Share of frames on which the detector was skipped"""
+        total = self.detections + self.skips
+        return self.skips / total if total else 0.0
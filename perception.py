@@ -0,0 +1,124 @@
+import numpy as np
+from datetime import datetime
+from config import YOLO_CONFIG, MOTION_CONFIG
+from detectors import create_detector
+from motion import MotionGate
+from preprocess import to_display_boxes
+from speed_detector import SpeedDetector
+from tracker import VehicleTracker
+
+class CameraPerception:
+    """Per-camera vision state: motion gates, the detector, trackers and speed history.
+
+    observe() turns frames into track observations, one plain dict per
+    frame, so it can run in the engine's process or in a camera worker
+    process that sends the observations back. An observation holds the
+    camera, timestamp, frame size, whether the detector ran, and
+    per-track arrays: track_ids, boxes, class_ids, speeds, and
+    previous_boxes (None when the boxes were only predicted).
+    """
+    def __init__(self, detector=None, speed_detector=None):
+        self.detector = detector or create_detector()
+        self.classes = self.detector.names
+        self.batch_inference = YOLO_CONFIG.get('batch_inference', True)
+        self.conf_threshold = YOLO_CONFIG['conf_threshold']
+        self.classes_of_interest = np.array(YOLO_CONFIG['classes_of_interest'])
+        self.motion_gating = MOTION_CONFIG['enabled']
+        self.motion_gates = {}  # Camera -> MotionGate deciding which frames reach the detector
+        self.trackers = {}  # One tracker per camera keeps IDs stable within a feed
+        self.speed_detector = speed_detector or SpeedDetector()
+
+    def observe(self, frames, camera_indices, timestamps=None, inference=None):
+        """Track observations for frames from several cameras, in input order.
+
+        Detection is batched unless disabled in YOLO_CONFIG. With motion
+        gating on, only frames whose camera saw motion (or went max_skip
+        frames without detection) reach the detector; the others get the
+        tracker's predicted boxes. inference optionally gives, per frame,
+        the (letterboxed image, transform) from a FramePreprocessor: the
+        detector then runs on that image and boxes are mapped back to the
+        frame, which is only used for display and motion.
+        """
+        if timestamps is None:
+            timestamps = [datetime.now()] * len(frames)
+        if self.motion_gating:
+            run = [self.get_motion_gate(camera_index).check(frame)
+                   for frame, camera_index in zip(frames, camera_indices)]
+        else:
+            run = [True] * len(frames)
+
+        selected = [i for i, detect in enumerate(run) if detect]
+        images = [inference[i][0] if inference is not None else frames[i] for i in selected]
+        if self.batch_inference:
+            batch_detections = self.detector.detect(images) if images else []
+        else:
+            batch_detections = [self.detector.detect([image])[0] for image in images]
+        if inference is not None:
+            batch_detections = [
+                to_display_boxes(detections, inference[i][1], (frames[i].shape[1], frames[i].shape[0]))
+                for i, detections in zip(selected, batch_detections)
+            ]
+
+        observations = []
+        detections = iter(batch_detections)
+        for frame, camera_index, timestamp, detect in zip(frames, camera_indices, timestamps, run):
+            frame_size = (frame.shape[1], frame.shape[0])
+            if detect:
+                observations.append(self.track_detections(next(detections), frame_size, camera_index, timestamp))
+            else:
+                observations.append(self.coast_tracks(frame_size, camera_index, timestamp))
+        return observations
+
+    def reset(self):
+        """Forget all motion, track and speed state, e.g. before jumping to another part of a video"""
+        self.motion_gates = {}
+        self.trackers = {}
+        self.speed_detector = SpeedDetector()
+
+    def get_motion_gate(self, camera_index):
+        gate = self.motion_gates.get(camera_index)
+        if gate is None:
+            gate = self.motion_gates[camera_index] = MotionGate()
+        return gate
+
+    def get_tracker(self, camera_index):
+        tracker = self.trackers.get(camera_index)
+        if tracker is None:
+            tracker = self.trackers[camera_index] = VehicleTracker()
+        return tracker
+
+    def track_detections(self, detections, frame_size, camera_index, current_time):
+        """Observation from detector output for one frame"""
+        data = detections.reshape(-1, 6)
+        keep = (data[:, 4] > self.conf_threshold) & np.isin(data[:, 5].astype(int), self.classes_of_interest)
+        boxes = data[keep, :4].astype(int)
+        class_ids = data[keep, 5].astype(int)
+
+        tracker = self.get_tracker(camera_index)
+        track_ids = tracker.update(boxes, class_ids)
+
+        # Track IDs are per camera, so key speed history by both
+        speeds = self.speed_detector.calculate_speeds(
+            boxes, [(camera_index, vehicle_id) for vehicle_id in track_ids.tolist()], current_time,
+            camera_index=camera_index, frame_size=frame_size
+        )
+        return {
+            'camera': camera_index, 'timestamp': current_time, 'frame_size': frame_size, 'detected': True,
+            'track_ids': track_ids, 'boxes': boxes, 'class_ids': class_ids, 'speeds': speeds,
+            'previous_boxes': tracker.previous_boxes
+        }
+
+    def coast_tracks(self, frame_size, camera_index, current_time):
+        """Observation from tracker predictions for a frame the detector skipped.
+
+        Speeds keep their last measured values, and crossings are left to
+        the next detection, which compares against the last detected boxes.
+        """
+        track_ids, boxes, class_ids = self.get_tracker(camera_index).coast()
+        speeds = np.array([self.speed_detector.get_speed((camera_index, vehicle_id))
+                           for vehicle_id in track_ids.tolist()], dtype=np.float32)
+        return {
+            'camera': camera_index, 'timestamp': current_time, 'frame_size': frame_size, 'detected': False,
+            'track_ids': track_ids, 'boxes': boxes.astype(int), 'class_ids': class_ids, 'speeds': speeds,
+            'previous_boxes': None
+        }
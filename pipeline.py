@@ -0,0 +1,651 @@
+import threading
+import queue
+import time
+import multiprocessing
+import cv2
+from datetime import datetime
+from config import PIPELINE_CONFIG, VIDEO_CONFIG, CAMERA_CONFIG, YOLO_CONFIG
+from frame_ring import FrameRing, RingLease
+from preprocess import FramePreprocessor
+
+def put_latest(q, item, discard=None):
+    """Put item on a bounded queue, dropping the oldest entry when it is full.
+
+    discard is called with every dropped entry. Returns the number of
+    items dropped to make room.
+    """
+    dropped = 0
+    while True:
+        try:
+            q.put_nowait(item)
+            return dropped
+        except queue.Full:
+            try:
+                old = q.get_nowait()
+                dropped += 1
+                if discard is not None:
+                    discard(old)
+            except queue.Empty:
+                pass
+
+def release_item(item):
+    """Return the pooled buffers of a pipeline item nobody will use any more.
+
+    Frame items carry their lease (FrameLease, RingLease or None) as the
+    fourth element: (frame, timestamp, inference, lease) between capture
+    and detection, (camera, vehicles, frame, lease) after it.
+    """
+    if len(item) > 3 and item[3] is not None:
+        item[3].release()
+
+class LatestFrameSlots:
+    """One-slot-per-camera buffer that always holds the newest captured frame.
+
+    A frame replaced before the detector took it has its buffers released.
+    """
+    def __init__(self):
+        self.slots = {}
+        self.put_times = {}
+        self.dropped = 0
+        self.condition = threading.Condition()
+
+    def put(self, camera_index, item):
+        with self.condition:
+            if camera_index in self.slots:
+                # Detector has not consumed the previous frame yet
+                self.dropped += 1
+                release_item(self.slots[camera_index])
+            self.slots[camera_index] = item
+            self.put_times[camera_index] = time.monotonic()
+            self.condition.notify()
+
+    def pending_age(self, camera_index):
+        """Seconds the camera's untaken frame has waited, or None if the detector took it"""
+        with self.condition:
+            if camera_index not in self.slots:
+                return None
+            return time.monotonic() - self.put_times[camera_index]
+
+    def take_all(self, timeout=0.1):
+        """Wait for at least one fresh frame and return every pending one"""
+        with self.condition:
+            if not self.slots:
+                self.condition.wait(timeout)
+            items = self.slots
+            self.slots = {}
+            return items
+
+class RingWriter:
+    """LatestFrameSlots stand-in inside a capture process.
+
+    The display frame and the inference image are copied into the camera's
+    shared FrameRings and only their slots, sequences and the letterbox
+    transform go on the message queue to the parent. The pooled buffers
+    are released as soon as they are copied.
+    """
+    def __init__(self, ring, inference_ring, messages):
+        self.ring = ring
+        self.inference_ring = inference_ring
+        self.messages = messages
+
+    def put(self, camera_index, item):
+        frame, timestamp, (image, transform), lease = item
+        try:
+            slot, sequence = self.ring.write(frame, camera_index, timestamp.timestamp())
+            inference_slot, inference_sequence = self.inference_ring.write(image, camera_index,
+                                                                           timestamp.timestamp())
+        finally:
+            lease.release()
+        put_latest(self.messages, ('frame', camera_index, slot, sequence, inference_slot, inference_sequence,
+                                   transform))
+
+    def status(self, camera_index, active):
+        put_latest(self.messages, ('status', camera_index, active))
+
+    def pending_age(self, camera_index):
+        return None  # The parent keeps only the newest frame anyway
+
+class PipelineStage(threading.Thread):
+    """Worker thread that pulls items from an input queue and pushes results downstream"""
+    def __init__(self, name, stop_event, in_queue=None, out_queue=None):
+        super().__init__(name=name, daemon=True)
+        self.stop_event = stop_event
+        self.in_queue = in_queue
+        self.out_queue = out_queue
+        self.processed = 0
+        self.dropped = 0
+
+    def next_item(self):
+        try:
+            return self.in_queue.get(timeout=0.1)
+        except queue.Empty:
+            return None
+
+    def process(self, item):
+        raise NotImplementedError
+
+    def stats(self):
+        return {'processed': self.processed, 'dropped': self.dropped}
+
+    def discard(self, item):
+        """Release the buffers of an item that was dropped or failed"""
+        release_item(item)
+
+    def emit(self, result):
+        if self.out_queue is not None:
+            self.dropped += put_latest(self.out_queue, result, release_item)
+        else:
+            release_item(result)  # Last stage: nothing downstream will read the frame
+
+    def run(self):
+        while not self.stop_event.is_set():
+            item = self.next_item()
+            if item is None:
+                continue
+            try:
+                results = self.process(item)
+            except Exception as e:
+                print(f"{self.name} stage error: {str(e)}")
+                self.discard(item)
+                continue
+            self.processed += 1
+            for result in results or []:
+                self.emit(result)
+
+LIVE_SCHEMES = ('rtsp://', 'rtsps://', 'rtmp://', 'http://', 'https://', 'udp://', 'tcp://')
+
+def is_live_source(source):
+    """True for cameras and network streams, False for local video files"""
+    return is_local_device(source) or str(source).lower().startswith(LIVE_SCHEMES)
+
+def is_local_device(source):
+    """True for camera device indices, which only one process can open at a time"""
+    return str(source).isdigit()
+
+def open_source(source):
+    """Open a camera index, stream URL or file; live sources keep a one-frame buffer"""
+    camera = cv2.VideoCapture(int(source) if is_local_device(source) else source)
+    if is_live_source(source):
+        # Keep OpenCV from queueing seconds of frames behind a slow consumer
+        camera.set(cv2.CAP_PROP_BUFFERSIZE, 1)
+    return camera
+
+class CaptureStage(PipelineStage):
+    """Reads one source and publishes its newest frame to the detector slots.
+
+    Files play at VIDEO_CONFIG fps; when the reader falls behind, it grab()s
+    past the frames it has no time for. Live sources are read as fast as
+    they deliver, which keeps OpenCV's buffer drained. Either way a grabbed
+    frame is only decoded (retrieve()) when the detector has taken the
+    previous one or that one has waited longer than max_frame_age. A live
+    source that stops delivering is reopened with exponential backoff if its
+    source is known. stats() reports delivered, replaced and skipped
+    frames, decode time, reconnects and staleness.
+
+    Decoded frames go through a FramePreprocessor, so the slots receive
+    (display thumbnail, timestamp, (inference image, transform), lease)
+    in pooled buffers. While all pool_size buffers are still leased
+    downstream, grabbed frames are skipped instead of decoded.
+    """
+    def __init__(self, camera_index, camera, is_file, slots, stop_event, status_fn=None, loop=True, source=None,
+                 pool_size=3):
+        super().__init__(f"capture-{camera_index}", stop_event)
+        self.camera_index = camera_index
+        self.camera = camera
+        self.is_file = is_file
+        self.loop = loop
+        self.slots = slots
+        self.status_fn = status_fn
+        self.source = source
+        self.preprocessor = FramePreprocessor(pool_size=pool_size)
+        # Files would otherwise be read as fast as the decoder allows
+        self.frame_interval = 1.0 / VIDEO_CONFIG['fps'] if is_file else 0
+        self.skipped = 0  # Frames grabbed but never decoded
+        self.reconnects = 0
+        self.decode_time = 0.0  # Smoothed seconds to decode and preprocess a frame
+        self.last_frame_time = None
+        self.backoff = PIPELINE_CONFIG['reconnect_backoff']
+        self.reconnect_at = 0.0
+        self.owns_camera = False  # True once the stage has reopened the source itself
+        self.was_active = None
+
+    def set_active(self, active):
+        if self.was_active is not active and self.status_fn is not None:
+            self.status_fn(self.camera_index, active)
+        self.was_active = active
+
+    def reconnect(self):
+        """Reopen a failed live source once its backoff has passed; True if it is open"""
+        now = time.monotonic()
+        if self.source is None or now < self.reconnect_at:
+            self.stop_event.wait(min(0.1, max(self.reconnect_at - now, 0.01)))
+            return False
+        camera = open_source(self.source)
+        if camera.isOpened():
+            self.camera = camera
+            self.owns_camera = True
+            self.reconnects += 1
+            self.backoff = PIPELINE_CONFIG['reconnect_backoff']
+            return True
+        camera.release()
+        print(f"Camera {self.camera_index + 1}: reconnect failed, retrying in {self.backoff:.0f}s")
+        self.reconnect_at = now + self.backoff
+        self.backoff = min(self.backoff * 2, PIPELINE_CONFIG['max_reconnect_backoff'])
+        return False
+
+    def wants_frame(self):
+        """False while the detector still has an undelivered, fresh frame from this source,
+        or every buffer is still in use downstream"""
+        if not self.preprocessor.has_free():
+            return False
+        age = self.slots.pending_age(self.camera_index)
+        return age is None or age > PIPELINE_CONFIG['max_frame_age']
+
+    def deliver(self):
+        """Decode the grabbed frame, preprocess it and hand it to the detector"""
+        started = time.monotonic()
+        ret, frame = self.camera.retrieve()
+        if not ret:
+            return
+        processed = self.preprocessor.process(frame)
+        if processed is None:
+            self.skipped += 1
+            return
+        display, image, transform, lease = processed
+        self.decode_time = 0.9 * self.decode_time + 0.1 * (time.monotonic() - started)
+
+        self.slots.put(self.camera_index, (display, datetime.now(), (image, transform), lease))
+        self.processed += 1
+        self.last_frame_time = time.monotonic()
+        self.set_active(True)
+
+    def run(self):
+        next_frame = time.monotonic()
+        while not self.stop_event.is_set():
+            if self.camera is None and not self.reconnect():
+                continue
+
+            if not self.camera.grab():
+                self.set_active(False)
+                if self.is_file:
+                    if not self.loop:
+                        break
+                    self.camera.set(cv2.CAP_PROP_POS_FRAMES, 0)  # Reset video if it's a file
+                    self.stop_event.wait(0.1)
+                    next_frame = time.monotonic()
+                else:
+                    # Stream dropped or device unplugged; reopen it with backoff
+                    self.camera.release()
+                    self.camera = None
+                    self.reconnect_at = time.monotonic() + self.backoff
+                continue
+
+            if self.wants_frame():
+                self.deliver()
+            else:
+                self.skipped += 1
+
+            if self.is_file:
+                next_frame += self.frame_interval
+                remaining = next_frame - time.monotonic()
+                if remaining > 0:
+                    self.stop_event.wait(remaining)
+                else:
+                    # Behind schedule: skip the frames there was no time to show
+                    behind = int(-remaining / self.frame_interval)
+                    for _ in range(behind):
+                        if not self.camera.grab():
+                            break
+                        self.skipped += 1
+                    next_frame += behind * self.frame_interval
+
+        if self.camera is not None and self.owns_camera:
+            self.camera.release()
+
+    def stats(self):
+        stats = super().stats()
+        stats.update({
+            'skipped': self.skipped,
+            'reconnects': self.reconnects,
+            'decode_ms': round(self.decode_time * 1000, 2),
+            'staleness_s': (round(time.monotonic() - self.last_frame_time, 2)
+                            if self.last_frame_time is not None else None)
+        })
+        return stats
+
+def run_capture_process(camera_index, source, is_file, ring, inference_ring, messages, stop_event, loop=True):
+    """Entry point of a capture process: decode one source into its shared frame rings"""
+    writer = RingWriter(ring, inference_ring, messages)
+    camera = open_source(source)
+    try:
+        if not camera.isOpened() and not is_live_source(source):
+            writer.status(camera_index, False)
+            return
+        capture = CaptureStage(camera_index, camera if camera.isOpened() else None, is_file, writer, stop_event,
+                               writer.status, loop, source=source)
+        capture.start()
+        # The parent cannot see this stage, so its stats go over the message queue
+        while capture.is_alive():
+            capture.join(timeout=1.0)
+            put_latest(messages, ('stats', camera_index, capture.stats()))
+    finally:
+        camera.release()
+        ring.close()
+        inference_ring.close()
+
+class RingReaderStage(PipelineStage):
+    """Turns frame messages from capture processes into display and inference views.
+
+    Detection reads both images in place in shared memory; the views are
+    read-only, so anything that draws on a frame must copy it first.
+    Frames whose slots were reused before they were read are dropped here;
+    a RingLease lets later stages drop frames whose slots were reused
+    while they were being used. The capture processes also report their
+    CaptureStage stats every second; capture_stats keeps the latest per source.
+    """
+    def __init__(self, rings, inference_rings, messages, slots, stop_event, status_fn=None):
+        super().__init__("ring-reader", stop_event, in_queue=messages)
+        self.rings = rings
+        self.inference_rings = inference_rings
+        self.slots = slots
+        self.status_fn = status_fn
+        self.capture_stats = {}
+
+    def process(self, item):
+        if item[0] == 'status':
+            if self.status_fn is not None:
+                self.status_fn(item[1], item[2])
+            return None
+        if item[0] == 'stats':
+            self.capture_stats[f"capture-{item[1]}"] = item[2]
+            return None
+        _, camera_index, slot, sequence, inference_slot, inference_sequence, transform = item
+        entry = self.rings[camera_index].read(slot, sequence)
+        inference_entry = self.inference_rings[camera_index].read(inference_slot, inference_sequence)
+        if entry is None or inference_entry is None:
+            self.dropped += 1
+            return None
+        frame, _, timestamp = entry
+        image = inference_entry[0]
+        frame.flags.writeable = False
+        image.flags.writeable = False
+        lease = RingLease([(self.rings[camera_index], slot, sequence),
+                           (self.inference_rings[camera_index], inference_slot, inference_sequence)])
+        self.slots.put(camera_index, (frame, datetime.fromtimestamp(timestamp), (image, transform), lease))
+        return None
+
+class DetectStage(PipelineStage):
+    """Runs one batched detector call over the newest frame of every camera.
+
+    detect_fn gets the display frames, camera indices, timestamps and the
+    frames' (inference image, transform) pairs. Inference buffers are
+    released once it returns; each display frame's lease travels on with
+    its result. Results of ring frames overwritten during detection are
+    dropped.
+    """
+    def __init__(self, detect_fn, slots, out_queue, stop_event):
+        super().__init__("detect", stop_event, out_queue=out_queue)
+        self.detect_fn = detect_fn
+        self.slots = slots
+
+    def next_item(self):
+        return self.slots.take_all() or None
+
+    def discard(self, items):
+        for item in items.values():
+            release_item(item)
+
+    def process(self, items):
+        camera_indices = sorted(items)
+        frames = [items[i][0] for i in camera_indices]
+        timestamps = [items[i][1] for i in camera_indices]
+        inference = [items[i][2] for i in camera_indices]
+        try:
+            outputs = self.detect_fn(frames, camera_indices, timestamps, inference)
+        finally:
+            for i in camera_indices:
+                if items[i][3] is not None:
+                    items[i][3].release_inference()
+        leases = {i: items[i][3] for i in camera_indices}
+        results = []
+        for output in outputs:
+            lease = leases.pop(output[0], None)
+            if lease is not None and not lease.is_valid():
+                self.dropped += 1  # The frame was overwritten while it was detected
+                lease.release()
+                continue
+            results.append(output + (lease,))
+        for lease in leases.values():
+            if lease is not None:
+                lease.release()
+        return results
+
+class AnnotateStage(PipelineStage):
+    """Draws detections onto frames"""
+    def __init__(self, annotate_fn, in_queue, out_queue, stop_event):
+        super().__init__("annotate", stop_event, in_queue, out_queue)
+        self.annotate_fn = annotate_fn
+
+    def process(self, item):
+        camera_index, vehicles, frame, lease = item
+        if not frame.flags.writeable:
+            frame = frame.copy()  # Shared-memory view from a capture process
+            if lease is not None and not lease.is_valid():
+                self.dropped += 1  # The slot was reused while it was copied
+                return None
+        return [(camera_index, vehicles, self.annotate_fn(frame, vehicles), lease)]
+
+class RenderStage(PipelineStage):
+    """Hands annotated frames to the display, keeping at most one in flight per camera.
+
+    render_fn gets (camera, vehicles, frame). A frame's buffers are
+    released once the display reports it consumed, or when a newer frame
+    replaces it while waiting.
+    """
+    def __init__(self, render_fn, in_queue, stop_event):
+        super().__init__("render", stop_event, in_queue)
+        self.render_fn = render_fn
+        self.lock = threading.Lock()
+        self.in_flight = {}
+        self.pending = {}
+
+    def process(self, item):
+        camera_index = item[0]
+        with self.lock:
+            if camera_index in self.in_flight:
+                # Display is still busy with an older frame, keep only the newest
+                if camera_index in self.pending:
+                    self.dropped += 1
+                    release_item(self.pending[camera_index])
+                self.pending[camera_index] = item
+                return None
+            self.in_flight[camera_index] = item
+        self.render_fn(*item[:3])
+        return None
+
+    def frame_consumed(self, camera_index):
+        """Called by the display once it has shown a frame for this camera"""
+        with self.lock:
+            shown = self.in_flight.pop(camera_index, None)
+            item = self.pending.pop(camera_index, None)
+            if item is not None:
+                self.in_flight[camera_index] = item
+        if shown is not None:
+            release_item(shown)
+        if item is not None:
+            self.render_fn(*item[:3])
+
+class DetectionPipeline:
+    """Capture -> detect -> annotate -> render pipeline joined by bounded queues.
+
+    The render function is expected to deliver frames to the GUI through a
+    queued Qt signal, so no stage ever touches widgets directly. Without a
+    render function only the capture and detect stages run (headless mode).
+    With capture_processes enabled, file and stream sources are decoded in
+    child processes that hand frames over through shared FrameRings; local
+    devices stay on capture threads since the caller already holds them open.
+
+    With worker_processes enabled in CAMERA_CONFIG and an observe_fn given,
+    decoding and detection move into supervised camera worker processes
+    (see workers.py); observe_fn applies their observations and speeds_fn
+    receives their average speeds and class names. The workers open the
+    sources themselves, so the caller's camera handles are released.
+    """
+    def __init__(self, detect_fn, annotate_fn=None, render_fn=None, status_fn=None, observe_fn=None,
+                 speeds_fn=None):
+        self.detect_fn = detect_fn
+        self.annotate_fn = annotate_fn
+        self.render_fn = render_fn
+        self.status_fn = status_fn
+        self.observe_fn = observe_fn
+        self.speeds_fn = speeds_fn
+        self.supervisor = None
+        self.stop_event = threading.Event()
+        self.slots = None
+        self.stages = []
+        self.render_stage = None
+        self.ring_reader = None
+        self.processes = []
+        self.rings = {}
+        self.inference_rings = {}
+        self.process_stop = None
+
+    def start(self, cameras, sources, loop_files=True):
+        """Start one capture thread per open camera plus the shared stages.
+
+        sources[i] is what cameras[i] was opened from: a device index as a
+        string, a stream URL or a file path. Reconnects and worker
+        processes reopen exactly that source.
+        """
+        self.stop()
+        self.stop_event = threading.Event()
+        self.slots = LatestFrameSlots()
+        # Each detector batch yields one item per camera, so size queues per camera
+        num_cameras = max(1, sum(1 for camera in cameras if camera is not None))
+        queue_size = PIPELINE_CONFIG['queue_size'] * num_cameras
+        annotate_queue = queue.Queue(maxsize=queue_size)
+        render_queue = queue.Queue(maxsize=queue_size)
+
+        out_queue = annotate_queue if self.render_fn is not None else None
+        # Buffers are held while written, waiting in the slot and detected, and with a display
+        # also in either queue, in the annotate stage, and pending or shown by the render stage.
+        # Fewer only means frames are skipped while all are held.
+        pool_size = 3 + (2 * queue_size + 3 if self.render_fn is not None else 0)
+
+        self.stages = []
+        if self.observe_fn is not None and CAMERA_CONFIG['worker_processes']:
+            self.start_workers(cameras, sources, loop_files, num_cameras, out_queue)
+        else:
+            in_process = []
+            for i, camera in enumerate(cameras):
+                if camera is None:
+                    continue
+                if PIPELINE_CONFIG['capture_processes'] and not is_local_device(sources[i]):
+                    in_process.append(i)
+                else:
+                    source = sources[i]
+                    self.stages.append(CaptureStage(i, camera, not is_live_source(source), self.slots,
+                                                    self.stop_event, self.status_fn, loop_files, source=source,
+                                                    pool_size=pool_size))
+            if in_process:
+                self.start_capture_processes(in_process, sources, loop_files, num_cameras)
+            self.stages.append(DetectStage(self.detect_fn, self.slots, out_queue, self.stop_event))
+
+        if self.render_fn is not None:
+            self.render_stage = RenderStage(self.render_fn, render_queue, self.stop_event)
+            self.stages += [
+                AnnotateStage(self.annotate_fn, annotate_queue, render_queue, self.stop_event),
+                self.render_stage
+            ]
+        for stage in self.stages:
+            stage.start()
+        if self.supervisor is not None:
+            self.supervisor.start()
+
+    def start_workers(self, cameras, camera_sources, loop_files, num_cameras, out_queue):
+        from workers import WorkerResultStage, WorkerSupervisor, camera_groups
+
+        active = [i for i, camera in enumerate(cameras) if camera is not None]
+        sources = {}
+        for i in active:
+            cameras[i].release()  # Local devices can only be opened by one process
+            sources[i] = camera_sources[i]
+
+        context = multiprocessing.get_context('spawn')
+        results = context.Queue(maxsize=PIPELINE_CONFIG['queue_size'] * num_cameras * 4)
+        width, height = PIPELINE_CONFIG['display_size']
+        for i in active:
+            self.rings[i] = FrameRing(PIPELINE_CONFIG['ring_slots'], (height, width, 3))
+        self.supervisor = WorkerSupervisor(camera_groups(active), sources, self.rings, results, loop_files,
+                                           self.status_fn)
+        self.stages.append(WorkerResultStage(self.supervisor, self.observe_fn, results, out_queue,
+                                             self.stop_event, self.status_fn, self.speeds_fn))
+
+    def start_capture_processes(self, camera_indices, sources, loop_files, num_cameras):
+        context = multiprocessing.get_context('spawn')
+        self.process_stop = context.Event()
+        messages = context.Queue(maxsize=PIPELINE_CONFIG['queue_size'] * num_cameras * 4)
+        width, height = PIPELINE_CONFIG['display_size']
+        input_size = YOLO_CONFIG['input_size']
+        for i in camera_indices:
+            self.rings[i] = FrameRing(PIPELINE_CONFIG['ring_slots'], (height, width, 3))
+            self.inference_rings[i] = FrameRing(PIPELINE_CONFIG['ring_slots'], (input_size, input_size, 3))
+            process = context.Process(
+                target=run_capture_process, name=f"capture-{i}", daemon=True,
+                args=(i, sources[i], not is_live_source(sources[i]), self.rings[i],
+                      self.inference_rings[i], messages, self.process_stop, loop_files)
+            )
+            process.start()
+            self.processes.append(process)
+        self.ring_reader = RingReaderStage(self.rings, self.inference_rings, messages, self.slots,
+                                           self.stop_event, self.status_fn)
+        self.stages.append(self.ring_reader)
+
+    def stop(self):
+        """Stop all stages and wait for them so cameras can be released safely"""
+        self.stop_event.set()
+        if self.supervisor is not None:
+            self.supervisor.stop()
+            self.supervisor = None
+        if self.process_stop is not None:
+            self.process_stop.set()
+        for process in self.processes:
+            process.join(timeout=2.0)
+            if process.is_alive():
+                process.terminate()
+        for stage in self.stages:
+            stage.join(timeout=2.0)
+        for ring in list(self.rings.values()) + list(self.inference_rings.values()):
+            ring.close()
+            ring.unlink()
+        self.processes = []
+        self.rings = {}
+        self.inference_rings = {}
+        self.process_stop = None
+        self.stages = []
+        self.render_stage = None
+        self.ring_reader = None
+
+    def frame_consumed(self, camera_index):
+        if self.render_stage is not None:
+            self.render_stage.frame_consumed(camera_index)
+
+    def is_running(self):
+        return any(stage.is_alive() for stage in self.stages)
+
+    def captures_running(self):
+        """False once every capture thread and process has finished (non-looping files)"""
+        return (any(stage.is_alive() for stage in self.stages if isinstance(stage, CaptureStage))
+                or any(process.is_alive() for process in self.processes)
+                or (self.supervisor is not None and self.supervisor.is_running()))
+
+    def get_stats(self):
+        """Processed and dropped frame counts per stage, including captures in child processes"""
+        stats = {stage.name: stage.stats() for stage in self.stages}
+        if self.slots is not None:
+            stats['capture_slots'] = {'dropped': self.slots.dropped}
+        if self.ring_reader is not None:
+            stats.update(dict(self.ring_reader.capture_stats))
+        if self.supervisor is not None:
+            stats.update(self.supervisor.get_stats())
+        return stats
@@ -0,0 +1,127 @@
+import threading
+import cv2
+import numpy as np
+from config import PIPELINE_CONFIG, YOLO_CONFIG
+
+class FrameLease:
+    """One pooled display/inference buffer pair, held until the pipeline releases it.
+
+    The detector calls release_inference() once it has read the inference
+    image; whatever uses the display frame last calls release(), which
+    also gives back the inference half if it is still held. Both are
+    idempotent, and the pair returns to the pool once both halves are
+    released. Pool buffers are never written while held, so is_valid() is
+    always True (it matters for ring views, see RingLease).
+    """
+    def __init__(self, preprocessor, index, generation):
+        self.preprocessor = preprocessor
+        self.index = index
+        self.generation = generation
+        self.inference_held = True
+        self.display_held = True
+
+    def is_valid(self):
+        return True
+
+    def release_inference(self):
+        self.preprocessor.release(self, inference=True, display=False)
+
+    def release(self):
+        self.preprocessor.release(self, inference=True, display=True)
+
+class FramePreprocessor:
+    """Turns each decoded BGR frame into an inference image and a display thumbnail.
+
+    The inference image is the frame letterboxed to the detector's square
+    input size and kept in BGR, the order the detectors expect; only the
+    display thumbnail is converted to RGB. Both are written into pools of
+    buffers allocated once per source resolution, so the hot loop
+    allocates nothing. process() hands out a free buffer pair with a
+    FrameLease and writes nothing while every pair is still leased, so
+    pool_size only decides how many frames can be in flight at once:
+    three covers one being written, one waiting and one being consumed.
+
+    process() also returns the transform (pad_x, pad_y, factor) that maps
+    boxes in inference-image pixels to display pixels:
+    display = (inference - pad) * factor.
+    """
+    def __init__(self, input_size=None, display_size=None, pool_size=3):
+        self.input_size = input_size or YOLO_CONFIG['input_size']
+        self.display_size = tuple(display_size or PIPELINE_CONFIG['display_size'])
+        self.pool_size = pool_size
+        self.frame_shape = None
+        self.generation = 0  # Leases from before a reallocation no longer refer to pool buffers
+        self.free = list(range(pool_size))
+        self.lock = threading.Lock()
+
+    def allocate(self, frame_shape):
+        """Size the buffers and the letterbox geometry for frames of this shape"""
+        height, width = frame_shape[:2]
+        size = self.input_size
+        scale = min(size / width, size / height)
+        self.scaled_size = (max(int(round(width * scale)), 1), max(int(round(height * scale)), 1))
+        self.pad = ((size - self.scaled_size[0]) // 2, (size - self.scaled_size[1]) // 2)
+
+        display_width, display_height = self.display_size
+        display_scale = min(display_width / width, display_height / height)
+        self.thumbnail_size = (max(int(width * display_scale), 1), max(int(height * display_scale), 1))
+        self.transform = (self.pad[0], self.pad[1], display_scale / scale)
+
+        # Padding is never written after this, so it only has to be filled once
+        self.inference = np.full((self.pool_size, size, size, 3), 114, dtype=np.uint8)
+        self.display = np.empty((self.pool_size, self.thumbnail_size[1], self.thumbnail_size[0], 3),
+                                dtype=np.uint8)
+        self.scaled = np.empty((self.scaled_size[1], self.scaled_size[0], 3), dtype=np.uint8)
+        self.thumbnail = np.empty_like(self.display[0])
+        self.frame_shape = frame_shape
+        # Buffers still leased belong to the old arrays, which their holders keep alive
+        with self.lock:
+            self.generation += 1
+            self.free = list(range(self.pool_size))
+
+    def has_free(self):
+        """Whether process() has a buffer pair to write the next frame into"""
+        with self.lock:
+            return bool(self.free)
+
+    def release(self, lease, inference, display):
+        with self.lock:
+            if not (lease.inference_held or lease.display_held):
+                return
+            if inference:
+                lease.inference_held = False
+            if display:
+                lease.display_held = False
+            if not (lease.inference_held or lease.display_held) and lease.generation == self.generation:
+                self.free.append(lease.index)
+
+    def process(self, frame):
+        """(display RGB thumbnail, letterboxed BGR inference image, transform, lease) for a BGR frame.
+
+        Returns None, without touching any buffer, while all of them are leased.
+        """
+        if frame.shape != self.frame_shape:
+            self.allocate(frame.shape)
+        with self.lock:
+            if not self.free:
+                return None
+            index = self.free.pop()
+            lease = FrameLease(self, index, self.generation)
+
+        inference = self.inference[index]
+        cv2.resize(frame, self.scaled_size, dst=self.scaled, interpolation=cv2.INTER_LINEAR)
+        pad_x, pad_y = self.pad
+        inference[pad_y:pad_y + self.scaled_size[1], pad_x:pad_x + self.scaled_size[0]] = self.scaled
+
+        display = self.display[index]
+        cv2.resize(frame, self.thumbnail_size, dst=self.thumbnail, interpolation=cv2.INTER_AREA)
+        cv2.cvtColor(self.thumbnail, cv2.COLOR_BGR2RGB, dst=display)
+        return display, inference, self.transform, lease
+
+def to_display_boxes(detections, transform, frame_size):
+    """Map (N, 6) detections from inference-image pixels to a display frame of frame_size, in place"""
+    pad_x, pad_y, factor = transform
+    width, height = frame_size
+    detections[:, [0, 2]] = ((detections[:, [0, 2]] - pad_x) * factor).clip(0, width)
+    detections[:, [1, 3]] = ((detections[:, [1, 3]] - pad_y) * factor).clip(0, height)
+    return detections
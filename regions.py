@@ -0,0 +1,116 @@
+import json
+import os
+import cv2
+import numpy as np
+from config import REGION_CONFIG
+
+def default_regions():
+    """The original split: the top half of the frame is NS traffic, the bottom half EW.
+
+    NS vehicles are counted crossing the horizontal center line and EW
+    vehicles crossing the vertical one.
+    """
+    return {
+        'image_size': (2, 2),
+        'approaches': {
+            'NS': [[0, 0], [2, 0], [2, 1], [0, 1]],
+            'EW': [[0, 1], [2, 1], [2, 2], [0, 2]]
+        },
+        'stop_lines': {
+            'NS': [[0, 1], [2, 1]],
+            'EW': [[1, 0], [1, 2]]
+        }
+    }
+
+def load_regions(path=None):
+    """Load per-camera approach polygons from a JSON file.
+
+    Each camera index maps to the frame size the points refer to and a
+    polygon (list of [x, y] pixels) per approach name, plus an optional stop
+    line (two [x, y] points) per approach for crossing counts. Approach
+    names are signal plan approaches (N, S, E, W) or the NS/EW direction
+    groups. See regions.example.json.
+    """
+    path = path or REGION_CONFIG['path']
+    if not os.path.exists(path):
+        return {}
+    try:
+        with open(path) as f:
+            raw = json.load(f)
+    except Exception as e:
+        print(f"Region loading error: {str(e)}")
+        return {}
+
+    regions = {}
+    for camera, entry in raw.items():
+        polygons = entry.get('approaches', {})
+        if not polygons or any(len(points) < 3 for points in polygons.values()):
+            print(f"Regions for camera {camera} need at least 3 points per approach")
+            continue
+        stop_lines = entry.get('stop_lines', {})
+        if any(name not in polygons or len(points) != 2 for name, points in stop_lines.items()):
+            print(f"Stop lines for camera {camera} need two points and a matching approach")
+            continue
+        regions[int(camera)] = {
+            'image_size': tuple(entry.get('image_size', REGION_CONFIG['image_size'])),
+            'approaches': polygons,
+            'stop_lines': stop_lines
+        }
+    return regions
+
+class ApproachMap:
+    """Approach polygons of one camera rasterized into an integer label mask.
+
+    Label 0 is outside every polygon and label k is approach k-1; where
+    polygons overlap the later one wins. A mask is built once per frame size,
+    after which assigning N points is a single fancy-index lookup.
+    """
+    def __init__(self, regions=None):
+        regions = regions or default_regions()
+        self.image_size = tuple(regions['image_size'])
+        self.names = list(regions['approaches'])
+        self.polygons = [np.asarray(points, dtype=np.float64) for points in regions['approaches'].values()]
+        stop_lines = regions.get('stop_lines', {})
+        self.line_points = np.asarray(list(stop_lines.values()), dtype=np.float64).reshape(-1, 2, 2)
+        self.line_approaches = np.array([self.names.index(name) for name in stop_lines], dtype=np.int64)
+        self.masks = {}
+        self.scaled_lines = {}
+
+    def __len__(self):
+        return len(self.names)
+
+    def mask(self, frame_size):
+        """uint8 label mask for frames of (width, height)"""
+        mask = self.masks.get(frame_size)
+        if mask is None:
+            width, height = frame_size
+            scale = np.array([width / self.image_size[0], height / self.image_size[1]])
+            mask = np.zeros((height, width), dtype=np.uint8)
+            for label, polygon in enumerate(self.polygons, start=1):
+                cv2.fillPoly(mask, [np.round(polygon * scale).astype(np.int32)], label)
+            self.masks[frame_size] = mask
+        return mask
+
+    def stop_lines(self, frame_size):
+        """(L, 2, 2) stop line end points in pixels of frames of (width, height)"""
+        lines = self.scaled_lines.get(frame_size)
+        if lines is None:
+            scale = np.array([frame_size[0] / self.image_size[0], frame_size[1] / self.image_size[1]])
+            lines = self.scaled_lines[frame_size] = self.line_points * scale
+        return lines
+
+    def labels(self, points, frame_size):
+        """Label of the region under each (x, y) point"""
+        mask = self.mask(frame_size)
+        points = np.asarray(points).reshape(-1, 2)
+        x = np.clip(points[:, 0].astype(np.int64), 0, mask.shape[1] - 1)
+        y = np.clip(points[:, 1].astype(np.int64), 0, mask.shape[0] - 1)
+        return mask[y, x]
+
+    def approach_stats(self, labels, speeds, queue_speed=None):
+        """Vehicles and queued (slower than queue_speed km/h) vehicles per approach"""
+        queue_speed = REGION_CONFIG['queue_speed'] if queue_speed is None else queue_speed
+        size = len(self.names) + 1
+        counts = np.bincount(labels, minlength=size)[1:]
+        queues = np.bincount(labels, weights=np.asarray(speeds) < queue_speed, minlength=size)[1:]
+        return counts, queues.astype(np.int64)
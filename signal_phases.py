@@ -1,13 +1,22 @@
 from enum import Enum
 from dataclasses import dataclass
-from typing import Dict, List
+from typing import Dict, List, Union
+import json
+import os
+import numpy as np
+from config import PHASE_PLAN_CONFIG
+from signal_policies import create_policy
 
 class SignalState(Enum):
     RED = "RED"
     YELLOW = "YELLOW"
     GREEN = "GREEN"
 
-class PhaseType(Enum):
+# Integer codes used in the compiled state tables
+STATE_CODES = (SignalState.RED, SignalState.YELLOW, SignalState.GREEN)
+RED, YELLOW, GREEN = range(3)
+
+class PhaseType(str, Enum):
     NS = "NS"  # North-South
     EW = "EW"  # East-West
 
@@ -18,58 +27,156 @@ class PhaseConfig:
     min_duration: int
     max_duration: int
 
+def default_phase_plan():
+    """The built-in two-phase NS/EW plan: signal heads N, S, E, W serving their own approach"""
+    return {
+        'yellow_duration': 3,
+        'signals': {'N': 'N', 'S': 'S', 'E': 'E', 'W': 'W'},
+        'phases': [
+            {'name': PhaseType.NS.value, 'green': ['N', 'S'], 'duration': 30, 'min_duration': 10, 'max_duration': 60},
+            {'name': PhaseType.EW.value, 'green': ['E', 'W'], 'duration': 30, 'min_duration': 10, 'max_duration': 60}
+        ]
+    }
+
+def load_phase_plan(path=None):
+    """Load a phase plan from a JSON file, falling back to the default plan.
+
+    A plan lists its signal heads, each mapped to the approach whose vehicles
+    it releases (null for pedestrian heads), and its phases in cycle order,
+    each naming the heads that are green; every other head is red. See
+    phase_plan.example.json.
+    """
+    path = path or PHASE_PLAN_CONFIG['path']
+    if not os.path.exists(path):
+        return default_phase_plan()
+    try:
+        with open(path) as f:
+            plan = json.load(f)
+    except Exception as e:
+        print(f"Phase plan loading error: {str(e)}")
+        return default_phase_plan()
+
+    signals = plan.get('signals', {})
+    for phase in plan.get('phases', []):
+        unknown = set(phase.get('green', [])) - set(signals)
+        if unknown:
+            print(f"Phase {phase.get('name')} uses unknown signal heads {sorted(unknown)}")
+            return default_phase_plan()
+    if not plan.get('phases'):
+        print(f"Phase plan {path} has no phases")
+        return default_phase_plan()
+    return plan
+
 class SignalPhaseManager:
-    def __init__(self):
-        self.yellow_duration = 3
+    def __init__(self, plan=None):
+        plan = plan or load_phase_plan()
+        self.yellow_duration = plan.get('yellow_duration', 3)
+        # Signal head -> approach it serves (None for pedestrian heads)
+        self.signal_approaches = dict(plan['signals'])
         self.phase_patterns = {
-            PhaseType.NS: PhaseConfig(
-                states={
-                    'N': SignalState.GREEN,
-                    'S': SignalState.GREEN,
-                    'E': SignalState.RED,
-                    'W': SignalState.RED
-                },
-                duration=30,
-                min_duration=10,
-                max_duration=60
-            ),
-            PhaseType.EW: PhaseConfig(
+            phase['name']: PhaseConfig(
                 states={
-                    'N': SignalState.RED,
-                    'S': SignalState.RED,
-                    'E': SignalState.GREEN,
-                    'W': SignalState.GREEN
+                    signal: SignalState.GREEN if signal in phase['green'] else SignalState.RED
+                    for signal in self.signal_approaches
                 },
-                duration=30,
-                min_duration=10,
-                max_duration=60
+                duration=phase['duration'],
+                min_duration=phase.get('min_duration', phase['duration']),
+                max_duration=phase.get('max_duration', phase['duration'])
             )
+            for phase in plan['phases']
         }
-        
-    def get_transition_states(self, from_phase: PhaseType) -> Dict[str, SignalState]:
-        """Get transition states (yellow lights) when changing from given phase"""
-        states = {}
-        current_config = self.phase_patterns[from_phase].states
-        
-        for direction, state in current_config.items():
-            states[direction] = SignalState.YELLOW if state == SignalState.GREEN else SignalState.RED
-            
-        return states
-        
-    def get_phase_states(self, phase: PhaseType) -> Dict[str, SignalState]:
-        """Get signal states for a given phase"""
-        return self.phase_patterns[phase].states
-
-    def calculate_optimal_duration(self, phase: PhaseType, traffic_density: float) -> int:
+
+        self.build_tables()
+        self.policy = create_policy(num_phases=len(self.phase_order))
+
+    def build_tables(self):
+        """Compile phase_patterns into integer-indexed tables for vectorized controllers.
+
+        state_table[p, s] is the state code of signal head s during phase p
+        and transition_table[p, s] during the yellow interval that ends it;
+        serves_table[p, a] marks the approaches whose vehicles phase p
+        releases. Call again after editing phase_patterns.
+        """
+        self.phase_order = list(self.phase_patterns)
+        self.phase_index = {phase: index for index, phase in enumerate(self.phase_order)}
+        self.signal_names = list(self.signal_approaches)
+        self.approaches = list(dict.fromkeys(
+            approach for approach in self.signal_approaches.values() if approach is not None))
+        self.approach_index = {approach: index for index, approach in enumerate(self.approaches)}
+
+        self.duration_table = np.array([
+            [config.duration, config.min_duration, config.max_duration]
+            for config in self.phase_patterns.values()
+        ], dtype=np.float64)
+
+        self.state_table = np.array([
+            [STATE_CODES.index(config.states.get(signal, SignalState.RED)) for signal in self.signal_names]
+            for config in self.phase_patterns.values()
+        ], dtype=np.int8).reshape(len(self.phase_order), len(self.signal_names))
+        self.transition_table = np.where(self.state_table == GREEN, YELLOW, RED).astype(np.int8)
+
+        self.serves_table = np.zeros((len(self.phase_order), len(self.approaches)), dtype=np.float32)
+        for signal_index, signal in enumerate(self.signal_names):
+            approach = self.signal_approaches[signal]
+            if approach is not None:
+                green = self.state_table[:, signal_index] == GREEN
+                self.serves_table[green, self.approach_index[approach]] = 1
+
+        # Callers get views of the tables; keep them from being edited in place
+        for table in (self.state_table, self.transition_table, self.serves_table):
+            table.flags.writeable = False
+
+    def set_policy(self, policy):
+        """Switch the rule that decides green durations (see signal_policies)"""
+        self.policy = policy
+
+    def phase_duration(self, phase_index: int, counts: List[float]) -> float:
+        """Green duration chosen by the policy for one intersection"""
+        return self.policy.duration(self, phase_index, counts)
+
+    def phase_durations(self, phase_indices: np.ndarray, counts: np.ndarray) -> np.ndarray:
+        """Green durations chosen by the policy for many intersections"""
+        return self.policy.durations(self, phase_indices, counts)
+
+    def phase_counts(self, approach_counts: Dict[str, float]) -> np.ndarray:
+        """Vehicles served by each phase, from vehicle counts per approach"""
+        vector = np.zeros(len(self.approaches), dtype=np.float32)
+        for approach, count in approach_counts.items():
+            index = self.approach_index.get(approach)
+            if index is not None:
+                vector[index] = count
+        return self.serves_table @ vector
+
+    def _index(self, phase: Union[int, str]) -> int:
+        return phase if isinstance(phase, (int, np.integer)) else self.phase_index[phase]
+
+    def get_transition_states(self, from_phase: Union[int, str]) -> np.ndarray:
+        """State codes of every signal head (see signal_names) while leaving a phase"""
+        return self.transition_table[self._index(from_phase)]
+
+    def get_phase_states(self, phase: Union[int, str]) -> np.ndarray:
+        """State codes of every signal head (see signal_names) during a phase"""
+        return self.state_table[self._index(phase)]
+
+    def state_dict(self, codes: np.ndarray) -> Dict[str, SignalState]:
+        """Signal head -> SignalState for a row of state codes"""
+        return {signal: STATE_CODES[code] for signal, code in zip(self.signal_names, codes.tolist())}
+
+    def calculate_optimal_duration(self, phase: Union[int, str], traffic_density: float) -> int:
         """Calculate optimal phase duration based on traffic density"""
-        base_duration = self.phase_patterns[phase].duration
-        config = self.phase_patterns[phase]
-        
+        base_duration, min_duration, max_duration = self.duration_table[self._index(phase)].tolist()
+
         if traffic_density > 0.8:
             duration = base_duration * 1.5
         elif traffic_density > 0.4:
             duration = base_duration * 1.2
         else:
             duration = base_duration
-            
-        return min(max(duration, config.min_duration), config.max_duration)
+
+        return min(max(duration, min_duration), max_duration)
+
+    def calculate_optimal_durations(self, phase_indices: np.ndarray, traffic_density: np.ndarray) -> np.ndarray:
+        """Vectorized calculate_optimal_duration for many intersections at once"""
+        base, min_duration, max_duration = self.duration_table[phase_indices].T
+        factor = np.where(traffic_density > 0.8, 1.5, np.where(traffic_density > 0.4, 1.2, 1.0))
+        return np.clip(base * factor, min_duration, max_duration)
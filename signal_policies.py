@@ -0,0 +1,198 @@
+import bisect
+import os
+import numpy as np
+from config import SIGNAL_POLICY_CONFIG
+
+class SignalPolicy:
+    """Decides how long the current green phase of an intersection lasts.
+
+    durations() answers for many intersections at once from their phase
+    indices and (N, num_phases) per-phase vehicle counts; duration() is the
+    scalar form used by the event scheduler. Results are clipped to the
+    PhaseConfig min/max bounds. A reactive policy is re-evaluated whenever
+    counts change mid-phase; otherwise the duration is fixed at phase start.
+    """
+    reactive = True
+
+    def durations(self, manager, phase_indices, counts):
+        raise NotImplementedError
+
+    def duration(self, manager, phase_index, counts):
+        phase_indices = np.array([phase_index], dtype=np.int64)
+        return float(self.durations(manager, phase_indices, np.asarray([counts], dtype=np.float32))[0])
+
+class DensityPolicy(SignalPolicy):
+    """Original rule: stretch the base duration by the current phase's share of traffic"""
+    def durations(self, manager, phase_indices, counts):
+        rows = np.arange(len(phase_indices))
+        total = counts.sum(axis=1)
+        density = np.where(total > 0, counts[rows, phase_indices] / np.maximum(total, 1e-9), 0.5)
+        return manager.calculate_optimal_durations(phase_indices, density)
+
+    def duration(self, manager, phase_index, counts):
+        total = sum(counts)
+        density = counts[phase_index] / total if total > 0 else 0.5
+        return manager.calculate_optimal_duration(phase_index, density)
+
+class WebsterPolicy(SignalPolicy):
+    """Webster cycle length and green split from per-phase flow ratios.
+
+    Each phase's count is read as the demand arriving over one base cycle,
+    so its flow ratio is count / (saturation_flow * base cycle). The cycle is
+    C = (1.5 L + 5) / (1 - Y) for total lost time L and critical ratio sum Y,
+    and the effective green C - L is split in proportion to the ratios.
+    """
+    def __init__(self, saturation_flow=None, lost_time=None, max_flow_ratio=None, max_cycle=None):
+        self.saturation_flow = saturation_flow or SIGNAL_POLICY_CONFIG['saturation_flow']
+        self.lost_time = SIGNAL_POLICY_CONFIG['lost_time'] if lost_time is None else lost_time
+        self.max_flow_ratio = max_flow_ratio or SIGNAL_POLICY_CONFIG['max_flow_ratio']
+        self.max_cycle = max_cycle or SIGNAL_POLICY_CONFIG['max_cycle']
+
+    def _cycle_terms(self, manager):
+        num_phases = len(manager.duration_table)
+        base_cycle = manager.duration_table[:, 0].sum() + num_phases * manager.yellow_duration
+        return self.saturation_flow * base_cycle, num_phases * self.lost_time
+
+    def durations(self, manager, phase_indices, counts):
+        capacity, lost = self._cycle_terms(manager)
+        base, min_duration, max_duration = manager.duration_table[phase_indices].T
+        rows = np.arange(len(phase_indices))
+
+        ratios = counts / capacity
+        total = np.minimum(ratios.sum(axis=1), self.max_flow_ratio)
+        cycle = np.minimum((1.5 * lost + 5) / (1 - total), self.max_cycle)
+        share = ratios[rows, phase_indices] / np.maximum(ratios.sum(axis=1), 1e-9)
+        green = np.where(total > 0, (cycle - lost) * share, base)
+        return np.clip(green, min_duration, max_duration)
+
+    def duration(self, manager, phase_index, counts):
+        capacity, lost = self._cycle_terms(manager)
+        base, min_duration, max_duration = manager.duration_table[phase_index].tolist()
+        demand = sum(counts)
+        if demand <= 0:
+            return min(max(base, min_duration), max_duration)
+        total = min(demand / capacity, self.max_flow_ratio)
+        cycle = min((1.5 * lost + 5) / (1 - total), self.max_cycle)
+        green = (cycle - lost) * counts[phase_index] / demand
+        return min(max(green, min_duration), max_duration)
+
+class MaxPressurePolicy(SignalPolicy):
+    """Hold green while the current phase has the largest queue, else yield at the minimum.
+
+    Pressure is the waiting count of each phase (no downstream counts are
+    observed). The current phase runs up to max_duration while no other phase
+    exceeds it by more than margin vehicles, and ends as soon as min_duration
+    allows once one does; phases still advance in plan order.
+    """
+    def __init__(self, margin=None):
+        self.margin = SIGNAL_POLICY_CONFIG['pressure_margin'] if margin is None else margin
+
+    def durations(self, manager, phase_indices, counts):
+        _, min_duration, max_duration = manager.duration_table[phase_indices].T
+        rows = np.arange(len(phase_indices))
+        current = counts[rows, phase_indices]
+        others = counts.copy()
+        others[rows, phase_indices] = -np.inf
+        hold = current + self.margin >= others.max(axis=1)
+        return np.where(hold, max_duration, min_duration)
+
+    def duration(self, manager, phase_index, counts):
+        _, min_duration, max_duration = manager.duration_table[phase_index].tolist()
+        current = counts[phase_index]
+        others = max((count for i, count in enumerate(counts) if i != phase_index), default=current)
+        return max_duration if current + self.margin >= others else min_duration
+
+class QLearningPolicy(SignalPolicy):
+    """Tabular Q-learning over discretised queues, trained offline in the simulator.
+
+    The state is (phase, bin of its own queue, bin of the longest competing
+    queue) and each action picks one of duration_levels evenly spaced
+    durations between the phase's min and max. The table is tiny, so a
+    decision is one lookup and an argmax. Decisions are taken once at phase
+    start; see simulator.train_q_policy for the training loop.
+    """
+    reactive = False
+
+    def __init__(self, num_phases, queue_bins=None, duration_levels=None, q_table=None,
+                 exploration=0.0, seed=None):
+        self.queue_bins = np.asarray(queue_bins or SIGNAL_POLICY_CONFIG['queue_bins'], dtype=np.float32)
+        self.bin_edges = self.queue_bins.tolist()
+        self.num_bins = len(self.queue_bins) + 1
+        self.levels = np.linspace(0.0, 1.0, duration_levels or SIGNAL_POLICY_CONFIG['duration_levels'])
+        self.num_phases = num_phases
+        self.exploration = exploration
+        self.rng = np.random.default_rng(seed)
+        self.q_table = (np.zeros((num_phases * self.num_bins ** 2, len(self.levels)), dtype=np.float64)
+                        if q_table is None else np.asarray(q_table, dtype=np.float64))
+        self.last_decision = None  # (state, action) of the latest scalar decision
+
+    def state_index(self, phase_index, own_queue, other_queue):
+        own = np.searchsorted(self.queue_bins, own_queue, side='right')
+        other = np.searchsorted(self.queue_bins, other_queue, side='right')
+        return (phase_index * self.num_bins + own) * self.num_bins + other
+
+    def _durations_for(self, manager, phase_indices, actions):
+        _, min_duration, max_duration = manager.duration_table[phase_indices].T
+        return min_duration + self.levels[actions] * (max_duration - min_duration)
+
+    def durations(self, manager, phase_indices, counts):
+        rows = np.arange(len(phase_indices))
+        own = counts[rows, phase_indices]
+        others = counts.copy()
+        others[rows, phase_indices] = 0
+        states = self.state_index(phase_indices, own, others.max(axis=1) if counts.shape[1] > 1 else 0)
+        actions = self.q_table[states].argmax(axis=1)
+        return self._durations_for(manager, phase_indices, actions)
+
+    def duration(self, manager, phase_index, counts):
+        own = counts[phase_index]
+        other = max((count for i, count in enumerate(counts) if i != phase_index), default=0)
+        state = ((phase_index * self.num_bins + bisect.bisect_right(self.bin_edges, own)) * self.num_bins
+                 + bisect.bisect_right(self.bin_edges, other))
+        if self.exploration > 0 and self.rng.random() < self.exploration:
+            action = int(self.rng.integers(len(self.levels)))
+        else:
+            action = int(self.q_table[state].argmax())
+        self.last_decision = (state, action)
+        _, min_duration, max_duration = manager.duration_table[phase_index].tolist()
+        return min_duration + float(self.levels[action]) * (max_duration - min_duration)
+
+    def learn(self, state, action, reward, next_state, learning_rate=0.1, discount=0.9):
+        """One Q-learning update for a decision that earned reward before next_state"""
+        target = reward + discount * self.q_table[next_state].max()
+        self.q_table[state, action] += learning_rate * (target - self.q_table[state, action])
+
+    def save(self, path=None):
+        path = path or SIGNAL_POLICY_CONFIG['q_table_path']
+        np.savez(path, q_table=self.q_table, queue_bins=self.queue_bins, levels=self.levels)
+
+    @classmethod
+    def load(cls, num_phases, path=None):
+        """Policy with a saved table, or an untrained one if the file is missing"""
+        path = path or SIGNAL_POLICY_CONFIG['q_table_path']
+        if not os.path.exists(path):
+            return cls(num_phases)
+        try:
+            with np.load(path) as data:
+                policy = cls(num_phases, queue_bins=data['queue_bins'].tolist(),
+                             duration_levels=len(data['levels']), q_table=data['q_table'])
+            if len(policy.q_table) != num_phases * policy.num_bins ** 2:
+                print(f"Q-table in {path} was trained for a different phase plan")
+                return cls(num_phases)
+            return policy
+        except Exception as e:
+            print(f"Q-table loading error: {str(e)}")
+            return cls(num_phases)
+
+def create_policy(name=None, num_phases=2):
+    """Build a policy by its SIGNAL_POLICY_CONFIG name"""
+    name = name or SIGNAL_POLICY_CONFIG['policy']
+    if name == 'density':
+        return DensityPolicy()
+    if name == 'webster':
+        return WebsterPolicy()
+    if name == 'max_pressure':
+        return MaxPressurePolicy()
+    if name == 'q_learning':
+        return QLearningPolicy.load(num_phases)
+    raise ValueError(f"Unknown signal policy: {name}")
@@ -0,0 +1,224 @@
+import argparse
+import bisect
+import time
+import numpy as np
+from config import SIMULATION_CONFIG
+from signal_phases import SignalPhaseManager
+from signal_policies import DensityPolicy, WebsterPolicy, MaxPressurePolicy, QLearningPolicy
+from traffic_signal import SignalControllerRegistry, SignalScheduler
+
+APPROACHES = ('N', 'S', 'E', 'W')
+
+def poisson_arrivals(rates, duration, interval=3600.0, seed=None):
+    """Arrival times (seconds) per approach from piecewise-constant Poisson rates.
+
+    rates maps an approach to vehicles per second, either one value or an
+    array with one rate per `interval` seconds (e.g. an hourly profile that
+    repeats over the duration).
+    """
+    rng = np.random.default_rng(seed)
+    num_intervals = int(np.ceil(duration / interval))
+    arrivals = {}
+    for approach, rate in rates.items():
+        profile = np.resize(np.atleast_1d(np.asarray(rate, dtype=np.float64)), num_intervals)
+        counts = rng.poisson(profile * interval)
+        starts = np.repeat(np.arange(num_intervals) * interval, counts)
+        times = np.sort(starts + rng.uniform(0, interval, counts.sum()))
+        arrivals[approach] = times[times < duration]
+    return arrivals
+
+def load_arrivals(path):
+    """Recorded arrival streams saved with np.savez(path, N=..., S=..., E=..., W=...)"""
+    with np.load(path) as data:
+        return {approach: np.sort(data[approach].astype(np.float64)) for approach in data.files}
+
+class IntersectionSimulator:
+    """Discrete-event simulation of one intersection on a simulated clock.
+
+    Vehicles queue per approach and discharge at the saturation headway
+    while their approach is green (yellow counts as lost time). Every
+    observe_interval the queue lengths are fed to the real SignalScheduler
+    and SignalControllerRegistry, exactly as the camera counts would be,
+    and the clock jumps straight to the next observation or switch deadline.
+    """
+    def __init__(self, arrivals, configure=None, saturation_headway=None, observe_interval=None):
+        self.arrivals = {approach: np.asarray(arrivals.get(approach, []), dtype=np.float64).tolist()
+                         for approach in APPROACHES}
+        self.headway = saturation_headway or SIMULATION_CONFIG['saturation_headway']
+        self.observe_interval = observe_interval or SIMULATION_CONFIG['observe_interval']
+
+        self.registry = SignalControllerRegistry()
+        if configure is not None:
+            configure(self.registry.phase_manager)
+        self.registry.add_intersections([1], now=0.0)
+        self.scheduler = SignalScheduler(self.registry)
+
+        # Which approaches discharge in each phase of the plan
+        manager = self.registry.phase_manager
+        self.green_approaches = [
+            [approach for approach in APPROACHES
+             if approach in manager.approach_index and serves[manager.approach_index[approach]]]
+            for serves in manager.serves_table
+        ]
+
+    def run(self, duration, observer=None):
+        """Simulate `duration` seconds and return the performance metrics.
+
+        observer, if given, is called after every step with the step end
+        time, its length, the total queue and the switch events applied.
+        """
+        served = {approach: 0 for approach in APPROACHES}
+        next_free = {approach: 0.0 for approach in APPROACHES}  # Earliest next departure
+        total_delay = 0.0
+        queue_area = 0.0
+        max_queue = 0
+        switches = 0
+
+        now = 0.0
+        while now < duration:
+            deadline = self.scheduler.next_deadline()
+            step_end = min(now + self.observe_interval, duration)
+            if deadline is not None and deadline < step_end:
+                step_end = max(deadline, now)
+
+            index = 0
+            green = [] if self.registry.is_transitioning[index] else self.green_approaches[self.registry.phase[index]]
+
+            # Discharge queued and arriving vehicles on green approaches
+            for approach in green:
+                times = self.arrivals[approach]
+                k = served[approach]
+                depart = max(next_free[approach], now)
+                while k < len(times):
+                    departure = max(depart, times[k])
+                    if departure >= step_end:
+                        break
+                    total_delay += departure - times[k]
+                    depart = departure + self.headway
+                    k += 1
+                served[approach] = k
+                next_free[approach] = depart
+
+            # Observe queues at the end of the step and feed the controller
+            queues = {
+                approach: bisect.bisect_left(self.arrivals[approach], step_end) - served[approach]
+                for approach in APPROACHES
+            }
+            total_queue = sum(queues.values())
+            queue_area += total_queue * (step_end - now)
+            max_queue = max(max_queue, total_queue)
+
+            self.scheduler.update_approach_counts(1, queues)
+            events = self.scheduler.run_due(step_end)
+            switches += len(events)
+            if observer is not None:
+                observer(step_end, step_end - now, total_queue, events)
+            now = step_end
+
+        throughput = sum(served.values())
+        # Vehicles still waiting have been delayed until the end of the run
+        for approach in APPROACHES:
+            for arrival in self.arrivals[approach][served[approach]:bisect.bisect_left(self.arrivals[approach], duration)]:
+                total_delay += duration - arrival
+        arrived = sum(bisect.bisect_left(self.arrivals[approach], duration) for approach in APPROACHES)
+
+        return {
+            'vehicles': arrived,
+            'throughput': throughput,
+            'throughput_per_hour': throughput / duration * 3600,
+            'average_delay': total_delay / max(arrived, 1),
+            'average_queue': queue_area / duration,
+            'max_queue': max_queue,
+            'switches': switches
+        }
+
+def fixed_time(phase_manager):
+    """Baseline policy: every phase always runs its base duration"""
+    for config in phase_manager.phase_patterns.values():
+        config.min_duration = config.max_duration = config.duration
+    phase_manager.build_tables()
+
+def use_policy(factory):
+    """Configure callable that installs a fresh policy built by factory(phase_manager)"""
+    def configure(phase_manager):
+        phase_manager.set_policy(factory(phase_manager))
+    return configure
+
+POLICIES = {
+    'adaptive': use_policy(lambda manager: DensityPolicy()),
+    'fixed': fixed_time,
+    'webster': use_policy(lambda manager: WebsterPolicy()),
+    'max_pressure': use_policy(lambda manager: MaxPressurePolicy()),
+    'q_learning': use_policy(lambda manager: QLearningPolicy.load(len(manager.phase_order)))
+}
+
+def train_q_policy(policy, arrivals, duration, episodes=10, exploration=0.1,
+                   learning_rate=0.1, discount=0.9):
+    """Train a QLearningPolicy in place by replaying the arrivals episodes times.
+
+    Every green start closes the previous decision; its reward is minus the
+    queue-seconds accumulated while it was in force, in vehicle-hours.
+    Exploration is switched off again when training ends.
+    """
+    for _ in range(episodes):
+        policy.exploration = exploration
+        simulator = IntersectionSimulator(arrivals, use_policy(lambda manager: policy))
+        state = {'decision': policy.last_decision, 'cost': 0.0}
+
+        def observe(now, elapsed, total_queue, events):
+            state['cost'] += total_queue * elapsed
+            if not any(event == 'green' for _, event in events):
+                return
+            decision = policy.last_decision
+            if state['decision'] is not None:
+                previous_state, previous_action = state['decision']
+                policy.learn(previous_state, previous_action, -state['cost'] / 3600, decision[0],
+                             learning_rate, discount)
+            state['decision'] = decision
+            state['cost'] = 0.0
+
+        simulator.run(duration, observer=observe)
+    policy.exploration = 0.0
+    return policy
+
+def benchmark(arrivals, duration, policies=None):
+    """Run every policy on the same arrivals; returns {name: metrics}"""
+    results = {}
+    for name, configure in (policies or POLICIES).items():
+        started = time.perf_counter()
+        results[name] = IntersectionSimulator(arrivals, configure).run(duration)
+        results[name]['wall_time'] = time.perf_counter() - started
+    return results
+
+def main():
+    parser = argparse.ArgumentParser(description='Benchmark signal policies on simulated traffic')
+    parser.add_argument('--hours', type=float, default=168, help='Simulated duration in hours')
+    parser.add_argument('--ns-rate', type=float, default=0.12, help='Arrivals per second on N and S')
+    parser.add_argument('--ew-rate', type=float, default=0.08, help='Arrivals per second on E and W')
+    parser.add_argument('--arrivals', help='NPZ file of recorded arrival times per approach')
+    parser.add_argument('--seed', type=int, default=0)
+    parser.add_argument('--train-q', type=int, metavar='EPISODES',
+                        help='Train the Q-learning policy on these arrivals first and save its table')
+    args = parser.parse_args()
+
+    duration = args.hours * 3600
+    if args.arrivals:
+        arrivals = load_arrivals(args.arrivals)
+    else:
+        arrivals = poisson_arrivals(
+            {'N': args.ns_rate, 'S': args.ns_rate, 'E': args.ew_rate, 'W': args.ew_rate},
+            duration, seed=args.seed
+        )
+
+    if args.train_q:
+        policy = train_q_policy(QLearningPolicy(len(SignalPhaseManager().phase_order)), arrivals, duration, episodes=args.train_q)
+        policy.save()
+
+    print(f"{'policy':<14}{'vehicles':>10}{'veh/h':>10}{'delay s':>10}{'queue':>10}{'max q':>8}{'wall s':>8}")
+    for name, metrics in benchmark(arrivals, duration).items():
+        print(f"{name:<14}{metrics['vehicles']:>10}{metrics['throughput_per_hour']:>10.1f}"
+              f"{metrics['average_delay']:>10.1f}{metrics['average_queue']:>10.2f}"
+              f"{metrics['max_queue']:>8}{metrics['wall_time']:>8.2f}")
+
+if __name__ == "__main__":
+    main()
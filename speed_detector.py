@@ -1,54 +1,262 @@
 import numpy as np
 import cv2
+import json
+import os
 from datetime import datetime
+from config import SPEED_CONFIG, CALIBRATION_CONFIG
+
+def load_calibrations(path=None):
+    """Load per-camera ground-plane homographies from a JSON file.
+
+    Each entry maps a camera index to four image points (pixels, in a frame of
+    image_size) and the matching road-plane points in meters. Returns
+    {camera_index: {'homography': 3x3 array, 'image_size': (w, h)}}.
+    """
+    path = path or CALIBRATION_CONFIG['path']
+    if not os.path.exists(path):
+        return {}
+    try:
+        with open(path) as f:
+            raw = json.load(f)
+    except Exception as e:
+        print(f"Calibration loading error: {str(e)}")
+        return {}
+
+    calibrations = {}
+    for camera, entry in raw.items():
+        image_points = np.array(entry['image_points'], dtype=np.float32)
+        world_points = np.array(entry['world_points'], dtype=np.float32)
+        if image_points.shape != (4, 2) or world_points.shape != (4, 2):
+            print(f"Calibration for camera {camera} needs exactly 4 image and 4 world points")
+            continue
+        calibrations[int(camera)] = {
+            'homography': cv2.getPerspectiveTransform(image_points, world_points),
+            'image_size': tuple(entry.get('image_size', CALIBRATION_CONFIG['image_size']))
+        }
+    return calibrations
 
 class SpeedDetector:
-    def __init__(self, distance_calibration=10.0):  # meters per 100 pixels
-        self.tracked_objects = {}
+    def __init__(self, distance_calibration=10.0, history_length=None, max_tracks=None, track_timeout=None,
+                 calibrations=None):  # meters per 100 pixels
         self.distance_calibration = distance_calibration
-        
+        # Cameras with a homography measure speed on the road plane in meters
+        self.calibrations = load_calibrations() if calibrations is None else calibrations
+        self.scaled_homographies = {}
+        self.history_length = history_length or SPEED_CONFIG['history_length']
+        self.max_tracks = max_tracks or SPEED_CONFIG['max_tracks']
+        self.track_timeout = track_timeout or SPEED_CONFIG['track_timeout']
+
+        # Fixed-size ring buffer of centers and times per track slot
+        self.positions = np.zeros((self.max_tracks, self.history_length, 2), dtype=np.float32)
+        self.times = np.zeros((self.max_tracks, self.history_length), dtype=np.float64)
+        self.sample_counts = np.zeros(self.max_tracks, dtype=np.int64)
+        self.last_seen = np.zeros(self.max_tracks, dtype=np.float64)
+        self.speeds = np.zeros(self.max_tracks, dtype=np.float32)
+        self.in_use = np.zeros(self.max_tracks, dtype=bool)
+        self.slot_cameras = np.full(self.max_tracks, -1, dtype=np.int64)
+
+        self.track_slots = {}  # object_id -> slot index
+        self.slot_owners = [None] * self.max_tracks
+        self.free_slots = list(range(self.max_tracks - 1, -1, -1))
+        self.last_eviction = 0.0
+
+    def get_homography(self, camera_index, frame_size):
+        """Homography for a camera, rescaled once per frame size it is used with"""
+        key = (camera_index, frame_size)
+        if key not in self.scaled_homographies:
+            calibration = self.calibrations.get(camera_index)
+            if calibration is None or frame_size is None:
+                homography = None
+            else:
+                calib_w, calib_h = calibration['image_size']
+                # Map pixels of this frame size back to the calibration image
+                to_calibration = np.diag([calib_w / frame_size[0], calib_h / frame_size[1], 1.0])
+                homography = calibration['homography'] @ to_calibration
+            self.scaled_homographies[key] = homography
+        return self.scaled_homographies[key]
+
+    def project_boxes(self, boxes, camera_index=None, frame_size=None):
+        """Reference point of each box and the meters represented by one unit.
+
+        Calibrated cameras project the bottom-center footprint of each box to
+        road coordinates in meters; others use the box center in pixels.
+        """
+        homography = self.get_homography(camera_index, frame_size)
+        if homography is None:
+            centers = (boxes[:, :2] + boxes[:, 2:]) / 2
+            return centers, self.distance_calibration/100
+
+        footprints = np.stack([(boxes[:, 0] + boxes[:, 2]) / 2, boxes[:, 3]], axis=1)
+        world = cv2.perspectiveTransform(footprints.reshape(-1, 1, 2).astype(np.float32), homography)
+        return world.reshape(-1, 2), 1.0
+
+    def _to_seconds(self, frame_time):
+        if isinstance(frame_time, datetime):
+            return frame_time.timestamp()
+        return float(frame_time)
+
+    def _allocate_slot(self, object_id, reserved=None):
+        """Slot for a new track, or -1 if the table is full of reserved slots"""
+        if not self.free_slots:
+            # Table is full: reuse the slot of the least recently seen track
+            candidates = self.in_use if reserved is None else self.in_use & ~reserved
+            used = np.flatnonzero(candidates)
+            if len(used) == 0:
+                return -1
+            self._release_slot(int(used[np.argmin(self.last_seen[used])]))
+        slot = self.free_slots.pop()
+        self.track_slots[object_id] = slot
+        self.slot_owners[slot] = object_id
+        self.in_use[slot] = True
+        self.sample_counts[slot] = 0
+        self.speeds[slot] = 0
+        return slot
+
+    def _release_slot(self, slot):
+        del self.track_slots[self.slot_owners[slot]]
+        self.slot_owners[slot] = None
+        self.in_use[slot] = False
+        self.free_slots.append(slot)
+
+    def evict_stale(self, now):
+        """Free the slots of tracks not seen within track_timeout seconds"""
+        stale = np.flatnonzero(self.in_use & (self.last_seen < now - self.track_timeout))
+        for slot in stale.tolist():
+            self._release_slot(slot)
+        self.last_eviction = now
+        return len(stale)
+
+    def stats(self):
+        """Live track count and bytes held by the preallocated track tables"""
+        tables = (self.positions, self.times, self.sample_counts, self.last_seen, self.speeds, self.in_use,
+                  self.slot_cameras)
+        return {'live_tracks': int(self.in_use.sum()), 'memory_bytes': int(sum(table.nbytes for table in tables))}
+
+    def get_speed(self, object_id):
+        """Last computed speed in km/h for a tracked object"""
+        slot = self.track_slots.get(object_id)
+        return 0 if slot is None else float(self.speeds[slot])
+
+    def average_speeds(self, now=None, min_speed=1.0):
+        """Mean speed in km/h of the moving tracks seen within track_timeout, per camera.
+
+        Tracks slower than min_speed (queued or parked vehicles) are left out.
+        """
+        live = self.in_use & (self.slot_cameras >= 0) & (self.speeds >= min_speed)
+        if now is not None:
+            live &= self.last_seen >= self._to_seconds(now) - self.track_timeout
+        cameras = self.slot_cameras[live]
+        if len(cameras) == 0:
+            return {}
+        totals = np.bincount(cameras, weights=self.speeds[live])
+        counts = np.bincount(cameras)
+        return {camera: float(totals[camera] / counts[camera]) for camera in np.flatnonzero(counts).tolist()}
+
+    def get_history(self, object_id):
+        """Stored centers and times for a track, oldest first"""
+        slot = self.track_slots.get(object_id)
+        if slot is None:
+            return np.empty((0, 2), dtype=np.float32), np.empty(0)
+        count = min(self.sample_counts[slot], self.history_length)
+        order = (self.sample_counts[slot] - count + np.arange(count)) % self.history_length
+        return self.positions[slot, order], self.times[slot, order]
+
     def calculate_speed(self, current_bbox, object_id, frame_time):
         """Calculate speed of object between frames"""
-        if object_id not in self.tracked_objects:
-            self.tracked_objects[object_id] = {
-                'positions': [current_bbox],
-                'times': [frame_time],
-                'speed': 0
-            }
-            return 0
-            
-        # Get previous position and time
-        prev_bbox = self.tracked_objects[object_id]['positions'][-1]
-        prev_time = self.tracked_objects[object_id]['times'][-1]
-        
-        # Calculate center points
-        current_center = ((current_bbox[0] + current_bbox[2])/2, (current_bbox[1] + current_bbox[3])/2)
-        prev_center = ((prev_bbox[0] + prev_bbox[2])/2, (prev_bbox[1] + prev_bbox[3])/2)
-        
-        # Calculate distance in pixels
-        distance_pixels = np.sqrt((current_center[0] - prev_center[0])**2 + 
-                                (current_center[1] - prev_center[1])**2)
-        
-        # Convert to meters using calibration
-        distance_meters = distance_pixels * (self.distance_calibration/100)
-        
-        # Fix time difference calculation
+        speeds = self.calculate_speeds(np.asarray([current_bbox], dtype=np.float32), [object_id], frame_time)
+        return float(speeds[0]) if len(speeds) else 0
+
+    def calculate_speeds(self, boxes, object_ids, frame_time, smoothing=None, camera_index=None, frame_size=None):
+        """Calculate speeds in km/h for every box seen in one frame.
+
+        boxes is an (N,4) array of x1,y1,x2,y2 and object_ids holds one
+        track key per row. With smoothing='least_squares' the speed is the
+        slope of a straight-line fit over the last smoothing_window samples
+        instead of the jump since the previous frame; pass smoothing=False
+        to force the frame-to-frame value. camera_index and frame_size (w, h)
+        select a ground-plane calibration when one is configured.
+        """
+        boxes = np.asarray(boxes, dtype=np.float32).reshape(-1, 4)
+        speeds = np.zeros(len(boxes), dtype=np.float32)
+        if len(boxes) == 0:
+            return speeds
         try:
-            time_diff = (frame_time - prev_time).total_seconds()
-        except (AttributeError, TypeError):
-            time_diff = 0
-            
-        if time_diff > 0:
-            # Ensure no division by zero
-            speed = distance_meters / max(time_diff, 0.001)
-            # Convert to km/h
-            speed_kmh = speed * 3.6
-            
-            # Update tracking info
-            self.tracked_objects[object_id]['positions'].append(current_bbox)
-            self.tracked_objects[object_id]['times'].append(frame_time)
-            self.tracked_objects[object_id]['speed'] = speed_kmh
-            
-            return speed_kmh
-        
-        return 0
+            now = self._to_seconds(frame_time)
+        except (AttributeError, TypeError, ValueError):
+            return speeds
+        if smoothing is None:
+            smoothing = SPEED_CONFIG['smoothing']
+
+        # Sweep out vanished tracks at most once per second
+        if now - self.last_eviction >= 1.0:
+            self.evict_stale(now)
+
+        centers, meters_per_unit = self.project_boxes(boxes, camera_index, frame_size)
+        slots = np.array([self.track_slots.get(object_id, -1) for object_id in object_ids], dtype=np.int64)
+
+        # First sighting: start a history and report zero speed. Slots of this frame's
+        # tracks are never reused for its new ones; rows left without a slot are not tracked.
+        new = slots < 0
+        reserved = np.zeros(self.max_tracks, dtype=bool)
+        reserved[slots[~new]] = True
+        for i in np.flatnonzero(new).tolist():
+            slots[i] = self._allocate_slot(object_ids[i], reserved)
+            if slots[i] >= 0:
+                reserved[slots[i]] = True
+        tracked = slots >= 0
+        self.slot_cameras[slots[new & tracked]] = -1 if camera_index is None else camera_index
+
+        known = ~new
+        known_slots = slots[known]
+        last_index = (self.sample_counts[known_slots] - 1) % self.history_length
+        time_diff = now - self.times[known_slots, last_index]
+        moving = time_diff > 0
+
+        # Only record samples that advance time, as the per-box path did
+        update_mask = tracked.copy()
+        update_mask[np.flatnonzero(known)[~moving]] = False
+        update_slots = slots[update_mask]
+        write_index = self.sample_counts[update_slots] % self.history_length
+        self.positions[update_slots, write_index] = centers[update_mask]
+        self.times[update_slots, write_index] = now
+        self.sample_counts[update_slots] += 1
+        self.last_seen[slots[tracked]] = now
+
+        moving_rows = np.flatnonzero(known)[moving]
+        if len(moving_rows) == 0:
+            return speeds
+        moving_slots = slots[moving_rows]
+
+        if smoothing == 'least_squares':
+            units_per_second = self._fit_velocity(moving_slots, SPEED_CONFIG['smoothing_window'])
+        else:
+            prev_index = (self.sample_counts[moving_slots] - 2) % self.history_length
+            delta = centers[moving_rows] - self.positions[moving_slots, prev_index]
+            units_per_second = np.sqrt((delta ** 2).sum(axis=1)) / np.maximum(time_diff[moving], 0.001)
+
+        # Convert to meters using calibration, then to km/h
+        speed_kmh = units_per_second * meters_per_unit * 3.6
+        speeds[moving_rows] = speed_kmh
+        self.speeds[moving_slots] = speed_kmh
+        return speeds
+
+    def _fit_velocity(self, slots, window):
+        """Least-squares velocity over the last `window` samples of each slot"""
+        window = min(window, self.history_length)
+        counts = self.sample_counts[slots]
+        offsets = np.arange(window)
+        index = (counts[:, None] - window + offsets) % self.history_length
+        valid = offsets >= window - np.minimum(counts, window)[:, None]
+
+        t = self.times[slots[:, None], index]
+        p = self.positions[slots[:, None], index].astype(np.float64)
+        w = valid.astype(np.float64)
+        n = np.maximum(w.sum(axis=1), 1)
+
+        t_mean = (w * t).sum(axis=1) / n
+        dt = (t - t_mean[:, None]) * w
+        p_mean = (w[..., None] * p).sum(axis=1) / n[:, None]
+        dp = p - p_mean[:, None, :]
+        variance = (dt ** 2).sum(axis=1)
+        slope = (dt[..., None] * dp).sum(axis=1) / np.maximum(variance, 1e-9)[:, None]
+        return np.sqrt((slope ** 2).sum(axis=1)) * (variance > 0)
@@ -0,0 +1,57 @@
+import numpy as np
+from corridor import Corridor
+from traffic_signal import SignalControllerRegistry, SignalScheduler
+
+CYCLE = 60
+
+def make_corridor(travel_time, inbound_weight=None):
+    """Two intersections one link apart, traversed in travel_time seconds at 36 km/h (10 m/s)"""
+    scheduler = SignalScheduler(SignalControllerRegistry())
+    corridor = Corridor(scheduler, [1, 2], [10 * travel_time], cycle=CYCLE, design_speed=36, resolution=1)
+    if inbound_weight is not None:
+        corridor.inbound_weight = inbound_weight
+    return corridor
+
+def test_outbound_wave_offset_is_travel_time():
+    corridor = make_corridor(15, inbound_weight=0)
+    outbound, _ = corridor.optimize(incremental=False)
+    assert corridor.offsets.tolist() == [0, 15]
+    assert outbound == corridor.green_bins
+
+def test_offsets_wrap_around_the_cycle():
+    # 75 s is one cycle plus 15 s
+    corridor = make_corridor(75, inbound_weight=0)
+    outbound, _ = corridor.optimize(incremental=False)
+    assert corridor.offsets.tolist() == [0, 15]
+    assert outbound == corridor.green_bins
+
+def test_half_cycle_travel_time_opens_both_bands():
+    # 90 s is 30 s past one cycle, so both directions meet green at the same offset
+    corridor = make_corridor(90)
+    bandwidth = corridor.optimize(incremental=False)
+    assert corridor.offsets.tolist() == [0, 30]
+    assert bandwidth == (corridor.green_bins, corridor.green_bins)
+
+def test_whole_cycle_travel_time_needs_no_offset():
+    corridor = make_corridor(2 * CYCLE)
+    bandwidth = corridor.optimize(incremental=False)
+    assert corridor.offsets.tolist() == [0, 0]
+    assert bandwidth == (corridor.green_bins, corridor.green_bins)
+
+def test_incremental_reoptimisation_follows_travel_time():
+    corridor = make_corridor(15, inbound_weight=0)
+    corridor.optimize(incremental=False)
+    corridor.link_speeds[:] = 36 * 15 / 20  # Slower traffic: 20 s over the same link
+    outbound, _ = corridor.optimize()
+    assert corridor.offsets.tolist() == [0, 20]
+    assert outbound == corridor.green_bins
+
+def test_apply_hands_offsets_to_the_registry():
+    corridor = make_corridor(90)
+    corridor.optimize(incremental=False)
+    corridor.apply()
+    registry = corridor.scheduler.registry
+    rows = [registry.index_of[i] for i in (1, 2)]
+    assert np.allclose(registry.cycle[rows], CYCLE)
+    assert np.allclose(registry.offset[rows], [0, 30])
+    assert (registry.coordinated_phase[rows] == corridor.phase_index).all()
@@ -0,0 +1,32 @@
+from datetime import datetime, timedelta
+import numpy as np
+from crossings import CrossingCounter
+
+START = datetime(2026, 10, 1, 8, 0, 30)
+LINES = np.array([[[0, 5], [10, 5]]], dtype=np.float32)
+
+def make_counter():
+    return CrossingCounter(2, history_minutes=60, max_cameras=2, max_approaches=2, id_slots=8)
+
+def cross(counter, track_id, timestamp):
+    return counter.record(0, [track_id], np.array([[5.0, 0.0]]), np.array([[5.0, 10.0]]), np.array([0]),
+                          LINES, np.array([0]), timestamp)
+
+def test_each_track_is_counted_once_per_line():
+    counter = make_counter()
+    assert cross(counter, 1, START) == 1
+    assert cross(counter, 1, START) == 0
+    assert counter.class_totals().tolist() == [1, 0]
+
+def test_closed_minutes_skip_minutes_the_camera_did_not_watch():
+    counter = make_counter()
+    cross(counter, 1, START)
+    counter.observe(0, START + timedelta(minutes=1))
+    # Outage: nothing delivered for minutes 2 to 4
+    counter.observe(0, START + timedelta(minutes=5))
+    counter.observe(0, START + timedelta(minutes=6))
+
+    first = counter.latest_minute[0] - 6
+    closed = [(minute - first, counts.tolist()) for minute, counts in counter.closed_minutes(0)]
+    assert closed == [(0, [1, 0]), (1, [0, 0]), (5, [0, 0])]
+    assert counter.closed_minutes(0) == []
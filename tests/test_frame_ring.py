@@ -0,0 +1,59 @@
+import numpy as np
+import pytest
+from frame_ring import FrameRing, RingLease
+
+@pytest.fixture
+def ring():
+    ring = FrameRing(3, (4, 6, 3))
+    yield ring
+    ring.close()
+    ring.unlink()
+
+def frame(value, height=4, width=6):
+    return np.full((height, width, 3), value, dtype=np.uint8)
+
+def test_read_returns_the_written_frame(ring):
+    slot, sequence = ring.write(frame(7, height=2), camera_index=1, timestamp=12.5)
+    view, camera, timestamp = ring.read(slot, sequence)
+    assert view.shape == (2, 6, 3) and (view == 7).all()
+    assert (camera, timestamp) == (1, 12.5)
+    assert ring.latest() == (slot, sequence)
+
+def test_writing_past_the_ring_invalidates_a_held_lease(ring):
+    slot, sequence = ring.write(frame(1))
+    lease = RingLease([(ring, slot, sequence)])
+    view = ring.read(slot, sequence)[0]
+    assert lease.is_valid()
+
+    for value in range(2, 2 + ring.num_slots):
+        ring.write(frame(value))
+
+    # The writer never waits for readers: the held view now shows the newer frame
+    assert (view == 2 + ring.num_slots - 1).all()
+    assert ring.read(slot, sequence) is None
+    assert not ring.is_current(slot, sequence)
+    assert not lease.is_valid()
+
+def test_lease_over_several_rings_needs_every_slot(ring):
+    other = FrameRing(2, (4, 6, 3))
+    try:
+        entries = [(ring, *ring.write(frame(1))), (other, *other.write(frame(1)))]
+        lease = RingLease(entries)
+        ring.write(frame(2))
+        assert lease.is_valid()  # Neither slot reused yet
+        other.write(frame(2))
+        other.write(frame(3))
+        assert not lease.is_valid()
+    finally:
+        other.close()
+        other.unlink()
+
+def test_slot_being_written_reads_as_reused(ring):
+    slot, sequence = ring.write(frame(1))
+    ring.headers['sequence'][slot] = 0  # What a reader sees while the writer copies into the slot
+    assert ring.read(slot, sequence) is None
+    assert not RingLease([(ring, slot, sequence)]).is_valid()
+
+def test_frames_larger_than_the_slots_are_rejected(ring):
+    with pytest.raises(ValueError):
+        ring.write(frame(1, height=5))
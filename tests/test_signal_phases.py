@@ -0,0 +1,70 @@
+import json
+import os
+import numpy as np
+import pytest
+from signal_phases import GREEN, RED, YELLOW, SignalPhaseManager, SignalState, default_phase_plan, load_phase_plan
+
+EXAMPLE_PLAN = os.path.join(os.path.dirname(os.path.dirname(os.path.abspath(__file__))), 'phase_plan.example.json')
+
+@pytest.fixture
+def manager():
+    return SignalPhaseManager(load_phase_plan(EXAMPLE_PLAN))
+
+def test_example_plan_compiles_to_table_shapes(manager):
+    assert manager.phase_order == ['NS_LEFT', 'NS', 'EW_LEFT', 'EW', 'PEDESTRIAN']
+    assert manager.approaches == ['N', 'S', 'E', 'W']
+    assert len(manager.signal_names) == 10
+    assert manager.state_table.shape == (5, 10)
+    assert manager.transition_table.shape == (5, 10)
+    assert manager.serves_table.shape == (5, 4)
+    assert manager.duration_table.tolist()[0] == [12, 6, 20]
+
+def test_each_phase_serves_its_approaches(manager):
+    expected = {
+        'NS_LEFT': [1, 1, 0, 0],
+        'NS': [1, 1, 0, 0],
+        'EW_LEFT': [0, 0, 1, 1],
+        'EW': [0, 0, 1, 1],
+        'PEDESTRIAN': [0, 0, 0, 0]  # Pedestrian heads release no vehicles
+    }
+    for phase, served in expected.items():
+        assert manager.serves_table[manager.phase_index[phase]].tolist() == served
+    assert manager.phase_counts({'N': 3, 'E': 2, 'X': 9}).tolist() == [3, 3, 2, 2, 0]
+
+def test_phase_and_intergreen_states(manager):
+    states = manager.state_dict(manager.get_phase_states('NS'))
+    assert states['N'] == states['S'] == states['PED_NS'] == SignalState.GREEN
+    assert states['NL'] == states['E'] == states['PED_EW'] == SignalState.RED
+
+    # Leaving a phase, its green heads turn yellow and the rest stay red
+    green = manager.state_table == GREEN
+    assert (manager.transition_table[green] == YELLOW).all()
+    assert (manager.transition_table[~green] == RED).all()
+    states = manager.state_dict(manager.get_transition_states('PEDESTRIAN'))
+    assert states['PED_NS'] == states['PED_EW'] == SignalState.YELLOW
+
+def test_compiled_tables_are_read_only(manager):
+    with pytest.raises(ValueError):
+        manager.serves_table[0, 0] = 0
+
+def write_plan(tmp_path, plan):
+    path = tmp_path / 'phase_plan.json'
+    path.write_text(json.dumps(plan))
+    return str(path)
+
+def test_plan_with_unknown_signal_head_is_rejected(tmp_path, capsys):
+    plan = {
+        'signals': {'N': 'N', 'S': 'S'},
+        'phases': [{'name': 'NS', 'green': ['N', 'S', 'NL'], 'duration': 30}]
+    }
+    assert load_phase_plan(write_plan(tmp_path, plan)) == default_phase_plan()
+    assert "unknown signal heads ['NL']" in capsys.readouterr().out
+
+def test_plan_without_phases_is_rejected(tmp_path):
+    plan = {'signals': {'N': 'N'}, 'phases': []}
+    assert load_phase_plan(write_plan(tmp_path, plan)) == default_phase_plan()
+
+def test_default_plan_compiles():
+    manager = SignalPhaseManager(default_phase_plan())
+    assert manager.phase_order == ['NS', 'EW']
+    assert np.array_equal(manager.serves_table, [[1, 1, 0, 0], [0, 0, 1, 1]])
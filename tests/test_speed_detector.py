@@ -0,0 +1,23 @@
+from speed_detector import SpeedDetector
+
+def box(x):
+    return [x, 0, x + 10, 10]
+
+def test_full_table_never_evicts_a_track_of_the_same_frame():
+    detector = SpeedDetector(max_tracks=2, calibrations={})
+    detector.calculate_speeds([box(0), box(100)], ['A', 'B'], 1.0, smoothing=False)
+    speeds = detector.calculate_speeds([box(1), box(101), box(200)], ['A', 'B', 'C'], 2.0, smoothing=False)
+
+    # A and B moved one pixel in a second; C found no free slot and is not tracked
+    assert speeds[0] == speeds[1] == detector.get_speed('A') > 0
+    assert speeds[2] == 0
+    assert set(detector.track_slots) == {'A', 'B'}
+    assert detector.sample_counts.tolist() == [2, 2]
+
+def test_full_table_reuses_the_least_recently_seen_slot():
+    detector = SpeedDetector(max_tracks=2, calibrations={})
+    detector.calculate_speeds([box(0), box(100)], ['A', 'B'], 1.0, smoothing=False)
+    detector.calculate_speeds([box(101), box(200)], ['B', 'C'], 2.0, smoothing=False)
+    assert set(detector.track_slots) == {'B', 'C'}
+    assert len(detector.get_history('C')[1]) == 1
+    assert detector.stats()['live_tracks'] == 2
@@ -0,0 +1,43 @@
+from datetime import datetime, timedelta
+from traffic_history import TrafficHistory
+
+START = datetime(2026, 10, 1, 8, 0)
+
+def at(minute):
+    return START + timedelta(minutes=minute, seconds=5)
+
+def test_bins_close_once_the_watermark_passes_them():
+    history = TrafficHistory(capacity=16, archive_dir='', late_minutes=1)
+    for minute in range(4):
+        history.add(at(minute), 10, 0, 'NS')
+    assert history.closed_end() == 2
+
+    # A lagging camera still lands in an open bin
+    history.add(at(2), 5, 0, 'NS')
+    assert history.closed_end() == 2
+    assert history.count_sum[2] == 15
+
+def test_late_samples_are_routed_past_the_training_cursor():
+    history = TrafficHistory(capacity=16, archive_dir='', late_minutes=1)
+    for minute in range(4):
+        history.add(at(minute), 10, 0, 'NS')
+    _, y, _, cursor = history.training_data(0)
+    assert y.tolist() == [10, 10]
+
+    history.add(at(0), 7, 0, 'NS')
+    _, y, weights, end = history.training_data(cursor)
+    assert y.tolist() == [7] and weights.tolist() == [1]
+    assert end == cursor + 1
+
+def test_spilled_rows_are_trained_on_and_survive_a_restart(tmp_path):
+    archive = str(tmp_path)
+    history = TrafficHistory(capacity=8, archive_dir=archive, late_minutes=0)
+    for minute in range(12):
+        history.add(at(minute), minute, 0, 'EW')
+    assert history.spilled_rows > 0
+    _, y, _, end = history.training_data(0)
+    assert y.tolist() == list(range(11))
+
+    restarted = TrafficHistory(capacity=8, archive_dir=archive, late_minutes=0)
+    assert restarted.spilled_rows == history.spilled_rows
+    assert len(restarted.training_data(0)[1]) == history.spilled_rows
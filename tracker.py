@@ -0,0 +1,139 @@
+import numpy as np
+from config import TRACKER_CONFIG
+
+def iou_matrix(boxes_a, boxes_b):
+    """Pairwise IoU between (N,4) and (M,4) x1,y1,x2,y2 boxes"""
+    boxes_a = boxes_a[:, None, :]
+    boxes_b = boxes_b[None, :, :]
+    inter_w = np.clip(np.minimum(boxes_a[..., 2], boxes_b[..., 2]) - np.maximum(boxes_a[..., 0], boxes_b[..., 0]), 0, None)
+    inter_h = np.clip(np.minimum(boxes_a[..., 3], boxes_b[..., 3]) - np.maximum(boxes_a[..., 1], boxes_b[..., 1]), 0, None)
+    inter = inter_w * inter_h
+    area_a = (boxes_a[..., 2] - boxes_a[..., 0]) * (boxes_a[..., 3] - boxes_a[..., 1])
+    area_b = (boxes_b[..., 2] - boxes_b[..., 0]) * (boxes_b[..., 3] - boxes_b[..., 1])
+    return inter / np.maximum(area_a + area_b - inter, 1e-6)
+
+def greedy_match(scores, threshold):
+    """Assign rows to columns by repeatedly accepting mutual best pairs.
+
+    Each round is a couple of argmax calls over the whole matrix, so there is
+    no Python loop over detection/track pairs. Returns, for every row, the
+    matched column or -1.
+    """
+    n_rows, n_cols = scores.shape
+    matches = np.full(n_rows, -1, dtype=np.int64)
+    if n_rows == 0 or n_cols == 0:
+        return matches
+
+    scores = np.where(scores >= threshold, scores, 0)
+    rows = np.arange(n_rows)
+    while True:
+        best_col = scores.argmax(axis=1)
+        best_row = scores.argmax(axis=0)
+        mutual = (best_row[best_col] == rows) & (scores[rows, best_col] > 0)
+        if not mutual.any():
+            return matches
+        matched_rows = rows[mutual]
+        matched_cols = best_col[mutual]
+        matches[matched_rows] = matched_cols
+        scores[matched_rows, :] = 0
+        scores[:, matched_cols] = 0
+
+class VehicleTracker:
+    """SORT-style IoU tracker with a constant-velocity box motion model.
+
+    One tracker is kept per camera so track IDs are stable within a feed.
+    Track state lives in parallel NumPy arrays. Between detector runs,
+    coast() moves every track along its velocity; the next update measures
+    velocity against the last detected box over the frames that passed.
+    """
+    def __init__(self, iou_threshold=None, max_age=None, velocity_smoothing=None):
+        self.iou_threshold = TRACKER_CONFIG['iou_threshold'] if iou_threshold is None else iou_threshold
+        self.max_age = TRACKER_CONFIG['max_age'] if max_age is None else max_age
+        self.velocity_smoothing = (TRACKER_CONFIG['velocity_smoothing']
+                                   if velocity_smoothing is None else velocity_smoothing)
+        self.boxes = np.empty((0, 4), dtype=np.float32)
+        self.velocities = np.empty((0, 4), dtype=np.float32)
+        self.ids = np.empty(0, dtype=np.int64)
+        self.class_ids = np.empty(0, dtype=np.int64)
+        self.misses = np.empty(0, dtype=np.int64)
+        self.detected_boxes = np.empty((0, 4), dtype=np.float32)  # Last box the detector saw
+        self.since_detected = np.empty(0, dtype=np.int64)  # Frames since then
+        self.next_id = 0
+        # Last detected box of each detection's track before the latest update (itself if new)
+        self.previous_boxes = np.empty((0, 4), dtype=np.float32)
+
+    def predict(self):
+        """Predicted boxes for all live tracks in the next frame"""
+        return self.boxes + self.velocities
+
+    def coast(self):
+        """Advance all tracks one frame without a detection; returns the fresh tracks"""
+        self.boxes = self.predict()
+        self.since_detected += 1
+        return self.active_tracks()
+
+    def update(self, boxes, class_ids):
+        """Match detections to tracks and return a track ID for each detection"""
+        boxes = np.asarray(boxes, dtype=np.float32).reshape(-1, 4)
+        class_ids = np.asarray(class_ids, dtype=np.int64).reshape(-1)
+
+        predicted = self.predict()
+        det_to_track = greedy_match(iou_matrix(boxes, predicted), self.iou_threshold)
+
+        matched = det_to_track >= 0
+        matched_tracks = det_to_track[matched]
+        self.previous_boxes = boxes.copy()
+        self.previous_boxes[matched] = self.detected_boxes[matched_tracks]
+
+        # Update matched tracks; velocity is an exponential average of box motion
+        alpha = self.velocity_smoothing
+        steps = (self.since_detected[matched_tracks] + 1)[:, None]
+        motion = (boxes[matched] - self.detected_boxes[matched_tracks]) / steps
+        self.velocities[matched_tracks] = alpha * self.velocities[matched_tracks] + (1 - alpha) * motion
+        self.boxes[matched_tracks] = boxes[matched]
+        self.detected_boxes[matched_tracks] = boxes[matched]
+        self.class_ids[matched_tracks] = class_ids[matched]
+
+        # Coast unmatched tracks on their prediction and age them
+        unmatched_tracks = np.ones(len(self.ids), dtype=bool)
+        unmatched_tracks[matched_tracks] = False
+        self.boxes[unmatched_tracks] = predicted[unmatched_tracks]
+        self.misses += unmatched_tracks
+        self.misses[matched_tracks] = 0
+        self.since_detected += 1
+        self.since_detected[matched_tracks] = 0
+
+        # Start new tracks for unmatched detections
+        new = ~matched
+        num_new = int(new.sum())
+        new_ids = np.arange(self.next_id, self.next_id + num_new, dtype=np.int64)
+        self.next_id += num_new
+        track_ids = np.empty(len(boxes), dtype=np.int64)
+        track_ids[matched] = self.ids[matched_tracks]
+        track_ids[new] = new_ids
+
+        self.boxes = np.concatenate([self.boxes, boxes[new]])
+        self.velocities = np.concatenate([self.velocities, np.zeros((num_new, 4), dtype=np.float32)])
+        self.ids = np.concatenate([self.ids, new_ids])
+        self.class_ids = np.concatenate([self.class_ids, class_ids[new]])
+        self.misses = np.concatenate([self.misses, np.zeros(num_new, dtype=np.int64)])
+        self.detected_boxes = np.concatenate([self.detected_boxes, boxes[new]])
+        self.since_detected = np.concatenate([self.since_detected, np.zeros(num_new, dtype=np.int64)])
+
+        # Drop tracks that have not been seen for too long
+        alive = self.misses <= self.max_age
+        if not alive.all():
+            self.boxes = self.boxes[alive]
+            self.velocities = self.velocities[alive]
+            self.ids = self.ids[alive]
+            self.class_ids = self.class_ids[alive]
+            self.misses = self.misses[alive]
+            self.detected_boxes = self.detected_boxes[alive]
+            self.since_detected = self.since_detected[alive]
+
+        return track_ids
+
+    def active_tracks(self):
+        """IDs, boxes and classes of tracks matched in the latest update"""
+        fresh = self.misses == 0
+        return self.ids[fresh], self.boxes[fresh], self.class_ids[fresh]
@@ -0,0 +1,210 @@
+import numpy as np
+import os
+import glob
+import threading
+from enum import IntEnum
+from datetime import datetime
+from config import HISTORY_CONFIG
+
+# Minutes are counted on the local wall clock so hour/weekday features match
+# the naive datetimes used everywhere else
+EPOCH = datetime(1970, 1, 1)
+
+class Direction(IntEnum):
+    NS = 0  # North-South
+    EW = 1  # East-West
+
+def to_minute(timestamp):
+    """Wall-clock minutes since 1970-01-01 for a naive datetime"""
+    return int((timestamp - EPOCH).total_seconds() // 60)
+
+def time_features(minutes):
+    """Model features (hour, minute, weekday, peak, weekend) for minute indices"""
+    minutes = np.asarray(minutes, dtype=np.int64)
+    hour = (minutes // 60) % 24
+    minute = minutes % 60
+    weekday = (minutes // 1440 + 3) % 7  # 1970-01-01 was a Thursday
+    peak = ((hour >= 7) & (hour <= 10)) | ((hour >= 16) & (hour <= 19))
+    weekend = weekday >= 5
+    return np.stack([hour, minute, weekday, peak, weekend], axis=1).astype(np.float32)
+
+class TrafficHistory:
+    """Columnar store of traffic samples aggregated into per-minute bins.
+
+    Each row is one (minute, direction) bin holding the sum of vehicle
+    counts and congestion levels and the number of samples. Rows live in
+    fixed-capacity typed arrays that are always contiguous, so training
+    features are slices of them. When the store fills up, the oldest half
+    is written to an NPZ file in the archive directory; row ids continue
+    after the archives of earlier runs.
+
+    A bin closes once the newest minute seen is more than late_minutes
+    past it. Closed rows form a prefix that is never changed, so training
+    can resume from a row cursor; open rows follow in minute order. A
+    sample for a closed minute is routed into a new row at the end of the
+    closed prefix, so the next incremental retrain still sees it.
+    """
+    def __init__(self, capacity=None, archive_dir=None, late_minutes=None):
+        self.capacity = capacity or HISTORY_CONFIG['capacity']
+        self.archive_dir = HISTORY_CONFIG['archive_dir'] if archive_dir is None else archive_dir
+        self.late_minutes = HISTORY_CONFIG['late_minutes'] if late_minutes is None else late_minutes
+
+        self.minute = np.zeros(self.capacity, dtype=np.int64)
+        self.direction = np.zeros(self.capacity, dtype=np.int8)
+        self.count_sum = np.zeros(self.capacity, dtype=np.float32)
+        self.congestion_sum = np.zeros(self.capacity, dtype=np.float32)
+        self.samples = np.zeros(self.capacity, dtype=np.int32)
+
+        self.size = 0
+        self.open_start = 0  # First row of a bin that is still open
+        self.spilled_rows = self._archived_rows()  # Rows already on disk; row ids stay absolute
+        self.total_samples = 0
+        self.latest_minute = None
+        self.bin_rows = {}  # (minute, direction) -> row of its open bin or latest late row
+        self.lock = threading.Lock()
+
+    def __len__(self):
+        return self.size
+
+    def add(self, timestamp, vehicle_count, congestion_level, direction):
+        """Accumulate one sample into its minute bin"""
+        minute = to_minute(timestamp)
+        direction = Direction[direction] if isinstance(direction, str) else Direction(direction)
+        with self.lock:
+            row = self.bin_rows.get((minute, direction))
+            if row is None or row < self.open_start:
+                if self.size == self.capacity:
+                    self._spill()
+                if self._is_closed(minute):
+                    row = self.open_start  # Late sample: a new closed row nothing has trained on
+                    self.open_start += 1
+                else:
+                    row = self.open_start + int(np.searchsorted(self.minute[self.open_start:self.size], minute,
+                                                                side='right'))
+                self._insert_row(row, minute, direction)
+            self.count_sum[row] += vehicle_count
+            self.congestion_sum[row] += congestion_level
+            self.samples[row] += 1
+            self.total_samples += 1
+            if self.latest_minute is None or minute > self.latest_minute:
+                self.latest_minute = minute
+                # Open rows are in minute order, so the bins this closes come first
+                while self.open_start < self.size and self._is_closed(self.minute[self.open_start]):
+                    self.open_start += 1
+
+    def _is_closed(self, minute):
+        return self.latest_minute is not None and minute + self.late_minutes < self.latest_minute
+
+    def _insert_row(self, row, minute, direction):
+        """Start an empty bin at local row `row`, shifting the (few) rows after it"""
+        for column in self._columns().values():
+            column[row + 1:self.size + 1] = column[row:self.size]
+        for shifted in range(self.size, row, -1):
+            key = (int(self.minute[shifted]), int(self.direction[shifted]))
+            if self.bin_rows.get(key) == shifted - 1:
+                self.bin_rows[key] = shifted
+        self.minute[row] = minute
+        self.direction[row] = direction
+        self.count_sum[row] = 0
+        self.congestion_sum[row] = 0
+        self.samples[row] = 0
+        self.bin_rows[(minute, direction)] = row
+        self.size += 1
+
+    def _spill(self):
+        """Archive the oldest half of the rows and shift the rest to the front"""
+        count = self.capacity // 2
+        if self.archive_dir:
+            try:
+                os.makedirs(self.archive_dir, exist_ok=True)
+                path = os.path.join(self.archive_dir, f"history_{self.spilled_rows:012d}.npz")
+                np.savez(path, **{name: column[:count] for name, column in self._columns().items()})
+            except Exception as e:
+                print(f"History archive error: {str(e)}")
+
+        for column in self._columns().values():
+            column[:self.size - count] = column[count:self.size]
+        self.size -= count
+        self.open_start = max(self.open_start - count, 0)
+        self.spilled_rows += count
+        # Later rows win, so a late row replaces its bin's earlier one
+        self.bin_rows = {
+            (minute, direction): row
+            for row, (minute, direction) in enumerate(zip(self.minute[:self.size].tolist(),
+                                                          self.direction[:self.size].tolist()))
+        }
+
+    def _columns(self):
+        return {
+            'minute': self.minute,
+            'direction': self.direction,
+            'count_sum': self.count_sum,
+            'congestion_sum': self.congestion_sum,
+            'samples': self.samples
+        }
+
+    def closed_end(self):
+        """Absolute row id up to which bins are closed"""
+        return self.spilled_rows + self.open_start
+
+    def view(self, start=0, end=None):
+        """Zero-copy column slices for absolute rows [start, end) still in memory"""
+        end = self.spilled_rows + self.size if end is None else end
+        local_start = max(0, start - self.spilled_rows)
+        local_end = max(local_start, end - self.spilled_rows)
+        return {name: column[local_start:local_end] for name, column in self._columns().items()}
+
+    def training_data(self, start=0):
+        """Features, mean vehicle count and sample weights for closed bins from `start`.
+
+        Rows before `start` that were spilled are read back from the archive.
+        Returns X, y, weights and the absolute row id the data ends at. The
+        arrays are fresh, so they stay valid if the store spills meanwhile.
+        """
+        with self.lock:
+            end = self.closed_end()
+            spilled = self.spilled_rows
+            rows = {name: column.copy() for name, column in self.view(start, end).items()}
+        if start < spilled:
+            archived = self.load_archive(start, spilled)
+            rows = {name: np.concatenate([archived[name], rows[name]]) for name in rows}
+        X = time_features(rows['minute'])
+        weights = rows['samples'].astype(np.float32)
+        y = rows['count_sum'] / np.maximum(weights, 1)
+        return X, y, weights, end
+
+    def _archive_paths(self):
+        """(first absolute row id, path) of every archive file, oldest first"""
+        paths = glob.glob(os.path.join(self.archive_dir, "history_*.npz")) if self.archive_dir else []
+        return sorted((int(os.path.basename(path)[8:-4]), path) for path in paths)
+
+    def _archived_rows(self):
+        """Row id after the last archived row, so a new run never overwrites earlier archives"""
+        end = 0
+        for first, path in self._archive_paths():
+            try:
+                with np.load(path) as archive:
+                    end = max(end, first + len(archive['minute']))
+            except Exception as e:
+                print(f"History archive error: {str(e)}")
+        return end
+
+    def load_archive(self, start=0, end=None):
+        """Archived bins with absolute row ids in [start, end), oldest first"""
+        parts = []
+        for first, path in self._archive_paths():
+            try:
+                with np.load(path) as archive:
+                    part = {name: archive[name] for name in self._columns()}
+            except Exception as e:
+                print(f"History archive error: {str(e)}")
+                continue
+            last = first + len(part['minute'])
+            low = max(start, first) - first
+            high = (last if end is None else min(end, last)) - first
+            if high > low:
+                parts.append({name: column[low:high] for name, column in part.items()})
+        return {
+            name: np.concatenate([part[name] for part in parts]) if parts else column[:0].copy()
+            for name, column in self._columns().items()
+        }
@@ -1,22 +1,24 @@
 import numpy as np
 from sklearn.ensemble import RandomForestRegressor
-from datetime import datetime, timedelta
+from datetime import timedelta
+import copy
 import joblib
 import os
+import threading
+from config import PREDICTOR_CONFIG
+from traffic_history import TrafficHistory, time_features, to_minute
 
 class TrafficPredictor:
     def __init__(self):
-        self.model = RandomForestRegressor()
-        self.historical_data = {
-            'time': [],
-            'day_of_week': [],
-            'vehicle_count': [],
-            'congestion_level': [],
-            'direction': []
-        }
+        self.model = RandomForestRegressor(n_jobs=PREDICTOR_CONFIG['n_jobs'])
+        self.history = TrafficHistory()
         self.prediction_window = 15  # minutes
         self.model_path = 'traffic_model.joblib'
         self.is_model_trained = False
+        self.prediction_cache = {}  # (minute, direction) -> predicted vehicles, cleared on retrain
+        self.training_thread = None
+        self.swap_lock = threading.Lock()
+        self.trained_rows = 0  # History rows already seen by the current model
         self.default_prediction = {
             'predicted_vehicles': 0,
             'congestion_risk': 'Low'
@@ -25,13 +27,11 @@ class TrafficPredictor:
         
     def prepare_features(self, timestamp):
         """Prepare feature vector for prediction"""
-        return np.array([
-            timestamp.hour,
-            timestamp.minute,
-            timestamp.weekday(),
-            1 if self.is_peak_hour(timestamp) else 0,
-            1 if self.is_weekend(timestamp) else 0
-        ]).reshape(1, -1)
+        return self.prepare_feature_matrix([timestamp])
+
+    def prepare_feature_matrix(self, timestamps):
+        """Prepare one feature row per timestamp"""
+        return time_features([to_minute(t) for t in timestamps])
         
     def is_peak_hour(self, timestamp):
         """Check if given time is during peak hours"""
@@ -44,80 +44,151 @@ class TrafficPredictor:
         
     def add_data_point(self, timestamp, vehicle_count, congestion_level, direction):
         """Add new data point to historical data"""
-        self.historical_data['time'].append(timestamp)
-        self.historical_data['day_of_week'].append(timestamp.weekday())
-        self.historical_data['vehicle_count'].append(vehicle_count)
-        self.historical_data['congestion_level'].append(congestion_level)
-        self.historical_data['direction'].append(direction)
+        self.history.add(timestamp, vehicle_count, congestion_level, direction)
+
+    def has_enough_data(self):
+        """Whether enough complete minute bins exist to train on"""
+        return self.history.closed_end() - self.history.spilled_rows >= PREDICTOR_CONFIG['min_training_bins']
         
     def train_model(self):
         """Train prediction model on historical data"""
-        if len(self.historical_data['time']) < 100:  # Need minimum data points
+        if not self.has_enough_data():  # Need minimum data points
             return False
             
         try:
-            # Fix array conversion
-            X = np.array([
-                [t.hour, t.minute, t.weekday(),
-                 int(self.is_peak_hour(t)),  # Convert boolean to int
-                 int(self.is_weekend(t))]    # Convert boolean to int
-                for t in self.historical_data['time']
-            ], dtype=np.float32)  # Specify dtype
-            
-            y = np.array(self.historical_data['vehicle_count'], dtype=np.float32)
-            
-            self.model.fit(X, y)
-            self.is_model_trained = True
-            self.save_model()
-            return True
+            return self._fit_and_swap(*self._snapshot_training_data())
         except Exception as e:
             print(f"Training error: {str(e)}")
             return False
+
+    def train_model_async(self):
+        """Retrain on a snapshot of the history in a background thread.
+
+        Returns False without doing anything if a retrain is already running.
+        The new model replaces the current one only once it is fully fitted.
+        """
+        if not self.has_enough_data():  # Need minimum data points
+            return False
+        if self.training_thread is not None and self.training_thread.is_alive():
+            return False
+
+        snapshot = self._snapshot_training_data()
+        self.training_thread = threading.Thread(
+            target=self._train_in_background, args=snapshot, name="predictor-training", daemon=True
+        )
+        self.training_thread.start()
+        return True
+
+    def _train_in_background(self, X, y, weights, end):
+        try:
+            self._fit_and_swap(X, y, weights, end)
+        except Exception as e:
+            print(f"Training error: {str(e)}")
+
+    def _is_incremental(self):
+        return PREDICTOR_CONFIG['model_type'] == 'warm_start_forest' and self.is_model_trained
+
+    def _snapshot_training_data(self):
+        """Complete minute bins this retrain needs; appends may continue meanwhile"""
+        start = self.trained_rows if self._is_incremental() else 0
+        return self.history.training_data(start)
+
+    def _fit_and_swap(self, X, y, weights, end):
+        """Fit a new model off to the side, then swap it in"""
+        if len(y) == 0:
+            return False
+
+        if self._is_incremental():
+            # Warm start: keep the existing trees and grow new ones on the new samples only
+            model = copy.deepcopy(self.model)
+            model.set_params(warm_start=True, n_estimators=len(model.estimators_) + PREDICTOR_CONFIG['trees_per_update'])
+            model.fit(X, y, sample_weight=weights)
+            if len(model.estimators_) > PREDICTOR_CONFIG['max_trees']:
+                # Retire the oldest trees so prediction cost stays bounded
+                model.estimators_ = model.estimators_[-PREDICTOR_CONFIG['max_trees']:]
+                model.set_params(n_estimators=PREDICTOR_CONFIG['max_trees'])
+        else:
+            model = RandomForestRegressor(n_jobs=PREDICTOR_CONFIG['n_jobs'])
+            model.fit(X, y, sample_weight=weights)
+
+        with self.swap_lock:
+            self.model = model
+            self.is_model_trained = True
+            self.trained_rows = end
+            self.prediction_cache.clear()
+        self.save_model()
+        return True
         
     def predict_traffic(self, current_time, direction, predict_minutes=15):
         """Predict traffic for the next n minutes"""
+        return self.predict_batch(current_time, [direction], predict_minutes)[direction]
+
+    def default_predictions(self, current_time, predict_minutes):
+        return [
+            {
+                'time': current_time + timedelta(minutes=minute),
+                'predicted_vehicles': 0,
+                'congestion_risk': 'Low'
+            }
+            for minute in range(predict_minutes)
+        ]
+
+    def predict_batch(self, current_time, directions=('NS', 'EW'), predict_minutes=15):
+        """Predict the next n minutes for several directions with one model call.
+
+        directions may be plain direction names or (intersection, direction)
+        keys. Predictions are cached per (minute, direction) until the next
+        retrain, so only minutes not seen before reach the model.
+        """
+        directions = list(directions)
         try:
-            if not self.is_model_trained:
-                print("Model not yet trained, returning default predictions")
-                return [
-                    {
-                        'time': current_time + timedelta(minutes=minute),
-                        'predicted_vehicles': 0,
-                        'congestion_risk': 'Low'
-                    }
-                    for minute in range(predict_minutes)
-                ]
-            
-            predictions = []
-            for minute in range(predict_minutes):
-                future_time = current_time + timedelta(minutes=minute)
-                features = self.prepare_features(future_time)
-                
-                try:
-                    pred = max(0, int(self.model.predict(features)[0]))  # Ensure non-negative
-                except Exception as model_error:
-                    print(f"Prediction error: {str(model_error)}")
-                    pred = 0
-                
-                predictions.append({
-                    'time': future_time,
-                    'predicted_vehicles': pred,
-                    'congestion_risk': self.calculate_congestion_risk(pred)
-                })
-            
-            return predictions
-            
+            # A retrain swaps the model and clears the cache under this lock; hold it so
+            # both stay consistent for the whole call
+            with self.swap_lock:
+                if not self.is_model_trained:
+                    print("Model not yet trained, returning default predictions")
+                    return {direction: self.default_predictions(current_time, predict_minutes)
+                            for direction in directions}
+
+                future_times = [current_time + timedelta(minutes=minute) for minute in range(predict_minutes)]
+                minute_keys = [t.replace(second=0, microsecond=0) for t in future_times]
+
+                # Forget minutes that have already passed
+                oldest = minute_keys[0]
+                for key in [key for key in self.prediction_cache if key[0] < oldest]:
+                    del self.prediction_cache[key]
+
+                # The features depend only on time, so every missing minute is one
+                # row shared by all directions
+                missing = sorted({minute for minute in minute_keys for direction in directions
+                                  if (minute, direction) not in self.prediction_cache})
+                if missing:
+                    try:
+                        preds = np.maximum(0, self.model.predict(self.prepare_feature_matrix(missing))).astype(int)  # Ensure non-negative
+                    except Exception as model_error:
+                        print(f"Prediction error: {str(model_error)}")
+                        preds = np.zeros(len(missing), dtype=int)
+                    for minute, pred in zip(missing, preds.tolist()):
+                        for direction in directions:
+                            self.prediction_cache.setdefault((minute, direction), pred)
+
+                return {
+                    direction: [
+                        {
+                            'time': future_time,
+                            'predicted_vehicles': self.prediction_cache[(minute, direction)],
+                            'congestion_risk': self.calculate_congestion_risk(self.prediction_cache[(minute, direction)])
+                        }
+                        for future_time, minute in zip(future_times, minute_keys)
+                    ]
+                    for direction in directions
+                }
+
         except Exception as e:
             print(f"Traffic prediction error: {str(e)}")
-            return [
-                {
-                    'time': current_time + timedelta(minutes=minute),
-                    'predicted_vehicles': 0,
-                    'congestion_risk': 'Low'
-                }
-                for minute in range(predict_minutes)
-            ]
-        
+            return {direction: self.default_predictions(current_time, predict_minutes)
+                    for direction in directions}
+
     def calculate_congestion_risk(self, predicted_vehicles):
         """Calculate congestion risk level"""
         if predicted_vehicles > 20:
@@ -128,7 +199,10 @@ class TrafficPredictor:
         
     def save_model(self):
         """Save trained model"""
-        joblib.dump(self.model, self.model_path)
+        # Write to a temporary file first so a crash never leaves a truncated model
+        tmp_path = self.model_path + '.tmp'
+        joblib.dump(self.model, tmp_path)
+        os.replace(tmp_path, self.model_path)
         
     def load_model(self):
         """Load existing model if available"""
@@ -136,6 +210,7 @@ class TrafficPredictor:
             try:
                 self.model = joblib.load(self.model_path)
                 self.is_model_trained = True
+                self.prediction_cache.clear()
                 return True
             except Exception as e:
                 print(f"Model loading error: {str(e)}")
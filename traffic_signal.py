@@ -1,35 +1,218 @@
-from signal_phases import SignalPhaseManager, PhaseType, SignalState
+from signal_phases import SignalPhaseManager, SignalState
 import numpy as np
-from datetime import datetime, timedelta
+import heapq
+import itertools
+import threading
+import time
 
-class AdaptiveTrafficSignal:
-    def __init__(self):
+DIRECTION_GROUPS = {'NS': ('N', 'S'), 'EW': ('E', 'W')}
+
+def expand_groups(approach_counts):
+    """Approach counts with NS/EW group counts shared evenly between the two opposing approaches"""
+    counts = {}
+    for name, count in approach_counts.items():
+        for approach in DIRECTION_GROUPS.get(name, (name,)):
+            counts[approach] = counts.get(approach, 0) + count / len(DIRECTION_GROUPS.get(name, (name,)))
+    return counts
+
+def split_directions(ns_count, ew_count):
+    """Approach counts from the camera's NS/EW split"""
+    return expand_groups({'NS': ns_count, 'EW': ew_count})
+
+class SignalControllerRegistry:
+    """Adaptive signal controllers for many intersections in one set of arrays.
+
+    Row i holds intersection i's phase index, phase/transition start times
+    (epoch seconds), per-approach vehicle counts and the per-phase counts
+    derived from them, so tick() evaluates and switches every intersection
+    with a handful of array operations.
+    """
+    def __init__(self, intersection_ids=()):
         self.phase_manager = SignalPhaseManager()
-        self.current_phase = PhaseType.NS
-        self.phase_start_time = datetime.now()
-        self.is_transitioning = False
-        self.transition_start = None
-        
-        # Signal colors for UI
+        self.num_phases = len(self.phase_manager.phase_order)
         self.signal_colors = {
             SignalState.RED: (255, 0, 0),
             SignalState.YELLOW: (255, 255, 0),
             SignalState.GREEN: (0, 255, 0)
         }
-        
-        self.vehicle_counts = {'NS': 0, 'EW': 0}
-        
-    def update_traffic_density(self, direction, count):
-        """Update traffic count for a direction"""
-        self.vehicle_counts[direction] = count
-        
-    def get_current_states(self):
-        """Get current state of all signals"""
-        if self.is_transitioning:
-            states = self.phase_manager.get_transition_states(self.current_phase)
+
+        self.intersection_ids = []
+        self.index_of = {}
+        self.phase = np.zeros(0, dtype=np.int64)
+        self.phase_start = np.zeros(0, dtype=np.float64)
+        self.transition_start = np.zeros(0, dtype=np.float64)
+        self.is_transitioning = np.zeros(0, dtype=bool)
+        self.counts = np.zeros((0, self.num_phases), dtype=np.float32)
+        self.approach_counts = np.zeros((0, len(self.phase_manager.approaches)), dtype=np.float32)
+        # Corridor coordination: common cycle (0 = free running), offset and coordinated phase
+        self.cycle = np.zeros(0, dtype=np.float64)
+        self.offset = np.zeros(0, dtype=np.float64)
+        self.coordinated_phase = np.zeros(0, dtype=np.int64)
+        self.add_intersections(intersection_ids)
+
+    def __len__(self):
+        return len(self.intersection_ids)
+
+    def add_intersections(self, intersection_ids, now=None):
+        """Register new intersections, all starting in the first phase"""
+        new_ids = [i for i in intersection_ids if i not in self.index_of]
+        if not new_ids:
+            return
+        now = time.time() if now is None else now
+        for intersection_id in new_ids:
+            self.index_of[intersection_id] = len(self.intersection_ids)
+            self.intersection_ids.append(intersection_id)
+
+        count = len(new_ids)
+        self.phase = np.concatenate([self.phase, np.zeros(count, dtype=np.int64)])
+        self.phase_start = np.concatenate([self.phase_start, np.full(count, now)])
+        self.transition_start = np.concatenate([self.transition_start, np.zeros(count)])
+        self.is_transitioning = np.concatenate([self.is_transitioning, np.zeros(count, dtype=bool)])
+        self.counts = np.concatenate([self.counts, np.zeros((count, self.num_phases), dtype=np.float32)])
+        self.approach_counts = np.concatenate([
+            self.approach_counts, np.zeros((count, len(self.phase_manager.approaches)), dtype=np.float32)])
+        self.cycle = np.concatenate([self.cycle, np.zeros(count)])
+        self.offset = np.concatenate([self.offset, np.zeros(count)])
+        self.coordinated_phase = np.concatenate([self.coordinated_phase, np.full(count, -1, dtype=np.int64)])
+
+    def update_intersection_density(self, intersection_id, ns_count, ew_count):
+        """Update traffic counts for one intersection"""
+        return self.update_approach_counts(intersection_id, split_directions(ns_count, ew_count))
+
+    def update_approach_counts(self, intersection_id, approach_counts):
+        """Set per-approach counts of one intersection and the phase counts they imply.
+
+        Returns False if the intersection was known and its counts are unchanged.
+        """
+        is_new = intersection_id not in self.index_of
+        if is_new:
+            self.add_intersections([intersection_id])
+        index = self.index_of[intersection_id]
+        manager = self.phase_manager
+        row = self.approach_counts[index].copy()
+        for approach, count in approach_counts.items():
+            if approach in manager.approach_index:
+                row[manager.approach_index[approach]] = count
+        if not is_new and np.array_equal(row, self.approach_counts[index]):
+            return False
+        self.approach_counts[index] = row
+        self.counts[index] = manager.serves_table @ row
+        return True
+
+    def update_counts(self, intersection_id, phase_counts):
+        """Set the vehicle count served by each phase of one intersection.
+
+        Returns False if the intersection was known and its counts are unchanged.
+        """
+        is_new = intersection_id not in self.index_of
+        if is_new:
+            self.add_intersections([intersection_id])
+        index = self.index_of[intersection_id]
+        row = np.asarray(phase_counts, dtype=self.counts.dtype)
+        if not is_new and np.array_equal(row, self.counts[index]):
+            return False
+        self.counts[index] = row
+        return True
+
+    def densities(self):
+        """Share of waiting vehicles served by each intersection's current phase"""
+        rows = np.arange(len(self.intersection_ids))
+        total = self.counts.sum(axis=1)
+        current = self.counts[rows, self.phase]
+        return np.where(total > 0, current / np.maximum(total, 1e-9), 0.5)
+
+    def optimal_durations(self):
+        durations = self.phase_manager.phase_durations(self.phase, self.counts)
+        coordinated = np.flatnonzero(self.cycle > 0)
+        if len(coordinated):
+            durations = np.array(durations, dtype=np.float64)
+            durations[coordinated] = [self.coordinated_duration(i, d)
+                                      for i, d in zip(coordinated.tolist(), durations[coordinated].tolist())]
+        return durations
+
+    def set_coordination(self, intersection_ids, cycle, offsets, phase_index):
+        """Run intersections on a common cycle with phase_index starting at each one's offset (seconds)"""
+        for intersection_id, offset in zip(intersection_ids, offsets):
+            index = self.index_of[intersection_id]
+            self.cycle[index] = cycle
+            self.offset[index] = offset % cycle
+            self.coordinated_phase[index] = phase_index
+
+    def clear_coordination(self, intersection_ids):
+        for intersection_id in intersection_ids:
+            index = self.index_of[intersection_id]
+            self.cycle[index] = 0
+            self.coordinated_phase[index] = -1
+
+    def phase_splits(self, cycle):
+        """Base durations scaled so one pass through the plan fills the cycle"""
+        base, min_duration, _ = self.phase_manager.duration_table.T
+        green_time = cycle - self.num_phases * self.phase_manager.yellow_duration
+        return np.maximum(base * green_time / base.sum(), min_duration)
+
+    def coordinated_duration(self, index, duration):
+        """Adjust one policy duration so a coordinated intersection keeps its offset.
+
+        The phase before the coordinated phase ends so that the coordinated
+        phase starts on the next cycle boundary (offset + k * cycle) that
+        its minimum allows; the other phases are capped at their split so the
+        cycle stays reachable. Returns duration unchanged for free-running
+        intersections.
+        """
+        cycle = float(self.cycle[index])
+        if cycle <= 0:
+            return duration
+        phase_index = int(self.phase[index])
+        _, min_duration, max_duration = self.phase_manager.duration_table[phase_index].tolist()
+        if (phase_index + 1) % self.num_phases != self.coordinated_phase[index]:
+            return min(duration, float(self.phase_splits(cycle)[phase_index]))
+
+        yellow = self.phase_manager.yellow_duration
+        start = float(self.phase_start[index])
+        earliest = start + min_duration + yellow
+        target = earliest + (float(self.offset[index]) - earliest) % cycle
+        return min(target - yellow - start, max_duration)
+
+    def tick(self, now=None):
+        """Advance every intersection; returns (intersection_id, event) for each switch.
+
+        event is 'yellow' when a green phase ends and 'green' when the next
+        phase starts after the yellow interval.
+        """
+        now = time.time() if now is None else now
+
+        end_transition = self.is_transitioning & (now - self.transition_start >= self.phase_manager.yellow_duration)
+        start_transition = ~self.is_transitioning & (now - self.phase_start >= self.optimal_durations())
+
+        self.phase[end_transition] = (self.phase[end_transition] + 1) % self.num_phases
+        self.phase_start[end_transition] = now
+        self.is_transitioning[end_transition] = False
+
+        self.is_transitioning[start_transition] = True
+        self.transition_start[start_transition] = now
+
+        return ([(self.intersection_ids[i], 'yellow') for i in np.flatnonzero(start_transition).tolist()] +
+                [(self.intersection_ids[i], 'green') for i in np.flatnonzero(end_transition).tolist()])
+
+    def signal_states(self):
+        """(N, num_signals) state codes of every signal head at every intersection"""
+        manager = self.phase_manager
+        return np.where(self.is_transitioning[:, None],
+                        manager.transition_table[self.phase], manager.state_table[self.phase])
+
+    def get_phase(self, intersection_id):
+        return self.phase_manager.phase_order[self.phase[self.index_of[intersection_id]]]
+
+    def get_current_states(self, intersection_id):
+        """Get current state of all signals at one intersection"""
+        index = self.index_of[intersection_id]
+        phase_index = int(self.phase[index])
+        if self.is_transitioning[index]:
+            states = self.phase_manager.get_transition_states(phase_index)
         else:
-            states = self.phase_manager.get_phase_states(self.current_phase)
-            
+            states = self.phase_manager.get_phase_states(phase_index)
+        states = self.phase_manager.state_dict(states)
+
         return {
             direction: {
                 'state': state.value,
@@ -37,63 +220,173 @@ class AdaptiveTrafficSignal:
             }
             for direction, state in states.items()
         }
-        
-    def should_switch_phase(self):
-        """Determine if phase should switch based on timing and traffic"""
-        if self.is_transitioning:
-            return (datetime.now() - self.transition_start).total_seconds() >= self.phase_manager.yellow_duration
-            
-        current_time = datetime.now()
-        phase_duration = (current_time - self.phase_start_time).total_seconds()
-        
-        # Calculate traffic density for current and opposite directions
-        current_direction = 'NS' if self.current_phase == PhaseType.NS else 'EW'
-        opposite_direction = 'EW' if self.current_phase == PhaseType.NS else 'NS'
-        
-        current_density = self.vehicle_counts[current_direction]
-        opposite_density = self.vehicle_counts[opposite_direction]
-        
-        # Get optimal duration based on traffic
-        optimal_duration = self.phase_manager.calculate_optimal_duration(
-            self.current_phase,
-            current_density / (current_density + opposite_density) if current_density + opposite_density > 0 else 0.5
-        )
-        
-        return phase_duration >= optimal_duration
-        
-    def switch_phase(self):
-        """Handle phase switching with transition"""
-        if self.is_transitioning:
-            self.is_transitioning = False
-            self.current_phase = PhaseType.EW if self.current_phase == PhaseType.NS else PhaseType.NS
-            self.phase_start_time = datetime.now()
-        else:
-            self.is_transitioning = True
-            self.transition_start = datetime.now()
-        
-        return self.get_current_states()
-    
-    def get_current_state(self):
-        """Get current signal state with timing information"""
-        current_time = datetime.now()
-        phase_duration = (current_time - self.phase_start_time).total_seconds()
-        optimal_time = self.phase_manager.calculate_optimal_duration(
-            self.current_phase,
-            self.vehicle_counts['NS'] / (self.vehicle_counts['NS'] + self.vehicle_counts['EW']) if self.vehicle_counts['NS'] + self.vehicle_counts['EW'] > 0 else 0.5
-        )
-        
+
+    def get_intersection_state(self, intersection_id, now=None):
+        """Get current signal state with timing information for one intersection"""
+        now = time.time() if now is None else now
+        index = self.index_of[intersection_id]
+        phase_index = int(self.phase[index])
+
         return {
-            'current_phase': self.current_phase.value,
-            'time_elapsed': phase_duration,
-            'optimal_time': optimal_time,
-            'vehicle_count': self.vehicle_counts[self.current_phase.value]
+            'current_phase': self.phase_manager.phase_order[phase_index],
+            'transitioning': bool(self.is_transitioning[index]),
+            'time_elapsed': float(now - self.phase_start[index]),
+            'optimal_time': float(self.phase_manager.phase_duration(phase_index, self.counts[index].tolist())),
+            'vehicle_count': float(self.counts[index, phase_index]),
+            'vehicle_counts': {
+                phase: float(count)
+                for phase, count in zip(self.phase_manager.phase_order, self.counts[index].tolist())
+            },
+            'approach_counts': {
+                approach: float(count)
+                for approach, count in zip(self.phase_manager.approaches, self.approach_counts[index].tolist())
+            }
         }
-    
-    def get_intersection_state(self, intersection_id):
-        """Get current state for specific intersection"""
-        return self.get_current_state()
-    
+
+class SignalScheduler:
+    """Event-driven phase switching for a SignalControllerRegistry.
+
+    Each intersection has one live deadline on a heap: the end of its green
+    phase or of its yellow interval. A deadline is only recomputed when new
+    counts change the optimal duration, and switches are applied at the
+    deadline itself rather than at the next polling tick. Superseded heap
+    entries are skipped lazily using a per-intersection version number.
+    """
+    def __init__(self, registry):
+        self.registry = registry
+        self.heap = []
+        self.versions = []
+        self.deadlines = []
+        self.sequence = itertools.count()
+        self.condition = threading.Condition()
+        with self.condition:
+            self._track_new_intersections()
+
+    def _track_new_intersections(self):
+        for index in range(len(self.versions), len(self.registry)):
+            self.versions.append(0)
+            self.deadlines.append(None)
+            self._schedule(index)
+
+    def _deadline_for(self, index):
+        registry = self.registry
+        if registry.is_transitioning[index]:
+            return float(registry.transition_start[index] + registry.phase_manager.yellow_duration)
+        # Scalar path: one intersection at a time is cheaper without array calls
+        duration = registry.phase_manager.phase_duration(int(registry.phase[index]), registry.counts[index].tolist())
+        if registry.cycle[index] > 0:
+            duration = registry.coordinated_duration(index, duration)
+        return float(registry.phase_start[index] + duration)
+
+    def _schedule(self, index):
+        """Push a new deadline for an intersection if it moved; True if it did"""
+        deadline = self._deadline_for(index)
+        if deadline == self.deadlines[index]:
+            return False
+        self.versions[index] += 1
+        self.deadlines[index] = deadline
+        heapq.heappush(self.heap, (deadline, next(self.sequence), index, self.versions[index]))
+        # Drop superseded entries once they clearly outnumber live ones
+        if len(self.heap) > 4 * len(self.versions) + 64:
+            self.heap = [entry for entry in self.heap if entry[3] == self.versions[entry[2]]]
+            heapq.heapify(self.heap)
+        return True
+
     def update_intersection_density(self, intersection_id, ns_count, ew_count):
-        """Update traffic density for a specific intersection"""
-        self.vehicle_counts['NS'] = ns_count
-        self.vehicle_counts['EW'] = ew_count
+        """Update traffic counts for one intersection"""
+        self.update_approach_counts(intersection_id, split_directions(ns_count, ew_count))
+
+    def update_approach_counts(self, intersection_id, approach_counts):
+        """Set one intersection's per-approach counts and move its deadline if needed"""
+        self._update(intersection_id, self.registry.update_approach_counts, approach_counts)
+
+    def update_counts(self, intersection_id, phase_counts):
+        """Set one intersection's per-phase counts and move its deadline if needed"""
+        self._update(intersection_id, self.registry.update_counts, phase_counts)
+
+    def _update(self, intersection_id, update, counts):
+        with self.condition:
+            # Repeated counts cannot move the deadline, so skip the policy evaluation
+            if not update(intersection_id, counts):
+                return
+            self._track_new_intersections()
+            index = self.registry.index_of[intersection_id]
+            # Non-reactive policies keep the duration chosen at phase start
+            if (not self.registry.is_transitioning[index] and self.registry.phase_manager.policy.reactive
+                    and self._schedule(index)):
+                self.condition.notify()
+
+    def set_coordination(self, intersection_ids, cycle, offsets, phase_index):
+        """Apply corridor offsets and move the affected deadlines"""
+        with self.condition:
+            # Corridors may have added intersections to the registry directly
+            self._track_new_intersections()
+            self.registry.set_coordination(intersection_ids, cycle, offsets, phase_index)
+            self._reschedule(intersection_ids)
+
+    def clear_coordination(self, intersection_ids):
+        with self.condition:
+            self._track_new_intersections()
+            self.registry.clear_coordination(intersection_ids)
+            self._reschedule(intersection_ids)
+
+    def _reschedule(self, intersection_ids):
+        moved = False
+        for intersection_id in intersection_ids:
+            index = self.registry.index_of[intersection_id]
+            if not self.registry.is_transitioning[index]:
+                moved = self._schedule(index) or moved
+        if moved:
+            self.condition.notify()
+
+    def next_deadline(self):
+        """Earliest pending switch time in epoch seconds, or None"""
+        with self.condition:
+            return self._peek()
+
+    def _peek(self):
+        while self.heap and self.heap[0][3] != self.versions[self.heap[0][2]]:
+            heapq.heappop(self.heap)
+        return self.heap[0][0] if self.heap else None
+
+    def run_due(self, now=None):
+        """Apply every switch whose deadline is at or before now.
+
+        Returns (intersection_id, event) pairs like SignalControllerRegistry.tick.
+        """
+        now = time.time() if now is None else now
+        registry = self.registry
+        events = []
+        with self.condition:
+            while self._peek() is not None and self.heap[0][0] <= now:
+                deadline, _, index, _ = heapq.heappop(self.heap)
+                if registry.is_transitioning[index]:
+                    registry.phase[index] = (registry.phase[index] + 1) % registry.num_phases
+                    registry.phase_start[index] = deadline
+                    registry.is_transitioning[index] = False
+                    events.append((registry.intersection_ids[index], 'green'))
+                else:
+                    registry.is_transitioning[index] = True
+                    registry.transition_start[index] = deadline
+                    events.append((registry.intersection_ids[index], 'yellow'))
+                self.deadlines[index] = None
+                self._schedule(index)
+        return events
+
+    def run(self, stop_event, on_events):
+        """Sleep until the next deadline, apply it and report; until stop_event is set"""
+        while not stop_event.is_set():
+            with self.condition:
+                deadline = self._peek()
+                timeout = None if deadline is None else deadline - time.time()
+                if timeout is None or timeout > 0:
+                    # Woken early by stop() or by a count update that moved a deadline
+                    self.condition.wait(timeout)
+                    continue
+            events = self.run_due()
+            if events:
+                on_events(events)
+
+    def wake(self):
+        with self.condition:
+            self.condition.notify_all()
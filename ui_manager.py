@@ -4,22 +4,30 @@ from PyQt5.QtGui import *
 import cv2
 import numpy as np  # Fixed import syntax
 from datetime import datetime
-from speed_detector import SpeedDetector
-from traffic_signal import AdaptiveTrafficSignal
-from traffic_predictor import TrafficPredictor  # Add this import
+from config import PREDICTOR_CONFIG, CAMERA_CONFIG
+
+class FrameBridge(QObject):
+    """Carries pipeline output from worker threads to the GUI thread"""
+    frame_ready = pyqtSignal(int, object, object)  # camera index, vehicles, frame
+    camera_status = pyqtSignal(int, bool)  # camera index, is active
+    signal_event = pyqtSignal(object)  # engine 'signal' record
 
 class TrafficUI(QMainWindow):
-    def __init__(self):
+    def __init__(self, engine):
         super().__init__()
+        self.engine = engine
         # Initialize lists and variables first
         self.vehicle_count = {'car': 0, 'motorcycle': 0, 'bus': 0, 'truck': 0}
         self.alerts = []
-        self.cameras = [None] * 4
-        self.video_paths = [None] * 4
-        self.current_frame = [None] * 4
+        self.num_cameras = CAMERA_CONFIG['num_cameras']
+        self.cameras = [None] * self.num_cameras
+        self.video_paths = [None] * self.num_cameras
+        self.current_frame = [None] * self.num_cameras
+        self.camera_active = [False] * self.num_cameras  # Last status reported by the pipeline
         self.video_labels = []  # Initialize before initUI
         self.is_monitoring = False
         self.current_vehicles = []
+        self.camera_vehicles = [[] for _ in range(self.num_cameras)]
         self.record_buttons = []  # Add list for record buttons
         self.is_all_monitoring = False
         self.total_vehicles = 0
@@ -32,17 +40,26 @@ class TrafficUI(QMainWindow):
         self.capture_timer.timeout.connect(self.update_frame)
         self.capture_timer.setInterval(30)
         
-        # Initialize detectors and signals
-        self.speed_detector = SpeedDetector()
-        self.next_object_id = 0
-        self.tracked_vehicles = {}
-        
-        self.traffic_signal = AdaptiveTrafficSignal()
+        # Capture and detection run in a worker pipeline set by the monitoring
+        # system; its frames arrive here only through queued signals
+        self.pipeline = None
+        self.frame_bridge = FrameBridge()
+        self.frame_bridge.frame_ready.connect(self.on_frame_ready, Qt.QueuedConnection)
+        self.frame_bridge.camera_status.connect(self.update_system_status, Qt.QueuedConnection)
+        self.frame_bridge.signal_event.connect(self.on_signal_event, Qt.QueuedConnection)
+        engine.add_consumer(self.forward_engine_record)
+        
+        # Detectors, signals and predictor are owned by the engine; the window
+        # only displays their state
+        self.speed_detector = engine.speed_detector
+        
+        self.signals = engine.signals
+        # Switches are applied by the engine's scheduler; this only refreshes the display
         self.signal_timer = QTimer(self)
-        self.signal_timer.timeout.connect(self.update_traffic_signal)
+        self.signal_timer.timeout.connect(self.update_traffic_signals)
         self.signal_timer.start(1000)
         
-        self.traffic_predictor = TrafficPredictor()
+        self.traffic_predictor = engine.traffic_predictor
         
         self.screen = QApplication.primaryScreen().availableGeometry()
         
@@ -57,7 +74,7 @@ class TrafficUI(QMainWindow):
         self.fps_timer = QTimer(self)
         self.fps_timer.timeout.connect(self.calculate_fps)
         self.fps_timer.start(1000)  # Update FPS every second
-        self.last_frame_times = [datetime.now()] * 4
+        self.last_frame_times = [datetime.now()] * self.num_cameras
         
         # Replace dark theme with light theme
         self.setStyleSheet("""
@@ -175,7 +192,8 @@ class TrafficUI(QMainWindow):
         video_grid = QGridLayout()
         self.camera_status_indicators = []  # Add list for camera status indicators
         self.fps_labels = []  # Add list for fps labels
-        for i in range(4):
+        columns = CAMERA_CONFIG['grid_columns']
+        for i in range(self.num_cameras):
             video_container = QGroupBox(f'Camera {i+1}')
             video_container.setStyleSheet("""
                 QGroupBox {
@@ -211,7 +229,7 @@ class TrafficUI(QMainWindow):
             self.fps_labels.append(fps_label)
             
             video_layout.addLayout(btn_layout)
-            video_grid.addWidget(video_container, i//2, i%2)
+            video_grid.addWidget(video_container, i // columns, i % columns)
             
         left_layout.addLayout(video_grid)
         
@@ -317,7 +335,7 @@ class TrafficUI(QMainWindow):
         signal_layout = QGridLayout()
         
         self.intersection_controls = []
-        for i in range(4):
+        for i in range(self.num_cameras):
             intersection_box = QGroupBox(f'Intersection {i+1}')
             intersection_layout = QVBoxLayout()
             
@@ -339,7 +357,7 @@ class TrafficUI(QMainWindow):
             intersection_layout.addWidget(ew_density)
             
             intersection_box.setLayout(intersection_layout)
-            signal_layout.addWidget(intersection_box, i//2, i%2)
+            signal_layout.addWidget(intersection_box, i // columns, i % columns)
             
             self.intersection_controls.append({
                 'ns_light': ns_light,
@@ -381,6 +399,8 @@ class TrafficUI(QMainWindow):
         self.status_label = QLabel('System Status: Ready')
         self.fps_label = QLabel('FPS: 0')
         self.camera_status = QLabel('Camera Status: Not connected')
+        self.tracker_label = QLabel('Speed Tracks: 0')
+        self.capture_label = QLabel('Capture: -')
         
         self.status_label.setStyleSheet("""
             QLabel {
@@ -393,6 +413,8 @@ class TrafficUI(QMainWindow):
         status_layout.addWidget(self.status_label)
         status_layout.addWidget(self.fps_label)
         status_layout.addWidget(self.camera_status)
+        status_layout.addWidget(self.tracker_label)
+        status_layout.addWidget(self.capture_label)
         status_group.setLayout(status_layout)
         right_layout.addWidget(status_group)
 
@@ -437,11 +459,16 @@ class TrafficUI(QMainWindow):
             q_image = QImage(frame.data, width, height, bytes_per_line, QImage.Format_RGB888)
             self.video_labels[camera_index].setPixmap(QPixmap.fromImage(q_image))
         
-    def update_vehicle_count(self, vehicle_type):
-        self.vehicle_count[vehicle_type] += 1
-        self.vehicle_labels[vehicle_type].setText(f'{vehicle_type.title()}s: {self.vehicle_count[vehicle_type]}')
-        self.total_vehicles += 1
-        self.update_total_density()
+    def update_vehicle_counts(self):
+        """Show stop-line crossings per class; refreshed by the density timer"""
+        totals = self.engine.crossings.class_totals()
+        for class_id, count in zip(self.engine.classes_of_interest.tolist(), totals.tolist()):
+            # Empty until camera workers have reported their detector's names
+            vehicle_type = self.engine.classes.get(class_id, '').lower()
+            if vehicle_type in self.vehicle_labels and self.vehicle_count.get(vehicle_type) != count:
+                self.vehicle_count[vehicle_type] = count
+                self.vehicle_labels[vehicle_type].setText(f'{vehicle_type.title()}s: {count}')
+        self.total_vehicles = int(totals.sum())
         
     def add_alert(self, message):
         timestamp = datetime.now().strftime("%H:%M:%S")
@@ -502,75 +529,27 @@ class TrafficUI(QMainWindow):
             self.video_paths[camera_index] = file_name
             self.add_alert(f"Video loaded for Camera {camera_index+1}: {file_name.split('/')[-1]}")
             
+    def on_frame_ready(self, camera_index, vehicles, frame):
+        """Display a processed frame delivered by the detection pipeline"""
+        try:
+            # The pipeline reuses the frame's buffer once it is consumed
+            self.current_frame[camera_index] = frame.copy()
+            self.update_video_feed(frame, camera_index)
+            self.last_frame_times[camera_index] = datetime.now()
+            
+            self.camera_vehicles[camera_index] = vehicles
+            self.set_current_vehicles([v for cam in self.camera_vehicles for v in cam])
+        finally:
+            # Let the render stage send the next frame for this camera
+            if self.pipeline is not None:
+                self.pipeline.frame_consumed(camera_index)
+            
     def update_frame(self):
-        """Update all active camera feeds"""
-        for i, camera in enumerate(self.cameras):
-            if camera is not None:
-                ret, frame = camera.read()
-                if ret:
-                    # Process frame
-                    frame = cv2.cvtColor(frame, cv2.COLOR_BGR2RGB)
-                    h, w, ch = frame.shape
-                    scale = min(400/w, 300/h)
-                    new_w, new_h = int(w * scale), int(h * scale)
-                    frame = cv2.resize(frame, (new_w, new_h))
-                    
-                    self.current_frame[i] = frame
-                    
-                    # Update video label
-                    bytes_per_line = ch * new_w
-                    qt_image = QImage(frame.data, new_w, new_h, bytes_per_line, QImage.Format_RGB888)
-                    self.video_labels[i].setPixmap(QPixmap.fromImage(qt_image))
-                    
-                    self.last_frame_times[i] = datetime.now()
-                    self.update_system_status(i, True)
-                    
-                    # Update traffic densities for both directions
-                    total_vehicles_in_frame = len(self.current_vehicles)
-                    if total_vehicles_in_frame > 0:
-                        # Split frame into NS and EW regions and count vehicles
-                        frame_height = frame.shape[0]
-                        ns_vehicles = len([v for v in self.current_vehicles if v['bbox'][1] < frame_height/2])
-                        ew_vehicles = total_vehicles_in_frame - ns_vehicles
-                        
-                        # Update traffic signal densities
-                        self.traffic_signal.update_traffic_density('NS', ns_vehicles)
-                        self.traffic_signal.update_traffic_density('EW', ew_vehicles)
-                        
-                        # Add traffic data point for prediction
-                        self.traffic_predictor.add_data_point(
-                            datetime.now(),
-                            total_vehicles_in_frame,
-                            max(ns_vehicles, ew_vehicles),
-                            'NS' if ns_vehicles > ew_vehicles else 'EW'
-                        )
-                        
-                        # Train model periodically
-                        if len(self.traffic_predictor.historical_data['time']) % 100 == 0:
-                            self.traffic_predictor.train_model()
-                else:
-                    # Handle frame read failure
-                    if self.video_paths[i]:  # Reset video if it's a file
-                        camera.set(cv2.CAP_PROP_POS_FRAMES, 0)
-                    self.update_system_status(i, False)
-
-        # Update intersection traffic counts
-        for i, frame in enumerate(self.current_frame):
-            if frame is not None:
-                frame_height = frame.shape[0]
-                vehicles_in_frame = [v for v in self.current_vehicles if v.get('camera_index', 0) == i]
-                
-                ns_count = len([v for v in vehicles_in_frame if v['bbox'][1] < frame_height/2])
-                ew_count = len(vehicles_in_frame) - ns_count
-                
-                self.traffic_signal.update_intersection_density(i+1, ns_count, ew_count)
-        
-        # Update traffic signal displays
-        self.update_traffic_signals()
-        
+        """Refresh camera status indicators"""
         # Update camera status indicators with new colors
         for i, camera in enumerate(self.cameras):
-            if camera is not None and camera.isOpened():
+            # Worker processes open their own sources, so also trust the pipeline's status
+            if camera is not None and (camera.isOpened() or self.camera_active[i]):
                 self.camera_status_indicators[i].setStyleSheet("color: #4CAF50; font-size: 20px;")  # Green
             else:
                 self.camera_status_indicators[i].setStyleSheet("color: #ff4444; font-size: 20px;")  # Red
@@ -581,6 +560,8 @@ class TrafficUI(QMainWindow):
 
     def closeEvent(self, event):
         """Clean up all camera resources"""
+        if self.pipeline is not None:
+            self.pipeline.stop()
         for camera in self.cameras:
             if camera is not None:
                 camera.release()
@@ -635,27 +616,28 @@ class TrafficUI(QMainWindow):
             self.alert_list.insertItem(0, alert_item)
             
     def update_traffic_signal(self):
-        """Update traffic signal display and control"""
+        """Update traffic signal display for every intersection"""
         try:
-            # Get global traffic state
-            state = self.traffic_signal.get_current_state()
-            
-            # Update all intersections
-            for i in range(4):
-                intersection_state = self.traffic_signal.get_intersection_state(i+1)
+            for i in range(self.num_cameras):
+                intersection_state = self.signals.get_intersection_state(i+1)
+                states = self.signals.get_current_states(i+1)
                 controls = self.intersection_controls[i]
                 
-                # Update signal displays
-                if intersection_state['current_phase'] == 'NS':
-                    controls['ns_light'].setText(f'North-South: GREEN ({intersection_state["time_elapsed"]:.1f}s)')
-                    controls['ew_light'].setText('East-West: RED')
-                else:
-                    controls['ns_light'].setText('North-South: RED')
-                    controls['ew_light'].setText(f'East-West: GREEN ({intersection_state["time_elapsed"]:.1f}s)')
+                # Update signal displays from the through-traffic heads
+                elapsed = f"{intersection_state['current_phase']} {intersection_state['time_elapsed']:.1f}s"
+                ns_state = states.get('N', {}).get('state', 'RED')
+                ew_state = states.get('E', {}).get('state', 'RED')
+                controls['ns_light'].setText(f'North-South: {ns_state}' + (f' ({elapsed})' if ns_state != 'RED' else ''))
+                controls['ew_light'].setText(f'East-West: {ew_state}' + (f' ({elapsed})' if ew_state != 'RED' else ''))
+                controls['phase_time'].setText(
+                    f"Phase Time: {intersection_state['time_elapsed']:.1f}s / "
+                    f"{intersection_state['optimal_time']:.1f}s"
+                )
                 
                 # Update traffic counts and density
-                ns_count = intersection_state['vehicle_counts']['NS']
-                ew_count = intersection_state['vehicle_counts']['EW']
+                approach_counts = intersection_state['approach_counts']
+                ns_count = approach_counts.get('N', 0) + approach_counts.get('S', 0)
+                ew_count = approach_counts.get('E', 0) + approach_counts.get('W', 0)
                 total_count = max(1, ns_count + ew_count)
                 
                 # Calculate and update density percentages
@@ -668,11 +650,6 @@ class TrafficUI(QMainWindow):
                 # Update density bar styles
                 controls['ns_density'].setStyleSheet(self.get_congestion_style(ns_density))
                 controls['ew_density'].setStyleSheet(self.get_congestion_style(ew_density))
-                
-                # Check for phase switches
-                if self.traffic_signal.should_switch_phase(i+1):
-                    new_phase = self.traffic_signal.switch_intersection_phase(i+1)
-                    self.add_alert(f"Intersection {i+1}: Switching to {new_phase} phase")
                     
         except Exception as e:
             print(f"Error updating traffic signals: {str(e)}")
@@ -701,10 +678,10 @@ class TrafficUI(QMainWindow):
     def toggle_all_monitoring(self):
         """Toggle monitoring for all cameras"""
         if not self.is_all_monitoring:
-            self.total_vehicles = 0  # Reset vehicle count when starting monitoring
+            self.engine.crossings.reset_totals()  # Reset vehicle count when starting monitoring
             # Start all cameras
             success = True
-            for i in range(4):
+            for i in range(self.num_cameras):
                 try:
                     if self.video_paths[i]:
                         self.cameras[i] = cv2.VideoCapture(self.video_paths[i])
@@ -733,15 +710,24 @@ class TrafficUI(QMainWindow):
                         background-color: #da190b;
                     }
                 """)
+                if self.pipeline is not None:
+                    # Camera slots without a file show device i
+                    self.pipeline.start(self.cameras, [path or str(i) for i, path in enumerate(self.video_paths)])
                 self.capture_timer.start()
                 self.add_alert("Started monitoring all cameras")
         else:
+            # Stop pipeline threads before releasing the cameras they read from
+            if self.pipeline is not None:
+                self.pipeline.stop()
+                
             # Stop all cameras
-            for i in range(4):
+            for i in range(self.num_cameras):
+                self.camera_active[i] = False
                 if self.cameras[i] is not None:
                     self.cameras[i].release()
                     self.cameras[i] = None
                     self.current_frame[i] = None
+                    self.camera_vehicles[i] = []
                     
             self.is_all_monitoring = False
             self.master_start_btn.setText("Start All Cameras")
@@ -761,12 +747,14 @@ class TrafficUI(QMainWindow):
             self.add_alert("Stopped monitoring all cameras")
             
     def update_total_density(self):
-        """Update overall traffic density based on total vehicles"""
+        """Update overall traffic density from the stop-line flow of the last complete minute"""
         try:
+            self.update_vehicle_counts()
             total_active_cameras = sum(1 for camera in self.cameras if camera is not None)
             if total_active_cameras > 0:
-                # Calculate density as percentage of maximum expected vehicles (20 per camera)
-                density_value = min(100, (self.total_vehicles / (20 * total_active_cameras)) * 100)
+                # Density as a percentage of the expected maximum flow (20 vehicles per minute per camera)
+                flow = float(self.engine.crossings.flow_rates(minutes=1).sum())
+                density_value = min(100, (flow / (20 * total_active_cameras)) * 100)
                 
                 # Update progress bar
                 self.density_progress.setValue(int(density_value))
@@ -804,15 +792,17 @@ class TrafficUI(QMainWindow):
             self.prediction_time.setText(f'Last Update: {current_time.strftime("%H:%M:%S")}')
             
             # Get predictions for next 15 minutes
-            ns_predictions = self.traffic_predictor.predict_traffic(current_time, 'NS')
-            ew_predictions = self.traffic_predictor.predict_traffic(current_time, 'EW')
+            predictions = self.traffic_predictor.predict_batch(current_time, ('NS', 'EW'))
+            ns_predictions = predictions['NS']
+            ew_predictions = predictions['EW']
             
             # Clear and update prediction display
             self.prediction_list.clear()
             
             if not self.traffic_predictor.is_model_trained:
                 self.prediction_list.addItem("Training prediction model...")
-                item = QListWidgetItem(f"Collecting data: {len(self.traffic_predictor.historical_data['time'])}/100")
+                history = self.traffic_predictor.history
+                item = QListWidgetItem(f"Collecting data: {history.closed_end() - history.spilled_rows}/{PREDICTOR_CONFIG['min_training_bins']} minutes")
                 item.setForeground(Qt.blue)
                 self.prediction_list.addItem(item)
                 return
@@ -859,46 +849,27 @@ class TrafficUI(QMainWindow):
             print(f"Prediction update error: {str(e)}")
             self.add_alert(f"Error updating predictions: {str(e)}")
             
+    def forward_engine_record(self, record):
+        """Engine consumer; runs on engine threads so it only emits a queued signal"""
+        if record['type'] == 'signal':
+            self.frame_bridge.signal_event.emit(record)
+
+    def on_signal_event(self, record):
+        """Show a phase switch as soon as the scheduler applies it"""
+        if record['event'] == 'green':
+            self.add_alert(f"Intersection {record['intersection']}: Switching to {record['phase']} phase")
+        self.update_traffic_signals()
+
     def update_traffic_signals(self):
-        """Update all traffic signal displays"""
+        """Update all signal displays"""
         try:
-            for i in range(4):
-                intersection_state = self.traffic_signal.get_intersection_state(i+1)
-                controls = self.intersection_controls[i]
-                
-                # Update signal displays with colors
-                if intersection_state['current_phase'] == 'NS':
-                    controls['ns_light'].setText(f'North-South: GREEN ({intersection_state["time_elapsed"]:.1f}s)')
-                    controls['ew_light'].setText('East-West: RED')
-                else:
-                    controls['ns_light'].setText('North-South: RED')
-                    controls['ew_light'].setText(f'East-West: GREEN ({intersection_state["time_elapsed"]:.1f}s)')
-                
-                # Update traffic counts and density
-                ns_count = intersection_state['vehicle_count'] if intersection_state['current_phase'] == 'NS' else 0
-                ew_count = intersection_state['vehicle_count'] if intersection_state['current_phase'] == 'EW' else 0
-                total_count = max(1, ns_count + ew_count)
-                
-                # Calculate and update density percentages
-                ns_density = int((ns_count / total_count) * 100)
-                ew_density = int((ew_count / total_count) * 100)
-                
-                controls['ns_density'].setValue(ns_density)
-                controls['ew_density'].setValue(ew_density)
-                
-                # Update density bar styles
-                controls['ns_density'].setStyleSheet(self.get_congestion_style(ns_density))
-                controls['ew_density'].setStyleSheet(self.get_congestion_style(ew_density))
-                
-                # Check for phase switches
-                if self.traffic_signal.should_switch_phase():
-                    new_phase = self.traffic_signal.switch_phase()
-                    self.add_alert(f"Intersection {i+1}: Switching to {new_phase} phase")
+            self.update_traffic_signal()
                     
-            states = self.traffic_signal.get_current_states()
+            # The signal light panel shows the first intersection
+            states = self.signals.get_current_states(1)
             
             for direction, lights in self.signal_lights.items():
-                state = states[direction]
+                state = states.get(direction, {'state': 'RED'})
                 
                 # Reset all lights
                 lights['red'].setStyleSheet('background-color: gray; border-radius: 15px;')
@@ -912,13 +883,6 @@ class TrafficUI(QMainWindow):
                     lights['yellow'].setStyleSheet('background-color: yellow; border-radius: 15px;')
                 elif state['state'] == 'GREEN':
                     lights['green'].setStyleSheet('background-color: green; border-radius: 15px;')
-                    
-            # Update timing information
-            phase_info = self.traffic_signal.get_current_state()
-            self.phase_time.setText(
-                f"Phase Time: {phase_info['time_elapsed']:.1f}s\n"
-                f"Optimal Time: {phase_info['optimal_time']:.1f}s"
-            )
             
         except Exception as e:
             self.add_alert(f"Error updating signals: {str(e)}")
@@ -926,7 +890,7 @@ class TrafficUI(QMainWindow):
     def calculate_fps(self):
         """Calculate and update FPS for each camera"""
         current_time = datetime.now()
-        for i in range(4):
+        for i in range(self.num_cameras):
             if self.cameras[i] is not None:
                 time_diff = (current_time - self.last_frame_times[i]).total_seconds()
                 if time_diff > 0:
@@ -934,8 +898,30 @@ class TrafficUI(QMainWindow):
                     self.fps_label.setText(f"FPS: {fps:.1f}")
                 self.last_frame_times[i] = current_time
 
+        tracker = self.engine.get_stats()['speed_tracker']
+        self.tracker_label.setText(f"Speed Tracks: {tracker['live_tracks']} "
+                                   f"({tracker['memory_bytes'] / 2**20:.1f} MB)")
+        self.update_capture_status()
+
+    def update_capture_status(self):
+        """Show skipped frames, decode time, staleness and reconnects per source"""
+        if self.pipeline is None:
+            return
+        stats = self.pipeline.get_stats()
+        lines = []
+        for i in range(self.num_cameras):
+            capture = stats.get(f"capture-{i}")
+            if capture is None:
+                continue
+            staleness = capture['staleness_s']
+            lines.append(f"Cam {i + 1}: {capture['decode_ms']:.1f} ms decode, {capture['skipped']} skipped, "
+                         f"{'-' if staleness is None else f'{staleness:.1f} s'} stale, "
+                         f"{capture['reconnects']} reconnects")
+        self.capture_label.setText('\n'.join(lines) or 'Capture: -')
+
     def update_system_status(self, camera_index, is_active):
         """Update system status indicators"""
+        self.camera_active[camera_index] = is_active
         status = "Active" if is_active else "Inactive"
         self.camera_status.setText(f"Camera {camera_index + 1}: {status}")
         self.camera_status.setStyleSheet(f"color: {'green' if is_active else 'red'}")
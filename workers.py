@@ -0,0 +1,249 @@
+import multiprocessing
+import threading
+import time
+from config import CAMERA_CONFIG
+from frame_ring import RingLease
+from pipeline import (CaptureStage, LatestFrameSlots, PipelineStage, is_live_source, open_source, put_latest,
+                      release_item)
+
+def camera_groups(camera_indices, cameras_per_worker=None):
+    """Split cameras into the groups handled by one worker process each"""
+    size = max(cameras_per_worker or CAMERA_CONFIG['cameras_per_worker'], 1)
+    camera_indices = list(camera_indices)
+    return [camera_indices[i:i + size] for i in range(0, len(camera_indices), size)]
+
+def run_camera_worker(camera_indices, sources, rings, results, stop_event, loop_files=True):
+    """Entry point of a camera worker process.
+
+    Decodes its cameras on capture threads and runs their motion gates,
+    detector, trackers and speed history in this process. Frames go to the
+    cameras' shared rings and observations to the results queue, plus a
+    heartbeat with average speeds, the detector's class names and the
+    capture stats every second.
+    """
+    from perception import CameraPerception  # Loads the detector in the worker, not the parent
+
+    def status(camera_index, active):
+        put_latest(results, ('status', camera_index, active))
+
+    slots = LatestFrameSlots()
+    capture_stop = threading.Event()  # The shared stop_event belongs to the supervisor
+    cameras = []
+    captures = []
+    try:
+        for camera_index, source in zip(camera_indices, sources):
+            camera = open_source(source)
+            if not camera.isOpened() and not is_live_source(source):
+                print(f"Worker could not open video source {source}")
+                status(camera_index, False)
+                continue
+            cameras.append(camera)
+            # Live sources that fail to open are retried by the capture thread
+            captures.append(CaptureStage(camera_index, camera if camera.isOpened() else None,
+                                         not is_live_source(source), slots, capture_stop, status, loop_files,
+                                         source=source))
+
+        perception = CameraPerception()
+        for capture in captures:
+            capture.start()
+
+        next_heartbeat = 0.0
+        while not stop_event.is_set():
+            now = time.monotonic()
+            if now >= next_heartbeat:
+                next_heartbeat = now + 1.0
+                put_latest(results, ('heartbeat', list(camera_indices), perception.speed_detector.average_speeds(),
+                                     perception.classes, {capture.name: capture.stats() for capture in captures}))
+
+            items = slots.take_all()
+            if not items:
+                if not any(capture.is_alive() for capture in captures):
+                    break  # Every source ended
+                continue
+            order = sorted(items)
+            frames = [items[i][0] for i in order]
+            try:
+                observations = perception.observe(frames, order, [items[i][1] for i in order],
+                                                  [items[i][2] for i in order])
+                for observation, frame in zip(observations, frames):
+                    camera_index = observation['camera']
+                    slot, sequence = rings[camera_index].write(frame, camera_index,
+                                                               observation['timestamp'].timestamp())
+                    put_latest(results, ('frame', observation, slot, sequence))
+            finally:
+                for item in items.values():
+                    release_item(item)  # The display frame is in the ring now
+    finally:
+        capture_stop.set()
+        for capture in captures:
+            if capture.is_alive():
+                capture.join(timeout=2.0)
+        for camera in cameras:
+            camera.release()
+        for ring in rings.values():
+            ring.close()
+
+class WorkerResultStage(PipelineStage):
+    """Applies observations from camera workers in the engine and emits their frames.
+
+    Frames are read-only views into the cameras' shared rings. An
+    observation whose frame slot was already reused still updates the
+    engine, but has no frame to emit; a RingLease lets the annotate stage
+    drop frames whose slot is reused while it copies them.
+    """
+    def __init__(self, supervisor, observe_fn, results, out_queue, stop_event, status_fn=None, speeds_fn=None):
+        super().__init__("worker-results", stop_event, in_queue=results, out_queue=out_queue)
+        self.supervisor = supervisor
+        self.observe_fn = observe_fn
+        self.status_fn = status_fn
+        self.speeds_fn = speeds_fn
+
+    def process(self, item):
+        kind = item[0]
+        if kind == 'status':
+            if self.status_fn is not None:
+                self.status_fn(item[1], item[2])
+            return None
+        if kind == 'heartbeat':
+            self.supervisor.heartbeat(item[1], item[4])
+            if self.speeds_fn is not None:
+                self.speeds_fn(item[2], item[3])
+            return None
+
+        _, observation, slot, sequence = item
+        camera_index = observation['camera']
+        self.supervisor.heartbeat([camera_index])
+        ring = self.supervisor.rings[camera_index]
+        entry = ring.read(slot, sequence)
+        frame = None
+        if entry is None:
+            self.dropped += 1
+        else:
+            frame = entry[0]
+            frame.flags.writeable = False
+        outputs = self.observe_fn([observation], [frame])
+        lease = RingLease([(ring, slot, sequence)])
+        return [output + (lease,) for output in outputs if output[2] is not None]
+
+class WorkerSupervisor(threading.Thread):
+    """Starts one worker process per camera group and restarts those that crash or hang.
+
+    A worker that exits with an error, or sends nothing for
+    heartbeat_timeout seconds, is restarted after a backoff that doubles
+    with every restart, up to max_restarts times. A worker that exits
+    cleanly (its files ended) is left alone.
+    """
+    def __init__(self, groups, sources, rings, results, loop_files=True, status_fn=None):
+        super().__init__(name="worker-supervisor", daemon=True)
+        self.context = multiprocessing.get_context('spawn')
+        self.stop_event = threading.Event()
+        self.worker_stop = self.context.Event()
+        self.sources = sources
+        self.rings = rings
+        self.results = results
+        self.loop_files = loop_files
+        self.status_fn = status_fn
+        self.lock = threading.Lock()
+        self.workers = [
+            {'cameras': list(group), 'process': None, 'restarts': 0, 'restart_at': None, 'last_seen': 0.0,
+             'finished': False}
+            for group in groups
+        ]
+        self.camera_workers = {camera: worker for worker in self.workers for camera in worker['cameras']}
+        self.capture_stats = {}  # Latest CaptureStage stats reported by the workers, by stage name
+
+    def start_worker(self, worker):
+        cameras = worker['cameras']
+        process = self.context.Process(
+            target=run_camera_worker, name=f"camera-worker-{cameras[0]}", daemon=True,
+            args=(cameras, [self.sources[i] for i in cameras], {i: self.rings[i] for i in cameras},
+                  self.results, self.worker_stop, self.loop_files)
+        )
+        process.start()
+        worker['process'] = process
+        worker['restart_at'] = None
+        # Loading the detector takes a while; allow for it before expecting heartbeats
+        worker['last_seen'] = time.monotonic() + CAMERA_CONFIG['startup_timeout']
+
+    def heartbeat(self, camera_indices, capture_stats=None):
+        """Record that the workers of these cameras are alive, and their capture stats if given"""
+        now = time.monotonic()
+        with self.lock:
+            if capture_stats:
+                self.capture_stats.update(capture_stats)
+            for camera_index in camera_indices:
+                worker = self.camera_workers.get(camera_index)
+                if worker is not None:
+                    worker['last_seen'] = max(worker['last_seen'], now)
+
+    def run(self):
+        with self.lock:
+            for worker in self.workers:
+                self.start_worker(worker)
+        while not self.stop_event.wait(0.5):
+            with self.lock:
+                for worker in self.workers:
+                    self.check_worker(worker, time.monotonic())
+
+    def check_worker(self, worker, now):
+        process = worker['process']
+        if worker['finished']:
+            return
+        if worker['restart_at'] is not None:
+            if now >= worker['restart_at']:
+                self.start_worker(worker)
+            return
+
+        if process.is_alive():
+            if now - worker['last_seen'] < CAMERA_CONFIG['heartbeat_timeout']:
+                return
+            print(f"Camera worker {worker['cameras']} stopped responding")
+            process.terminate()
+            process.join(timeout=2.0)
+        elif process.exitcode == 0:
+            worker['finished'] = True
+            return
+        else:
+            print(f"Camera worker {worker['cameras']} exited with code {process.exitcode}")
+
+        if worker['restarts'] >= CAMERA_CONFIG['max_restarts']:
+            print(f"Camera worker {worker['cameras']} failed too often, giving up")
+            worker['finished'] = True
+            if self.status_fn is not None:
+                for camera_index in worker['cameras']:
+                    self.status_fn(camera_index, False)
+            return
+        backoff = min(CAMERA_CONFIG['restart_backoff'] * 2 ** worker['restarts'], 60.0)
+        worker['restarts'] += 1
+        worker['restart_at'] = now + backoff
+
+    def is_running(self):
+        """True while any worker is alive or waiting to be restarted"""
+        with self.lock:
+            return any(not worker['finished'] for worker in self.workers)
+
+    def stop(self):
+        self.stop_event.set()
+        self.worker_stop.set()
+        if self.is_alive():
+            self.join(timeout=2.0)
+        for worker in self.workers:
+            process = worker['process']
+            if process is None:
+                continue
+            process.join(timeout=5.0)
+            if process.is_alive():
+                process.terminate()
+
+    def get_stats(self):
+        with self.lock:
+            stats = {
+                f"worker-{worker['cameras'][0]}": {
+                    'cameras': worker['cameras'],
+                    'alive': worker['process'] is not None and worker['process'].is_alive(),
+                    'restarts': worker['restarts']
+                }
+                for worker in self.workers
+            }
+            stats.update(self.capture_stats)
+            return stats